@@ -47,6 +47,8 @@ LOCAL_APPS = [
 INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 
 MIDDLEWARE = [
+    'quiz.metrics.RequestMetricsMiddleware',  # Métriques par vue, servies sur /metrics/
+    'quiz.routers.ReadYourWritesMiddleware',  # Lectures sur la réplique jusqu'à la première écriture
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',  # Pour le multilingue
@@ -80,13 +82,61 @@ WSGI_APPLICATION = 'elearning_platform.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+# SQLite sur un seul serveur : journal WAL (les lectures ne bloquent pas
+# l'écriture), transactions IMMEDIATE (le verrou d'écriture est pris au
+# début de la transaction, avec attente) et connexions persistantes.
+# Les écritures du passage des quiz sont en plus rejouées si la base reste
+# verrouillée (voir quiz/locking.py et QUIZ_SETTINGS['LOCK_RETRIES']).
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
         'OPTIONS': {
-            'init_command': "PRAGMA foreign_keys=1",
+            'init_command': (
+                "PRAGMA foreign_keys=1;"
+                "PRAGMA journal_mode=WAL;"
+                "PRAGMA synchronous=NORMAL;"  # Sûr en mode WAL
+                "PRAGMA cache_size=-20000;"  # 20 Mo de cache par connexion
+                "PRAGMA mmap_size=268435456;"  # 256 Mo lus via mmap
+                "PRAGMA temp_store=MEMORY;"
+            ),
+            'transaction_mode': 'IMMEDIATE',
+            # Attente maximale du verrou d'écriture, en secondes
+            'timeout': config('DB_TIMEOUT', default=20, cast=int),
         },
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=600, cast=int),
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+# Réplique en lecture du catalogue (catégories, quiz, questions) : une copie
+# du fichier SQLite, mise à jour par la commande snapshot_replica.
+# Les sessions, examens et scores restent sur la base principale.
+DB_REPLICA = config('DB_REPLICA', default='')
+if DB_REPLICA:
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': DB_REPLICA,
+        'OPTIONS': {
+            'init_command': (
+                "PRAGMA query_only=1;"
+                "PRAGMA cache_size=-20000;"
+                "PRAGMA mmap_size=268435456;"
+            ),
+        },
+        # Une connexion par requête, pour lire la dernière copie
+        'CONN_MAX_AGE': 0,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['quiz.routers.CatalogRouter']
+
+# Cache des pages du catalogue, propre à chaque processus. Un cache partagé
+# (Redis, Memcached) peut le remplacer sans autre changement.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'quiz-catalog',
     }
 }
 
@@ -147,6 +197,18 @@ QUIZ_SETTINGS = {
     'MAX_ATTEMPTS': 3,
     'SHOW_CORRECT_ANSWERS': True,
     'SHOW_EXPLANATIONS': True,
+    'SNAPSHOT_CACHE_SIZE': 64,  # Nombre de quiz compilés gardés en mémoire
+    'ANON_MAX_QUESTIONS': 200,  # Questions au plus par quiz anonyme en session (au-delà : coupé, avec un avertissement)
+    'ASYNC_VIEWS': False,  # Vues asynchrones (liste, détail, passage du quiz) sous ASGI
+    'MARKING_PAGE_SIZE': 50,  # Examens terminés par page dans la liste de correction
+    'LEADERBOARD_SIZE': 10,  # Meilleurs scores affichés sur la page d'un quiz
+    'LOCK_RETRIES': 5,  # Nouvelles tentatives d'une écriture sur base verrouillée
+    'LOCK_RETRY_DELAY': 0.05,  # Attente avant la première, doublée ensuite (secondes)
+    'SERIALIZE_WRITES': False,  # Écritures des quiz une à une dans chaque processus (nombreux threads)
+    'READ_REPLICA': 'replica' if DB_REPLICA else None,  # Base des lectures du catalogue
+    'CATALOG_CACHE_TIMEOUT': 3600,  # Durée en cache des pages du catalogue (secondes)
+    'FIGURE_WIDTHS': (320, 640, 1024),  # Largeurs des copies des illustrations (pixels)
+    'FIGURE_QUALITY': 80,  # Qualité WebP et JPEG des copies
 }
 
 # Login/Logout URLs
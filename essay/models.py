@@ -11,10 +11,14 @@ class Essay_Question(Question):
     def check_if_correct(self, guess):
         return False
 
-    def get_answers(self):
+    def add_attempt(self, guess, is_correct, sitting=None):
+        # Essays are marked by hand, so they have no item statistics.
+        pass
+
+    def get_answers(self, seed=None):
         return False
 
-    def get_answers_list(self):
+    def get_answers_list(self, seed=None):
         return False
 
     def answer_choice_to_string(self, guess):
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('multichoice', '0002_alter_answer_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='answer',
+            name='chosen',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of times this answer was given.', verbose_name='Chosen'),
+        ),
+    ]
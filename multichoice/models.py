@@ -1,7 +1,9 @@
 from django.db import models
+from django.db.models import F
 # Supprimé: from django.utils.encoding import python_2_unicode_compatible (obsolète dans Django 4.0+)
 from django.utils.translation import gettext_lazy as _
 
+from quiz import sampling
 from quiz.models import Question
 
 
@@ -18,32 +20,55 @@ class MCQuestion(Question):
                     "to the user"),
         verbose_name=_("Answer Order"))
 
+    prefetch_lookups = ('answer_set',)
+
+    def _get_answer(self, guess):
+        """
+        Looks the guess up in the prefetched answers when they are
+        available (e.g. from a quiz snapshot), otherwise in the database.
+        """
+        if 'answer_set' in getattr(self, '_prefetched_objects_cache', {}):
+            for answer in self.answer_set.all():
+                if str(answer.id) == str(guess):
+                    return answer
+            raise Answer.DoesNotExist
+        return Answer.objects.get(id=guess)
+
     def check_if_correct(self, guess):
-        answer = Answer.objects.get(id=guess)
+        answer = self._get_answer(guess)
 
         if answer.correct is True:
             return True
         else:
             return False
 
-    def order_answers(self, queryset):
+    def order_answers(self, answers, seed=None):
+        """
+        Random orders are derived from the seed of the sitting, so they
+        stay the same for the whole sitting. The answers are shuffled from
+        their id order, as the database returns them in no set order.
+        """
+        answers = list(answers)
         if self.answer_order == 'content':
-            return queryset.order_by('content')
+            return sorted(answers, key=lambda answer: answer.content)
         if self.answer_order == 'random':
-            return queryset.order_by('?')
-        if self.answer_order == 'none':
-            return queryset.order_by()
-        return queryset
+            return sampling.shuffle(
+                sorted(answers, key=lambda answer: answer.id), seed, self.id)
+        return answers
 
-    def get_answers(self):
-        return self.order_answers(Answer.objects.filter(question=self))
+    def get_answers(self, seed=None):
+        return self.order_answers(self.answer_set.all(), seed)
 
-    def get_answers_list(self):
+    def get_answers_list(self, seed=None):
         return [(answer.id, answer.content) for answer in
-                self.order_answers(Answer.objects.filter(question=self))]
+                self.get_answers(seed)]
 
     def answer_choice_to_string(self, guess):
-        return Answer.objects.get(id=guess).content
+        return self._get_answer(guess).content
+
+    def count_choice(self, guess):
+        Answer.objects.filter(id=guess, question_id=self.pk)\
+                      .update(chosen=F('chosen') + 1)
 
     class Meta:
         verbose_name = _("Multiple Choice Question")
@@ -65,6 +90,11 @@ class Answer(models.Model):
                                  help_text=_("Is this a correct answer?"),
                                  verbose_name=_("Correct"))
 
+    chosen = models.PositiveIntegerField(
+        default=0, editable=False,
+        help_text=_("Number of times this answer was given."),
+        verbose_name=_("Chosen"))
+
     def __str__(self):
         return self.content
 
@@ -1,8 +1,10 @@
+from io import StringIO
+
 from django.core.files.base import ContentFile
 from django.db.models.fields.files import ImageFieldFile
 from django.test import TestCase
-from django.utils.six import StringIO
 
+from quiz.models import Quiz
 from .models import MCQuestion, Answer
 
 
@@ -34,7 +36,7 @@ class TestMCQuestionModel(TestCase):
         self.assertEqual(correct_a.content, "European")
         self.assertEqual(self.q.check_if_correct(123), False)
         self.assertEqual(self.q.check_if_correct(456), True)
-        self.assertEqual(answers_by_method.count(), 2)
+        self.assertEqual(len(answers_by_method), 2)
         self.assertEqual(self.q.answer_choice_to_string(123),
                          self.answer1.content)
 
@@ -50,3 +52,29 @@ class TestMCQuestionModel(TestCase):
 
     def test_answer_to_string(self):
         self.assertEqual('African', self.q.answer_choice_to_string(123))
+
+
+class TestMCAnswerOrder(TestCase):
+    def setUp(self):
+        self.quiz = Quiz.objects.create(title='q', description='d', url='q')
+        self.q = MCQuestion.objects.create(content='squawk', quiz=self.quiz,
+                                           answer_order='random')
+        for content in 'abcdef':
+            Answer.objects.create(question=self.q, content=content,
+                                  correct=content == 'a')
+
+    def test_random_order_follows_seed(self):
+        answers = self.q.get_answers(seed=7)
+
+        self.assertEqual(self.q.get_answers(seed=7), answers)
+        self.assertEqual(sorted(answer.content for answer in answers),
+                         list('abcdef'))
+        self.assertEqual([choice[0] for choice
+                          in self.q.get_answers_list(seed=7)],
+                         [answer.id for answer in answers])
+
+    def test_random_order_ignores_row_order(self):
+        answers = list(self.q.answer_set.all())
+
+        self.assertEqual(self.q.order_answers(reversed(answers), seed=7),
+                         self.q.order_answers(answers, seed=7))
@@ -1,9 +1,14 @@
 from django import forms
 from django.contrib import admin
-from django.contrib.admin.widgets import FilteredSelectMultiple
+from django.contrib.admin.widgets import AutocompleteSelectMultiple
+from django.core.exceptions import PermissionDenied
+from django.db.models import Q
+from django.http import JsonResponse
+from django.urls import path, reverse
 from django.utils.translation import gettext_lazy as _
 
-from .models import Quiz, Category, Progress, Question, SubCategory
+from .models import Quiz, Category, CategoryScore, LeaderboardEntry, \
+    Progress, Question, SubCategory
 from multichoice.models import MCQuestion, Answer
 from true_false.models import TF_Question
 from essay.models import Essay_Question
@@ -11,38 +16,89 @@ from essay.models import Essay_Question
 
 class AnswerInline(admin.TabularInline):
     model = Answer
+    readonly_fields = ('chosen', )
 
 
-class QuizAdminForm(forms.ModelForm):
+class QuestionPickerWidget(AutocompleteSelectMultiple):
     """
-    Below is from
-    http://stackoverflow.com/questions/11657682/
-    django-admin-interface-using-horizontal-filter-with-
-    inline-manytomany-field-in-ta
+    The select2 widget of the admin autocomplete fields, fed by
+    QuizAdmin.question_search_view. Only the selected questions are
+    rendered with the page, the others are searched on demand.
     """
 
+    def __init__(self, attrs=None):
+        super(QuestionPickerWidget, self).__init__(None, admin.site, attrs)
+
+    def get_url(self):
+        return reverse('admin:quiz_quiz_question_search')
+
+    def build_attrs(self, base_attrs, extra_attrs=None):
+        attrs = forms.SelectMultiple.build_attrs(self, base_attrs,
+                                                 extra_attrs=extra_attrs)
+        attrs.update({
+            'data-ajax--cache': 'true',
+            'data-ajax--delay': 250,
+            'data-ajax--type': 'GET',
+            'data-ajax--url': self.get_url(),
+            'data-theme': 'admin-autocomplete',
+            'data-allow-clear': 'true',
+            'data-placeholder': '',
+            'lang': self.i18n_name,
+            'class': (attrs.get('class', '') + ' admin-autocomplete').strip(),
+        })
+        return attrs
+
+    def optgroups(self, name, value, attr=None):
+        selected = [pk for pk in value if pk not in ('', None)]
+        field = self.choices.field
+        options = [
+            self.create_option(name, question.pk,
+                               field.label_from_instance(question), True,
+                               index)
+            for index, question
+            in enumerate(field.queryset.filter(pk__in=selected))]
+        return [(None, options, 0)]
+
+
+class QuizAdminForm(forms.ModelForm):
+
     class Meta:
         model = Quiz
         exclude = []
 
     questions = forms.ModelMultipleChoiceField(
-        queryset=Question.objects.all().select_subclasses(),
+        queryset=Question.objects.all(),
         required=False,
         label=_("Questions"),
-        widget=FilteredSelectMultiple(
-            verbose_name=_("Questions"),
-            is_stacked=False))
+        help_text=_("Search by question, category or sub-category. "
+                    "Adding a question moves it from its current quiz."),
+        widget=QuestionPickerWidget())
 
     def __init__(self, *args, **kwargs):
         super(QuizAdminForm, self).__init__(*args, **kwargs)
         if self.instance.pk:
-            self.fields['questions'].initial = \
-                self.instance.question_set.all().select_subclasses()
+            self.fields['questions'].initial = list(
+                self.instance.question_set.values_list('pk', flat=True))
 
     def save(self, commit=True):
         quiz = super(QuizAdminForm, self).save(commit=False)
         quiz.save()
-        quiz.question_set.set(self.cleaned_data['questions'])
+
+        # A question always belongs to a quiz, so questions can only be
+        # moved in. Only the questions not already in the quiz are
+        # updated, and since update() sends no signals the affected
+        # quizzes are refreshed here.
+        added = [question for question in self.cleaned_data['questions']
+                 if question.quiz_id != quiz.pk]
+        if added:
+            Question.objects.filter(pk__in=[question.pk for question in added])\
+                            .update(quiz=quiz)
+            quiz_ids = [quiz.pk] + [question.quiz_id for question in added]
+            Quiz.objects.bump_version(quiz_ids)
+            Quiz.objects.refresh_question_counts(quiz_ids)
+            quiz.refresh_from_db(fields=['version', 'question_count',
+                                         'question_type_counts'])
+
         self.save_m2m()
         return quiz
 
@@ -54,6 +110,56 @@ class QuizAdmin(admin.ModelAdmin):
     list_filter = ('category',)
     search_fields = ('description', 'category', )
 
+    question_search_page_size = 20
+
+    def get_urls(self):
+        return [
+            path('questions/search/',
+                 self.admin_site.admin_view(self.question_search_view),
+                 name='quiz_quiz_question_search'),
+        ] + super(QuizAdmin, self).get_urls()
+
+    def question_search_view(self, request):
+        """
+        Pages of questions matching the search term, in the JSON format
+        select2 expects.
+        """
+        if not (self.has_add_permission(request) or
+                self.has_change_permission(request)):
+            raise PermissionDenied
+
+        queryset = Question.objects.select_related('category',
+                                                   'sub_category')\
+                                   .order_by('pk')
+        term = request.GET.get('term', '').strip()
+        if term:
+            queryset = queryset.filter(
+                Q(content__icontains=term) |
+                Q(category__category__icontains=term) |
+                Q(sub_category__sub_category__icontains=term))
+
+        try:
+            page = max(int(request.GET.get('page', 1)), 1)
+        except ValueError:
+            page = 1
+        # One extra row tells whether there is a next page, without
+        # counting every match.
+        size = self.question_search_page_size
+        questions = list(queryset[(page - 1) * size:page * size + 1])
+
+        return JsonResponse({
+            'results': [{'id': str(question.pk),
+                         'text': question_label(question)}
+                        for question in questions[:size]],
+            'pagination': {'more': len(questions) > size},
+        })
+
+
+def question_label(question):
+    if question.category is None:
+        return str(question)
+    return '%s (%s)' % (question, question.category)
+
 
 class CategoryAdmin(admin.ModelAdmin):
     search_fields = ('category', )
@@ -81,7 +187,21 @@ class ProgressAdmin(admin.ModelAdmin):
     to do:
             create a user section
     """
-    search_fields = ('user', 'score', )
+    search_fields = ('user__username', )
+
+
+class CategoryScoreAdmin(admin.ModelAdmin):
+    list_display = ('user', 'category', 'score', 'possible', )
+    list_filter = ('category',)
+    list_select_related = ('user', 'category', )
+    search_fields = ('user__username', )
+
+
+class LeaderboardEntryAdmin(admin.ModelAdmin):
+    list_display = ('quiz', 'user', 'score', 'percent', 'achieved', )
+    list_filter = ('quiz',)
+    list_select_related = ('quiz', 'user', )
+    search_fields = ('user__username', )
 
 
 class TFQuestionAdmin(admin.ModelAdmin):
@@ -107,5 +227,7 @@ admin.site.register(Category, CategoryAdmin)
 admin.site.register(SubCategory, SubCategoryAdmin)
 admin.site.register(MCQuestion, MCQuestionAdmin)
 admin.site.register(Progress, ProgressAdmin)
+admin.site.register(CategoryScore, CategoryScoreAdmin)
+admin.site.register(LeaderboardEntry, LeaderboardEntryAdmin)
 admin.site.register(TF_Question, TFQuestionAdmin)
 admin.site.register(Essay_Question, EssayQuestionAdmin)
\ No newline at end of file
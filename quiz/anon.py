@@ -0,0 +1,148 @@
+"""
+Session state of quizzes taken by non signed-in users.
+
+Each quiz in progress is kept under a single session key as a small
+record: the question order, a cursor, the score, a bitset of the
+positions answered incorrectly and the seed of the answer order.
+
+To keep the session row small, a sitting holds at most ANON_MAX_QUESTIONS
+questions. Quizzes drawing more per sitting are cut short for non
+signed-in users, who are then scored on the questions they were asked; a
+warning is logged, since such quizzes should set max_questions.
+"""
+import logging
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_QUESTIONS = 200
+
+
+def max_questions():
+    """
+    Upper bound on the number of questions stored in one anonymous sitting,
+    which keeps the size of the session row bounded.
+    """
+    quiz_settings = getattr(settings, 'QUIZ_SETTINGS', {})
+    return quiz_settings.get('ANON_MAX_QUESTIONS', DEFAULT_MAX_QUESTIONS)
+
+
+class AnonSitting(object):
+    """
+    Progress of a non signed-in user through a quiz.
+
+    Changes are kept on the instance and written to the session by save(),
+    once per request.
+    """
+
+    def __init__(self, quiz_id, order, cursor=0, score=0, incorrect=0,
+                 seed=None):
+        self.quiz_id = quiz_id
+        self.order = list(order)
+        self.cursor = cursor
+        self.score = score
+        self.incorrect = incorrect
+        self.seed = seed
+        self.finished = False
+        self.changed = True
+
+    @classmethod
+    def start(cls, quiz_id, order, seed=None):
+        """
+        Returns a new sitting over the questions in order, cut to
+        max_questions().
+        """
+        order = list(order)
+        limit = max_questions()
+        if len(order) > limit:
+            logger.warning("Quiz %d draws %d questions per sitting: "
+                           "anonymous sittings only get the first %d "
+                           "(ANON_MAX_QUESTIONS).", quiz_id, len(order),
+                           limit)
+            order = order[:limit]
+        return cls(quiz_id, order, seed=seed)
+
+    @staticmethod
+    def session_key(quiz_id):
+        return 'quiz_%d' % quiz_id
+
+    @classmethod
+    def load(cls, session, quiz_id):
+        """
+        Returns the sitting stored in the session, or None.
+        """
+        record = session.get(cls.session_key(quiz_id))
+        if not record:
+            return None
+
+        sitting = cls(quiz_id, record['o'], record['c'], record['s'],
+                      record['x'], record.get('r'))
+        sitting.changed = False
+        return sitting
+
+    @classmethod
+    async def aload(cls, session, quiz_id):
+        record = await session.aget(cls.session_key(quiz_id))
+        if not record:
+            return None
+
+        sitting = cls(quiz_id, record['o'], record['c'], record['s'],
+                      record['x'], record.get('r'))
+        sitting.changed = False
+        return sitting
+
+    def save(self, session):
+        if self.finished:
+            session.pop(self.session_key(self.quiz_id), None)
+        elif self.changed:
+            session[self.session_key(self.quiz_id)] = {
+                'o': self.order, 'c': self.cursor,
+                's': self.score, 'x': self.incorrect, 'r': self.seed}
+        self.changed = False
+
+    async def asave(self, session):
+        if self.finished:
+            await session.apop(self.session_key(self.quiz_id), None)
+        elif self.changed:
+            await session.aset(self.session_key(self.quiz_id), {
+                'o': self.order, 'c': self.cursor,
+                's': self.score, 'x': self.incorrect, 'r': self.seed})
+        self.changed = False
+
+    @property
+    def answer_seed(self):
+        return self.seed
+
+    @property
+    def next_question_id(self):
+        if self.is_complete:
+            return None
+        return self.order[self.cursor]
+
+    @property
+    def is_complete(self):
+        return self.cursor >= len(self.order)
+
+    def progress(self):
+        return self.cursor, len(self.order)
+
+    def record_answer(self, is_correct):
+        """
+        Scores the current question and moves on to the next one.
+        """
+        if is_correct:
+            self.score += 1
+        else:
+            self.incorrect |= 1 << self.cursor
+        self.cursor += 1
+        self.changed = True
+
+    @property
+    def incorrect_questions(self):
+        return [question_id for position, question_id
+                in enumerate(self.order) if self.incorrect >> position & 1]
+
+    def finish(self):
+        self.finished = True
@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+from django.utils.translation import gettext_lazy as _
+
+
+class QuizConfig(AppConfig):
+    name = 'quiz'
+    verbose_name = _("Quiz")
+
+    def ready(self):
+        from . import metrics, signals  # noqa: F401
+        signals.connect_question_receivers()
@@ -0,0 +1,182 @@
+"""
+Async versions of the views students hit during an exam: the quiz list,
+the quiz start page and the question page.
+
+They render the same templates as the views in quiz.views, but read the
+catalog with the async ORM so that a request waiting on the database does
+not hold a worker thread. Writes to a signed-in user's sitting still run
+in a thread, since they happen inside a transaction.
+"""
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.http import Http404
+from django.template.response import TemplateResponse
+from django.utils.translation import gettext as _
+
+from .anon import AnonSitting
+from .locking import retry_on_lock
+from .models import CatalogVersion, LeaderboardEntry, Quiz, Sitting
+from .views import QuizListView, QuizDetailView, QuizTake, \
+    cached_page_response
+
+
+async def aget_quiz(**kwargs):
+    try:
+        return await Quiz.objects.select_related('category').aget(**kwargs)
+    except Quiz.DoesNotExist:
+        raise Http404(_("No quiz found matching the query"))
+
+
+async def acheck_draft(request, quiz):
+    """
+    Returns the user of the request, refusing drafts to users who may not
+    edit quizzes.
+    """
+    user = await request.auser()
+    # request.user is lazy and would query the database when the template
+    # is rendered, so it is given the user that was just loaded.
+    request.user = user
+    if quiz.draft and not await user.ahas_perm('quiz.change_quiz'):
+        raise PermissionDenied
+    return user
+
+
+class AsyncQuizListView(QuizListView):
+    context_object_name = 'quiz_list'
+    template_name = 'quiz/quiz_list.html'
+
+    async def get(self, request, *args, **kwargs):
+        validators = self.get_validators(await self.aget_stamps(),
+                                         request.user)
+        response = self.not_modified(validators)
+        if response is None:
+            response = await self.aget_page(request, *args, **kwargs)
+        return self.add_validators(response, validators)
+
+    async def aget_page(self, request, *args, **kwargs):
+        key = self.get_page_cache_key(await CatalogVersion.objects.acurrent())
+        page = await cache.aget(key)
+        if page is not None:
+            return cached_page_response(page)
+
+        queryset = self.get_queryset().select_related('category')
+        self.object_list = [quiz async for quiz in queryset]
+        context = self.get_context_data()
+        response = self.render_to_response(context)
+        self.store_page(key, response)
+        return response
+
+
+class AsyncQuizDetailView(QuizDetailView):
+
+    async def get(self, request, *args, **kwargs):
+        validators = self.get_validators(await self.aget_stamps(),
+                                         await request.auser())
+        response = self.not_modified(validators)
+        if response is None:
+            response = await self.aget_page(request, *args, **kwargs)
+        return self.add_validators(response, validators)
+
+    async def aget_page(self, request, *args, **kwargs):
+        self.object = await aget_quiz(url=self.kwargs[self.slug_url_kwarg])
+        user = await acheck_draft(request, self.object)
+
+        context = self.get_context_data(
+            object=self.object,
+            catalog_stamp=await CatalogVersion.objects.acurrent(),
+            **await self.aget_leaderboard(user))
+        return self.render_to_response(context)
+
+    async def aget_leaderboard(self, user):
+        return {
+            'leaderboard': await LeaderboardEntry.objects.atop(
+                self.object, self.get_leaderboard_size()),
+            'leaderboard_entry': await LeaderboardEntry.objects.auser_entry(
+                self.object, user),
+        }
+
+
+class AsyncQuizTake(QuizTake):
+    """
+    The question page. Questions come from the quiz snapshot, so once it
+    is cached a request only touches the sitting (or the session) and the
+    category score of the answer.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.quiz = await aget_quiz(url=self.kwargs['quiz_name'])
+        user = await acheck_draft(request, self.quiz)
+        self.logged_in_user = user.is_authenticated
+
+        if self.logged_in_user:
+            self.sitting = await Sitting.objects.auser_sitting(user,
+                                                               self.quiz)
+        else:
+            self.sitting = await self.aanon_load_sitting()
+
+        if self.sitting is False:
+            return TemplateResponse(request,
+                                    self.single_complete_template_name)
+
+        handler = getattr(self, request.method.lower(),
+                          self.http_method_not_allowed)
+        response = await handler(request, *args, **kwargs)
+
+        if not self.logged_in_user:
+            await self.sitting.asave(request.session)
+
+        return response
+
+    async def get(self, request, *args, **kwargs):
+        await self.aload_question()
+        return self.render_to_response(self.get_context_data())
+
+    async def post(self, request, *args, **kwargs):
+        await self.aload_question()
+        form = self.get_form()
+        if not form.is_valid():
+            return self.form_invalid(form)
+
+        if self.logged_in_user:
+            response = await sync_to_async(self.record_user_answer)(form)
+        else:
+            response = await self.arecord_anon_answer(form)
+
+        if response is not None:
+            return response
+
+        self.request.POST = {}
+
+        return await self.get(request, *args, **kwargs)
+
+    async def put(self, *args, **kwargs):
+        return await self.post(*args, **kwargs)
+
+    def get_form(self, *args, **kwargs):
+        # The question is loaded by aload_question().
+        return self.get_question_form()
+
+    async def aload_question(self):
+        self.question = await self.quiz.aget_question(
+            self.sitting.next_question_id)
+        self.progress = self.sitting.progress()
+
+    async def aanon_load_sitting(self):
+        if self.quiz.single_attempt is True:
+            return False
+
+        sitting = await AnonSitting.aload(self.request.session, self.quiz.id)
+        if sitting is None:
+            snapshot = await self.quiz.aget_snapshot()
+            sitting = self.new_anon_quiz_session(snapshot.question_ids)
+        return sitting
+
+    async def arecord_anon_answer(self, form):
+        # The session was loaded by aanon_load_sitting(), so the session
+        # score is read and written without a query.
+        is_correct = self.form_valid_anon(form)
+        await sync_to_async(retry_on_lock)(
+            self.save_anon_attempt, form.cleaned_data['answers'], is_correct)
+        if self.sitting.is_complete:
+            return await sync_to_async(self.final_result_anon)()
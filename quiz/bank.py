@@ -0,0 +1,292 @@
+"""
+Export and import of question banks as line-delimited JSON.
+
+Each line holds one record, with a "type" of "category", "sub_category",
+"quiz" or "question". Categories and quizzes are referred to by name and
+url, so a bank can be loaded into another database. Question records
+carry the fields of their own type, and the answers of multiple choice
+questions. Their sub-category is given with its own category
+("sub_category_category"), which may differ from the question's.
+Figures are exported by file name only.
+
+Both directions stream: the export reads the tables in chunks and the
+import writes questions in batches, so memory use does not depend on the
+size of the bank. Bulk inserts send no signals, so the import bumps the
+versions and refreshes the question counts of the quizzes it touched once
+it is done (see quiz.signals).
+"""
+import json
+
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.db import connections, router, transaction
+
+from .models import Category, Question, Quiz, SubCategory
+from .signals import batched_question_changes
+from multichoice.models import Answer, MCQuestion
+
+
+QUIZ_FIELDS = [field.name for field in Quiz._meta.concrete_fields
+               if field.editable and not field.primary_key and
+               field.name != 'category']
+
+QUESTION_FIELDS = ['content', 'explanation']
+
+
+def question_types():
+    """
+    Returns the question models by their question_type label.
+    """
+    return {question_class._meta.label_lower: question_class
+            for question_class in Question.__subclasses__()}
+
+
+def type_fields(question_class):
+    return [field.name for field in question_class._meta.local_concrete_fields
+            if not field.primary_key]
+
+
+def export_bank(quizzes, chunk_size=2000):
+    """
+    Yields the records of the given quizzes, preceded by every category
+    and sub-category.
+    """
+    for category in Category.objects.order_by('pk')\
+                                    .iterator(chunk_size=chunk_size):
+        yield {'type': 'category', 'category': category.category}
+
+    for sub_category in SubCategory.objects.select_related('category')\
+                                           .order_by('pk')\
+                                           .iterator(chunk_size=chunk_size):
+        yield {'type': 'sub_category',
+               'sub_category': sub_category.sub_category,
+               'category': _name(sub_category.category)}
+
+    for quiz in quizzes.select_related('category').order_by('pk')\
+                       .iterator(chunk_size=chunk_size):
+        record = {'type': 'quiz', 'category': _name(quiz.category)}
+        record.update((name, getattr(quiz, name)) for name in QUIZ_FIELDS)
+        yield record
+
+    # In the order of their ids, which the import keeps: the questions of
+    # a quiz that is not in random order are asked in that order.
+    questions = Question.objects.filter(quiz__in=quizzes).order_by('pk')
+    last_pk = 0
+    while True:
+        chunk = questions.filter(pk__gt=last_pk)[:chunk_size]\
+                         .typed('quiz', 'category', 'sub_category__category')
+        if not chunk:
+            break
+        last_pk = chunk[-1].pk
+        Question.objects.prefetch_answers(chunk)
+
+        for question in chunk:
+            question_class = type(question)
+            record = {'type': 'question',
+                      'question_type': question._meta.label_lower,
+                      'quiz': question.quiz.url,
+                      'category': _name(question.category),
+                      'sub_category': _name(question.sub_category),
+                      'sub_category_category': _name(
+                          question.sub_category.category
+                          if question.sub_category else None),
+                      'figure': question.figure.name or None}
+            record.update((name, getattr(question, name))
+                          for name in QUESTION_FIELDS +
+                          type_fields(question_class))
+            if question_class is MCQuestion:
+                record['answers'] = [
+                    {'content': answer.content, 'correct': answer.correct}
+                    for answer in question.answer_set.all()]
+            yield record
+
+
+def insert_rows(model, objs, batch_size):
+    """
+    Inserts objs into the table of model, without the tables of its parent
+    models: one executemany() per batch.
+    """
+    fields = model._meta.local_concrete_fields
+    connection = connections[router.db_for_write(model)]
+    quote_name = connection.ops.quote_name
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        quote_name(model._meta.db_table),
+        ', '.join(quote_name(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)))
+
+    with connection.cursor() as cursor:
+        for start in range(0, len(objs), batch_size):
+            cursor.executemany(sql, [
+                [field.get_db_prep_save(field.pre_save(obj, True),
+                                        connection)
+                 for field in fields]
+                for obj in objs[start:start + batch_size]])
+
+
+def _name(instance):
+    return str(instance) if instance is not None else None
+
+
+class BankImporter(object):
+    """
+    Loads records written by export_bank().
+
+    Categories and quizzes are matched by name and url, and created or
+    updated. Questions are always added; with replace=True, the existing
+    questions of each quiz in the bank are deleted first.
+    """
+
+    def __init__(self, batch_size=1000, replace=False):
+        self.batch_size = batch_size
+        self.replace = replace
+        self.types = question_types()
+        self.categories = {}
+        self.sub_categories = {}
+        self.quizzes = {}
+        self.pending = []
+        self.touched = set()
+        self.counts = dict.fromkeys(['category', 'sub_category', 'quiz',
+                                     'question'], 0)
+
+    def load(self, lines):
+        try:
+            for line_number, line in enumerate(lines, 1):
+                if not line.strip():
+                    continue
+                try:
+                    self.load_record(json.loads(line))
+                except ValidationError as error:
+                    raise ValueError("line %d: %s"
+                                     % (line_number, ' '.join(error.messages)))
+                except (ValueError, KeyError, TypeError,
+                        ObjectDoesNotExist) as error:
+                    raise ValueError("line %d: %s" % (line_number, error))
+
+            self.flush()
+        finally:
+            # Batches already written stay, and must be seen by the quizzes.
+            Quiz.objects.bump_version(self.touched)
+            Quiz.objects.refresh_question_counts(self.touched)
+        return self.counts
+
+    def load_record(self, record):
+        record_type = record['type']
+        if record_type == 'category':
+            self.get_category(record['category'])
+        elif record_type == 'sub_category':
+            self.get_sub_category(record['sub_category'],
+                                  record['category'])
+        elif record_type == 'quiz':
+            self.load_quiz(record)
+        elif record_type == 'question':
+            if record['question_type'] not in self.types:
+                raise ValueError("unknown question type %r"
+                                 % record['question_type'])
+            self.get_quiz(record['quiz'])
+            self.pending.append(record)
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+        else:
+            raise ValueError("unknown record type %r" % record_type)
+
+        self.counts[record_type] += 1
+
+    def get_category(self, name):
+        if name is None:
+            return None
+        if name not in self.categories:
+            self.categories[name], created =\
+                Category.objects.get_or_create(category=name)
+        return self.categories[name]
+
+    def get_sub_category(self, name, category_name):
+        if name is None:
+            return None
+        key = (name, category_name)
+        if key not in self.sub_categories:
+            category = self.get_category(category_name)
+            sub_category = SubCategory.objects.filter(
+                sub_category=name, category=category).first()
+            if sub_category is None:
+                sub_category = SubCategory.objects.create(
+                    sub_category=name, category=category)
+            self.sub_categories[key] = sub_category
+        return self.sub_categories[key]
+
+    def load_quiz(self, record):
+        fields = {name: record[name] for name in QUIZ_FIELDS
+                  if name in record}
+        fields['category'] = self.get_category(record.get('category'))
+
+        quiz = Quiz.objects.filter(url=record['url']).first()
+        if quiz is None:
+            quiz = Quiz.objects.create(**fields)
+        else:
+            for name, value in fields.items():
+                setattr(quiz, name, value)
+            quiz.save()
+            if self.replace:
+                self.flush()
+                # Refreshes the quiz once, not once per question.
+                with batched_question_changes():
+                    quiz.question_set.all().delete()
+
+        self.quizzes[quiz.url] = quiz
+
+    def get_quiz(self, url):
+        if url not in self.quizzes:
+            try:
+                self.quizzes[url] = Quiz.objects.get(url=url)
+            except Quiz.DoesNotExist:
+                raise ValueError("unknown quiz %r" % url)
+        return self.quizzes[url]
+
+    def flush(self):
+        """
+        Writes the pending questions: one bulk insert for the question
+        rows, one per question type for the type rows and one for the
+        answers.
+        """
+        if not self.pending:
+            return
+
+        records, self.pending = self.pending, []
+        questions = []
+        for record in records:
+            quiz = self.get_quiz(record['quiz'])
+            questions.append(Question(
+                quiz=quiz,
+                category=self.get_category(record.get('category')),
+                sub_category=self.get_sub_category(
+                    record.get('sub_category'),
+                    # Banks exported before it was written: the question's.
+                    record.get('sub_category_category',
+                               record.get('category'))),
+                figure=record.get('figure') or None,
+                question_type=record['question_type'],
+                **{name: record[name] for name in QUESTION_FIELDS
+                   if name in record}))
+            self.touched.add(quiz.pk)
+
+        with transaction.atomic():
+            Question.objects.bulk_create(questions)
+
+            by_type = {}
+            answers = []
+            for record, question in zip(records, questions):
+                question_class = self.types[record['question_type']]
+                typed = question_class(question_ptr_id=question.pk,
+                                       **{name: record[name] for name
+                                          in type_fields(question_class)
+                                          if name in record})
+                by_type.setdefault(question_class, []).append(typed)
+                answers.extend(
+                    Answer(question_id=question.pk,
+                           content=answer['content'],
+                           correct=answer['correct'])
+                    for answer in record.get('answers', ()))
+
+            for question_class, typed in by_type.items():
+                # bulk_create() refuses multi-table inherited models.
+                insert_rows(question_class, typed, self.batch_size)
+
+            Answer.objects.bulk_create(answers, batch_size=self.batch_size)
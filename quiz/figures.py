@@ -0,0 +1,257 @@
+"""
+Resized copies of the question figures, for the pages students see.
+
+Teachers upload figures as they come, often photos of several megabytes.
+When a question is saved with a new figure, it is scaled down to each of
+the FIGURE_WIDTHS no wider than itself, and encoded in WebP and in JPEG.
+The copies are named after a digest of their content, so that they can be
+cached by browsers for good (see FigureView), and are recorded on the
+question in figure_derivatives:
+
+    {'source': 'uploads/2024/05/02/photo.jpg', 'width': 1024,
+     'height': 768, 'webp': [[320, 'figures/...-320w.webp'], ...],
+     'jpeg': [[320, 'figures/...-320w.jpg'], ...]}
+
+Figures that cannot be read get no copies, and the pages show the
+original. The build_figures command builds the copies of the questions
+saved before, or imported in bulk.
+
+Questions with the same figure share its copies, so the copies a question
+drops, when its figure is replaced or it is deleted, are only removed once
+no other question records them.
+"""
+import hashlib
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import models, transaction
+from django.db.models.functions import Cast
+from django.urls import reverse
+from PIL import Image, ImageOps
+
+
+DEFAULT_WIDTHS = (320, 640, 1024)
+
+DEFAULT_QUALITY = 80
+
+DIRECTORY = 'figures'
+
+FORMATS = (
+    # Key in figure_derivatives, Pillow format, extension.
+    ('webp', 'WEBP', 'webp'),
+    ('jpeg', 'JPEG', 'jpg'),
+)
+
+CONTENT_TYPES = {'webp': 'image/webp', 'jpg': 'image/jpeg'}
+
+# Name of a copy: digest of the content, width and extension.
+NAME_PATTERN = r'[0-9a-f]{20}-[0-9]+w\.(?:webp|jpg)'
+
+
+def figure_widths():
+    quiz_settings = getattr(settings, 'QUIZ_SETTINGS', {})
+    return quiz_settings.get('FIGURE_WIDTHS', DEFAULT_WIDTHS)
+
+
+def figure_quality():
+    quiz_settings = getattr(settings, 'QUIZ_SETTINGS', {})
+    return quiz_settings.get('FIGURE_QUALITY', DEFAULT_QUALITY)
+
+
+def widths_for(width):
+    """
+    Returns the widths to scale a figure of the given width to: the
+    configured ones below it, and its own width capped to the largest.
+    """
+    widths = figure_widths()
+    return sorted({size for size in widths if size < width} |
+                  {min(width, max(widths))})
+
+
+def encode(image, pillow_format):
+    output = BytesIO()
+    if pillow_format == 'JPEG':
+        if image.mode in ('RGBA', 'LA', 'PA'):
+            # JPEG has no transparency: flattened on white.
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        image.convert('RGB').save(output, 'JPEG', quality=figure_quality(),
+                                  optimize=True, progressive=True)
+    else:
+        image.save(output, pillow_format, quality=figure_quality())
+    return output.getvalue()
+
+
+def store(content, width, extension, storage=None):
+    """
+    Saves a copy under the name given by its content, unless it is
+    already there, and returns the name.
+    """
+    storage = storage or default_storage
+    digest = hashlib.sha256(content).hexdigest()[:20]
+    name = '%s/%s-%dw.%s' % (DIRECTORY, digest, width, extension)
+    if not storage.exists(name):
+        saved = storage.save(name, ContentFile(content))
+        if saved != name:
+            # Saved meanwhile by another request: the content is the same.
+            storage.delete(saved)
+    return name
+
+
+def build(figure, storage=None):
+    """
+    Builds the copies of the image file figure and returns its
+    figure_derivatives.
+    """
+    derivatives = {'source': figure.name}
+    try:
+        figure.open('rb')
+        try:
+            with Image.open(figure) as original:
+                original.load()
+                image = ImageOps.exif_transpose(original)
+        finally:
+            figure.close()
+    except (OSError, ValueError, Image.DecompressionBombError):
+        # Missing, or not an image Pillow can read: the original is shown.
+        return derivatives
+
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or
+                              image.mode in ('LA', 'PA') else 'RGB')
+
+    for key, pillow_format, extension in FORMATS:
+        derivatives[key] = []
+    for width in widths_for(image.width):
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.Resampling.LANCZOS,
+                               reducing_gap=3.0)
+        for key, pillow_format, extension in FORMATS:
+            content = encode(resized, pillow_format)
+            derivatives[key].append(
+                [width, store(content, width, extension, storage)])
+        derivatives.update(width=width, height=height)
+    return derivatives
+
+
+def prepare(question):
+    """
+    Brings the figure_derivatives of question in step with its figure,
+    before the question is saved. A new upload is stored first, so that
+    the copies are recorded under its final name.
+    """
+    figure = question.figure
+    if not figure:
+        question.figure_derivatives = {}
+        return False
+
+    if not figure._committed:
+        figure.save(figure.name, figure.file, save=False)
+    if (question.figure_derivatives or {}).get('source') == figure.name:
+        return False
+
+    question.figure_derivatives = build(figure)
+    return True
+
+
+def copy_names(derivatives):
+    """
+    Returns the names of the copies recorded in derivatives.
+    """
+    derivatives = derivatives or {}
+    return {name for key, pillow_format, extension in FORMATS
+            for width, name in derivatives.get(key, ())}
+
+
+def recorded_names(questions):
+    names = set()
+    for derivatives in questions.values_list('figure_derivatives',
+                                             flat=True):
+        names |= copy_names(derivatives)
+    return names
+
+
+def remove_unused(names, storage=None):
+    """
+    Deletes the copies among names that no question records any more.
+    """
+    from .models import Question
+
+    names = set(names)
+    if not names:
+        return
+    recording = models.Q()
+    for name in names:
+        recording |= models.Q(derivatives_text__contains=name)
+    names -= recorded_names(
+        Question.objects.annotate(
+            derivatives_text=Cast('figure_derivatives', models.TextField()))
+        .filter(recording))
+
+    storage = storage or default_storage
+    for name in names:
+        storage.delete(name)
+
+
+def discard(derivatives, kept=None):
+    """
+    Removes the copies of derivatives that are not in kept, once the
+    transaction that dropped them is committed.
+    """
+    remove_on_commit(copy_names(derivatives) - copy_names(kept))
+
+
+def remove_on_commit(names):
+    if names:
+        transaction.on_commit(lambda: remove_unused(names))
+
+
+def prune(storage=None):
+    """
+    Deletes the files under DIRECTORY that no question records, e.g. left
+    by questions changed in bulk, and returns how many there were.
+    """
+    from .models import Question
+
+    storage = storage or default_storage
+    try:
+        files = storage.listdir(DIRECTORY)[1]
+    except FileNotFoundError:
+        return 0
+    recorded = recorded_names(Question.objects.exclude(figure=''))
+    unused = ['%s/%s' % (DIRECTORY, name) for name in files
+              if '%s/%s' % (DIRECTORY, name) not in recorded]
+    for name in unused:
+        storage.delete(name)
+    return len(unused)
+
+
+def figure_url(name):
+    return reverse('quiz_figure', kwargs={'name': name.split('/', 1)[1]})
+
+
+def srcset(derivatives, key):
+    return ', '.join('%s %dw' % (figure_url(name), width)
+                     for width, name in derivatives.get(key, ()))
+
+
+def sources(question):
+    """
+    Returns what the figure template needs to show the figure of
+    question, or None when it has no copies.
+    """
+    derivatives = question.figure_derivatives or {}
+    if not derivatives.get('jpeg') or \
+       derivatives.get('source') != question.figure.name:
+        return None
+
+    return {
+        'webp': srcset(derivatives, 'webp'),
+        'jpeg': srcset(derivatives, 'jpeg'),
+        'src': figure_url(derivatives['jpeg'][-1][1]),
+        'width': derivatives['width'],
+        'height': derivatives['height'],
+    }
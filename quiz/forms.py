@@ -4,14 +4,16 @@ from django.forms.widgets import RadioSelect, Textarea
 
 class QuestionForm(forms.Form):
     def __init__(self, question, *args, **kwargs):
+        seed = kwargs.pop('seed', None)
         super(QuestionForm, self).__init__(*args, **kwargs)
-        choice_list = [x for x in question.get_answers_list()]
+        choice_list = [x for x in question.get_answers_list(seed)]
         self.fields["answers"] = forms.ChoiceField(choices=choice_list,
                                                    widget=RadioSelect)
 
 
 class EssayForm(forms.Form):
     def __init__(self, question, *args, **kwargs):
+        kwargs.pop('seed', None)
         super(EssayForm, self).__init__(*args, **kwargs)
         self.fields["answers"] = forms.CharField(
             widget=Textarea(attrs={'style': 'width:100%'}))
@@ -0,0 +1,71 @@
+"""
+Item analysis of questions, from the answers logged in QuestionAttempt.
+
+The difficulty of a question is the share of correct answers to it. Its
+discrimination is the point-biserial correlation between answering it
+correctly and the score of the sitting on the other questions: questions
+that strong students get right and weak students get wrong score close
+to 1, questions that do not tell them apart score around 0.
+
+The attempts are loaded into NumPy arrays and every question is computed
+at once, so this needs NumPy, which is an optional dependency.
+"""
+from .models import QuestionAttempt
+
+
+ATTEMPT_DTYPE = [('question', 'i8'), ('sitting', 'i8'), ('correct', '?')]
+
+
+def load_attempts(questions, chunk_size=10000):
+    """
+    Returns the attempts at the given questions as a structured array.
+    """
+    import numpy as np
+
+    rows = QuestionAttempt.objects.filter(question__in=questions)\
+                                  .values_list('question_id', 'sitting_id',
+                                               'correct')\
+                                  .iterator(chunk_size=chunk_size)
+    return np.fromiter(rows, dtype=ATTEMPT_DTYPE)
+
+
+def item_statistics(attempts):
+    """
+    Returns the question ids of the attempts, with the number of
+    attempts, the difficulty and the discrimination of each.
+
+    The discrimination is NaN when it is undefined, i.e. when every
+    answer to the question was right, or every one was wrong, or when
+    the sittings all have the same score on the other questions.
+    """
+    import numpy as np
+
+    question_ids, question = np.unique(attempts['question'],
+                                       return_inverse=True)
+    sittings, sitting = np.unique(attempts['sitting'], return_inverse=True)
+    correct = attempts['correct'].astype(float)
+
+    # Score of each sitting on the other questions than the attempted one.
+    totals = np.bincount(sitting, weights=correct, minlength=len(sittings))
+    rest = totals[sitting] - correct
+
+    def per_question(weights):
+        return np.bincount(question, weights=weights,
+                           minlength=len(question_ids))
+
+    count = per_question(None)
+    right = per_question(correct)
+    rest_sum = per_question(rest)
+    rest_right = per_question(rest * correct)
+    rest_squares = per_question(rest * rest)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        difficulty = right / count
+        mean_right = rest_right / right
+        mean_wrong = (rest_sum - rest_right) / (count - right)
+        variance = rest_squares / count - (rest_sum / count) ** 2
+        deviation = np.sqrt(np.maximum(variance, 0))
+        discrimination = (mean_right - mean_wrong) / deviation * \
+            np.sqrt(difficulty * (1 - difficulty))
+
+    return question_ids, count.astype(int), difficulty, discrimination
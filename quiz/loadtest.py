@@ -0,0 +1,272 @@
+"""
+Load test of the quiz taking flow.
+
+Simulated students take a quiz through the test client, each in its own
+thread: they open the question page, answer every question until the
+result page is shown, and start over for as many sittings as asked.
+Signed in students are logged in with force_login(); anonymous ones keep
+their sitting in the session, as in a browser.
+
+Every request is timed and its queries are counted, so that the numbers
+of the hot path can be compared before and after a change. Requests that
+fail because the database is locked are counted apart from other errors,
+as are the writes that were retried after a lock error (see
+quiz.locking).
+The test client runs the whole request in process, so the numbers leave
+out the web server but include the middleware, the views and templates.
+"""
+import random
+import re
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.test import Client
+from django.urls import reverse
+
+from . import locking
+from .models import Quiz
+from multichoice.models import Answer, MCQuestion
+from true_false.models import TF_Question
+
+
+ANSWER_INPUT = re.compile(r'<input[^>]*name="answers"[^>]*value="([^"]*)"')
+ESSAY_INPUT = re.compile(r'<textarea[^>]*name="answers"')
+
+
+class Sample(object):
+    """
+    One request: its kind, duration in seconds, number of queries and
+    outcome ('ok', 'error' or 'locked').
+    """
+    __slots__ = ('kind', 'duration', 'queries', 'outcome')
+
+    def __init__(self, kind, duration, queries, outcome):
+        self.kind = kind
+        self.duration = duration
+        self.queries = queries
+        self.outcome = outcome
+
+
+class QueryCounter(object):
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Student(object):
+    """
+    A simulated student. user is None for an anonymous student.
+    """
+
+    def __init__(self, quiz_url, user=None, sittings=1, seed=None):
+        self.url = reverse('quiz_question', kwargs={'quiz_name': quiz_url})
+        self.user = user
+        self.sittings = sittings
+        self.random = random.Random(seed)
+        self.samples = []
+        self.completed = 0
+
+    def run(self):
+        client = Client(SERVER_NAME=server_name())
+        try:
+            if self.user is not None and not self.login(client):
+                return self
+            for _ in range(self.sittings):
+                if self.take_quiz(client):
+                    self.completed += 1
+        finally:
+            # Each thread has its own connection.
+            connections.close_all()
+        return self
+
+    def login(self, client):
+        """
+        Logs the student in, which writes a session. Returns False, and
+        records the failure, if the session could not be saved.
+        """
+        start = time.perf_counter()
+        try:
+            client.force_login(self.user)
+        except Exception as error:
+            self.samples.append(Sample('login', time.perf_counter() - start,
+                                       0, lock_outcome(error)))
+            return False
+        return True
+
+    def take_quiz(self, client):
+        """
+        Answers questions until the result page. Returns False if a
+        request failed or the quiz could not be taken.
+        """
+        response = self.request(client, 'start', 'get')
+        # Bounds the loop in case the same question keeps coming back.
+        for _ in range(10000):
+            if response is None:
+                return False
+            answer = self.pick_answer(response.content.decode())
+            if answer is None:
+                return response.status_code == 200
+            response = self.request(client, 'answer', 'post',
+                                    {'answers': answer})
+        return False
+
+    def pick_answer(self, page):
+        choices = ANSWER_INPUT.findall(page)
+        if choices:
+            return self.random.choice(choices)
+        if ESSAY_INPUT.search(page):
+            return "Load test answer."
+        return None
+
+    def request(self, client, kind, method, data=None):
+        counter = QueryCounter()
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(counter):
+                response = getattr(client, method)(self.url, data or {})
+        except Exception as error:
+            outcome = lock_outcome(error)
+            response = None
+        else:
+            outcome = 'ok' if response.status_code < 400 else 'error'
+            if outcome == 'error':
+                response = None
+        duration = time.perf_counter() - start
+
+        self.samples.append(Sample(kind, duration, counter.count, outcome))
+        return response
+
+
+def lock_outcome(error):
+    return 'locked' if locking.is_lock_error(error) else 'error'
+
+
+def server_name():
+    """
+    Returns a host name the site accepts, as the test client's default
+    "testserver" is only allowed in tests.
+    """
+    for host in settings.ALLOWED_HOSTS:
+        if host == '*':
+            break
+        if not host.startswith('.'):
+            return host
+    return 'localhost'
+
+
+def get_students(quiz_url, users, anonymous, sittings=1,
+                 prefix='loadtest_'):
+    """
+    Returns the simulated students. Their accounts are created on first
+    use and reused by later runs.
+    """
+    students = []
+    for number in range(users):
+        user, created = User.objects.get_or_create(
+            username='%s%d' % (prefix, number))
+        if created:
+            user.set_unusable_password()
+            user.save(update_fields=['password'])
+        students.append(Student(quiz_url, user, sittings, seed=number))
+    for number in range(anonymous):
+        students.append(Student(quiz_url, None, sittings,
+                                seed=users + number))
+    return students
+
+
+def run(students, concurrency):
+    """
+    Runs the students with at most concurrency of them at a time and
+    returns the report of the run.
+    """
+    lock = threading.Lock()
+    samples = []
+
+    def take(student):
+        student.run()
+        with lock:
+            samples.extend(student.samples)
+
+    retried = locking.counts.retried
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(take, students))
+    elapsed = time.perf_counter() - start
+
+    report = summarize(samples, elapsed)
+    report['lock_retries'] = locking.counts.retried - retried
+    report['sittings'] = sum(student.completed for student in students)
+    report['sittings_per_second'] = report['sittings'] / elapsed
+    return report
+
+
+def percentiles(durations):
+    """
+    Returns the 50th, 90th and 99th percentiles, in milliseconds.
+    """
+    if len(durations) < 2:
+        return dict.fromkeys(('p50', 'p90', 'p99'),
+                             durations[0] * 1000 if durations else None)
+    cuts = statistics.quantiles(durations, n=100, method='inclusive')
+    return {'p50': cuts[49] * 1000, 'p90': cuts[89] * 1000,
+            'p99': cuts[98] * 1000}
+
+
+def summarize(samples, elapsed):
+    """
+    Returns the figures of a run: overall and for each kind of request.
+    """
+    def figures(selected):
+        durations = [sample.duration for sample in selected]
+        queries = [sample.queries for sample in selected
+                   if sample.outcome == 'ok']
+        result = {
+            'requests': len(selected),
+            'errors': sum(sample.outcome == 'error' for sample in selected),
+            'locked': sum(sample.outcome == 'locked' for sample in selected),
+            'queries_mean': statistics.mean(queries) if queries else None,
+            'queries_max': max(queries) if queries else None,
+            'max': max(durations) * 1000 if durations else None,
+        }
+        result.update(percentiles(durations))
+        return result
+
+    report = figures(samples)
+    report['elapsed'] = elapsed
+    report['requests_per_second'] = len(samples) / elapsed if elapsed else 0
+    report['kinds'] = {
+        kind: figures([sample for sample in samples if sample.kind == kind])
+        for kind in sorted({sample.kind for sample in samples})}
+    return report
+
+
+def build_quiz(questions, url='loadtest'):
+    """
+    Creates a quiz of alternating multiple choice and true/false
+    questions to run against, e.g. in a scratch database.
+    """
+    quiz = Quiz.objects.create(title="Load test", url=url,
+                               description="Quiz of the load test.",
+                               random_order=True)
+    for number in range(questions):
+        if number % 2:
+            TF_Question.objects.create(quiz=quiz, correct=True,
+                                       content="Question %d" % number)
+            continue
+        question = MCQuestion.objects.create(quiz=quiz,
+                                             answer_order='random',
+                                             content="Question %d" % number)
+        Answer.objects.bulk_create(
+            Answer(question=question, content="Answer %d" % choice,
+                   correct=choice == 0)
+            for choice in range(4))
+    return quiz
@@ -0,0 +1,138 @@
+"""
+Retry of writes that fail because the SQLite database is locked.
+
+SQLite lets one writer in at a time. The connection waits for the lock up
+to the timeout set in DATABASES, and gives up with "database is locked"
+when many students answer at once, e.g. at the start of an exam. The
+writes of the quiz taking flow are made in short transactions and retried
+with retry_on_lock(), which backs off a little longer, with jitter, after
+each failure.
+
+With SERIALIZE_WRITES, these writes also take a lock of the process
+first, so that its threads queue for their turn in order instead of all
+polling SQLite for it.
+
+A write made inside a transaction opened by the caller is not retried:
+the failed transaction can only be retried as a whole.
+"""
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connection
+
+
+DEFAULT_RETRIES = 5
+
+DEFAULT_DELAY = 0.05
+
+# Longest wait between two attempts, in seconds.
+MAX_DELAY = 1.0
+
+LOCK_MESSAGES = ('database is locked', 'database table is locked')
+
+
+class LockCounts(object):
+    """
+    Numbers of writes retried after a lock error, and of writes that
+    still failed once the retries were used up.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.retried = 0
+        self.failed = 0
+
+    def add(self, retried=0, failed=0):
+        with self._lock:
+            self.retried += retried
+            self.failed += failed
+
+    def reset(self):
+        with self._lock:
+            self.retried = 0
+            self.failed = 0
+
+
+counts = LockCounts()
+
+_write_lock = threading.RLock()
+
+
+def lock_retries():
+    quiz_settings = getattr(settings, 'QUIZ_SETTINGS', {})
+    return quiz_settings.get('LOCK_RETRIES', DEFAULT_RETRIES)
+
+
+def lock_retry_delay():
+    quiz_settings = getattr(settings, 'QUIZ_SETTINGS', {})
+    return quiz_settings.get('LOCK_RETRY_DELAY', DEFAULT_DELAY)
+
+
+def serialize_writes():
+    quiz_settings = getattr(settings, 'QUIZ_SETTINGS', {})
+    return quiz_settings.get('SERIALIZE_WRITES', False)
+
+
+def is_lock_error(error):
+    """
+    Tells whether error, or the error it was raised from, is a lock
+    error, e.g. for the UpdateError of a session that could not be saved.
+    """
+    while error is not None:
+        if isinstance(error, OperationalError) and \
+           any(message in str(error) for message in LOCK_MESSAGES):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def backoff(attempt, delay=None):
+    """
+    Returns the wait before the attempt following the given one: twice
+    as long after each failure, up to MAX_DELAY, and between a half and
+    all of it so that the writers that failed together spread out.
+    """
+    if delay is None:
+        delay = lock_retry_delay()
+    return min(delay * 2 ** attempt, MAX_DELAY) * random.uniform(0.5, 1)
+
+
+def retry_on_lock(function, *args, on_retry=None, **kwargs):
+    """
+    Calls function and returns its result, calling it again when it
+    fails because the database is locked, up to LOCK_RETRIES times.
+
+    function must leave nothing written when it fails, i.e. make its
+    writes in one transaction. on_retry is called before each new
+    attempt, to undo the changes the failed one made in memory.
+
+    With SERIALIZE_WRITES, function runs under a lock of the process, so
+    it should do the writes and little else: reads that can wait, e.g.
+    for the page to render, go after it.
+    """
+    if connection.in_atomic_block:
+        return function(*args, **kwargs)
+
+    retries = lock_retries()
+    serialized = serialize_writes()
+    attempt = 0
+    while True:
+        try:
+            if serialized:
+                with _write_lock:
+                    return function(*args, **kwargs)
+            return function(*args, **kwargs)
+        except OperationalError as error:
+            if not is_lock_error(error):
+                raise
+            if attempt >= retries:
+                counts.add(failed=1)
+                raise
+
+        time.sleep(backoff(attempt))
+        attempt += 1
+        counts.add(retried=1)
+        if on_retry is not None:
+            on_retry()
@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand
+
+from quiz import figures
+from quiz.models import Question, Quiz
+
+
+class Command(BaseCommand):
+    help = ("Builds the resized copies of the question figures that do not "
+            "have them yet, e.g. figures uploaded before they were built "
+            "on save, or imported with import_quizzes.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help="Rebuilds the copies of every figure, e.g. after changing "
+                 "FIGURE_WIDTHS or FIGURE_QUALITY.")
+        parser.add_argument(
+            '--chunk-size', type=int, default=200,
+            help="Number of questions read from the database at a time.")
+        parser.add_argument(
+            '--prune', action='store_true',
+            help="Also deletes the copies no question records any more, "
+                 "e.g. left by questions changed in bulk. Copies being "
+                 "built by a question saved meanwhile are deleted too: run "
+                 "it when no figure is being uploaded.")
+
+    def handle(self, *args, **options):
+        questions = Question.objects.exclude(figure='')\
+                                    .exclude(figure__isnull=True)\
+                                    .only('pk', 'quiz_id', 'figure',
+                                          'figure_derivatives')\
+                                    .order_by('pk')
+
+        built = failed = 0
+        quiz_ids = set()
+        stale = set()
+        for question in questions.iterator(chunk_size=options['chunk_size']):
+            previous_names = figures.copy_names(question.figure_derivatives)
+            if options['force']:
+                question.figure_derivatives = {}
+            if not figures.prepare(question):
+                continue
+            stale |= previous_names - figures.copy_names(
+                question.figure_derivatives)
+
+            # Saved without the signals of a question change, which
+            # would refresh its quiz once per question.
+            Question.objects.filter(pk=question.pk).update(
+                figure_derivatives=question.figure_derivatives)
+            quiz_ids.add(question.quiz_id)
+            if 'jpeg' in question.figure_derivatives:
+                built += 1
+            else:
+                self.stderr.write("Question %d: %s is missing or is not "
+                                  "an image Pillow can read."
+                                  % (question.pk, question.figure.name))
+                failed += 1
+
+        # The compiled snapshots hold the questions as they were.
+        Quiz.objects.bump_version(quiz_ids)
+        figures.remove_unused(stale)
+        self.stdout.write("Built the figures of %d questions, %d failed."
+                          % (built, failed))
+        if options['prune']:
+            self.stdout.write("Deleted %d unused copies." % figures.prune())
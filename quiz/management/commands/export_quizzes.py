@@ -0,0 +1,43 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from quiz.bank import export_bank
+from quiz.models import Quiz
+
+
+class Command(BaseCommand):
+    help = ("Exports quizzes, with their categories and questions, as "
+            "line-delimited JSON.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'urls', nargs='*', metavar='url',
+            help="Urls of the quizzes to export. Exports every quiz if "
+                 "none is given.")
+        parser.add_argument(
+            '-o', '--output',
+            help="File to write to. Defaults to the standard output.")
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help="Number of rows read from the database at a time.")
+
+    def handle(self, *args, **options):
+        quizzes = Quiz.objects.all()
+        if options['urls']:
+            quizzes = quizzes.filter(url__in=options['urls'])
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                count = self.write(quizzes, output, options['chunk_size'])
+            self.stderr.write("Exported %d records to %s."
+                              % (count, options['output']))
+        else:
+            self.write(quizzes, self.stdout, options['chunk_size'])
+
+    def write(self, quizzes, output, chunk_size):
+        count = 0
+        for record in export_bank(quizzes, chunk_size=chunk_size):
+            output.write(json.dumps(record, ensure_ascii=False) + '\n')
+            count += 1
+        return count
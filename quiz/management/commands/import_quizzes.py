@@ -0,0 +1,39 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from quiz.bank import BankImporter
+
+
+class Command(BaseCommand):
+    help = ("Imports quizzes written by export_quizzes. Categories and "
+            "quizzes are matched by name and url; questions are added.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help="File to read, or - for the standard input.")
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="Number of questions written at a time.")
+        parser.add_argument(
+            '--replace', action='store_true',
+            help="Delete the existing questions of each imported quiz "
+                 "first.")
+
+    def handle(self, *args, **options):
+        importer = BankImporter(batch_size=options['batch_size'],
+                                replace=options['replace'])
+        try:
+            if options['path'] == '-':
+                counts = importer.load(sys.stdin)
+            else:
+                with open(options['path'], encoding='utf-8') as lines:
+                    counts = importer.load(lines)
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+
+        self.stdout.write(
+            "Imported %(category)d categories, %(sub_category)d "
+            "sub-categories, %(quiz)d quizzes and %(question)d questions."
+            % counts)
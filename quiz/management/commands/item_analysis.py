@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from quiz.item_analysis import item_statistics, load_attempts
+from quiz.models import Question
+
+
+class Command(BaseCommand):
+    help = ("Reports the difficulty and the discrimination of questions. "
+            "Needs NumPy.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'urls', nargs='*', metavar='url',
+            help="Urls of the quizzes to report on. Reports on every quiz "
+                 "if none is given.")
+        parser.add_argument(
+            '--min-attempts', type=int, default=1,
+            help="Leaves out questions answered fewer times.")
+        parser.add_argument(
+            '--chunk-size', type=int, default=10000,
+            help="Number of attempts read from the database at a time.")
+
+    def handle(self, *args, **options):
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            raise CommandError("The item analysis needs NumPy.")
+
+        questions = Question.objects.all()
+        if options['urls']:
+            questions = questions.filter(quiz__url__in=options['urls'])
+
+        # The difficulty comes from the counters, which also count the
+        # answers of anonymous users; the discrimination needs the answers
+        # of each sitting.
+        attempts = load_attempts(questions, options['chunk_size'])
+        question_ids, count, difficulty, discrimination = \
+            item_statistics(attempts)
+        discrimination = dict(zip(question_ids.tolist(),
+                                  discrimination.tolist()))
+
+        rows = questions.filter(stats__attempts__gte=options['min_attempts'])\
+                        .select_related('stats', 'quiz')\
+                        .order_by('quiz__url', 'pk')
+        self.stdout.write("%-8s %-20s %8s %10s %14s  %s" % (
+            "id", "quiz", "attempts", "difficulty", "discrimination",
+            "question"))
+        for question in rows.iterator(chunk_size=options['chunk_size']):
+            self.stdout.write("%-8d %-20s %8d %10.2f %14s  %s" % (
+                question.pk, question.quiz.url[:20], question.stats.attempts,
+                question.stats.difficulty,
+                format_value(discrimination.get(question.pk)),
+                question.content[:60]))
+
+
+def format_value(value):
+    if value is None or value != value:  # NaN
+        return '-'
+    return '%.2f' % value
@@ -0,0 +1,164 @@
+import json
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from quiz import loadtest
+from quiz.bank import BankImporter, export_bank
+from quiz.models import Quiz
+
+
+class Command(BaseCommand):
+    help = ("Simulates students taking a quiz concurrently and reports "
+            "throughput, latency, queries per request and lock errors.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--quiz', metavar='url',
+            help="Url of a quiz of this database, copied into the scratch "
+                 "database to be taken there. Defaults to a generated "
+                 "quiz.")
+        parser.add_argument(
+            '--users', type=int, default=10,
+            help="Number of signed in students. Their accounts are named "
+                 "loadtest_<n> and created if needed.")
+        parser.add_argument(
+            '--anonymous', type=int, default=0,
+            help="Number of anonymous students.")
+        parser.add_argument(
+            '--sittings', type=int, default=1,
+            help="Number of times each student takes the quiz.")
+        parser.add_argument(
+            '--concurrency', type=int,
+            help="Number of students running at a time. Defaults to all "
+                 "of them.")
+        parser.add_argument(
+            '--scratch', action='store_true',
+            help="Runs against a new test database, which is destroyed "
+                 "afterwards. Required: the sittings, scores and answer "
+                 "statistics of the run would otherwise show in the "
+                 "leaderboards and the item analysis.")
+        parser.add_argument(
+            '--questions', type=int, default=20,
+            help="Number of questions of the generated quiz.")
+        parser.add_argument(
+            '--plain-sqlite', action='store_true',
+            help="With --scratch, runs on SQLite with its default settings "
+                 "(rollback journal, deferred transactions, 5s timeout) "
+                 "and without lock retries, to compare with the profile "
+                 "of the settings.")
+        parser.add_argument(
+            '--json', action='store_true',
+            help="Writes the report as JSON.")
+
+    def handle(self, *args, **options):
+        students = options['users'] + options['anonymous']
+        if students < 1:
+            raise CommandError("There must be at least one student.")
+        if not options['scratch']:
+            raise CommandError(
+                "The load test writes sittings, scores and answer "
+                "statistics: run it with --scratch, and --quiz to take a "
+                "copy of a quiz of this database.")
+
+        if options['plain_sqlite']:
+            report = self.run_plain(options)
+        else:
+            report = self.run_scratch(options)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.write_report(report)
+
+    def run(self, quiz_url, options):
+        students = loadtest.get_students(quiz_url, options['users'],
+                                         options['anonymous'],
+                                         options['sittings'])
+        concurrency = options['concurrency'] or len(students)
+        return loadtest.run(students, concurrency)
+
+    def run_scratch(self, options):
+        bank = None
+        if options['quiz']:
+            quizzes = Quiz.objects.filter(url=options['quiz'])
+            if not quizzes.exists():
+                raise CommandError("No quiz at %r." % options['quiz'])
+            # Read before the connection moves to the scratch database.
+            bank = [json.dumps(record) for record in export_bank(quizzes)]
+
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        if connection.vendor == 'sqlite' and not test_settings.get('NAME'):
+            # The default in-memory test database cannot be shared by the
+            # threads of the students.
+            test_settings['NAME'] = os.path.join(tempfile.mkdtemp(),
+                                                 'loadtest.sqlite3')
+
+        # The read replica is a copy of the main database, not of this one.
+        quiz_settings = dict(getattr(settings, 'QUIZ_SETTINGS', {}),
+                             READ_REPLICA=None)
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(QUIZ_SETTINGS=quiz_settings):
+                if bank is None:
+                    quiz_url = loadtest.build_quiz(options['questions']).url
+                else:
+                    BankImporter().load(bank)
+                    quiz_url = options['quiz']
+                return self.run(quiz_url, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run_plain(self, options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("--plain-sqlite needs a SQLite database.")
+
+        # The threads open their connections from this same dictionary.
+        settings_dict = connection.settings_dict
+        saved = {name: settings_dict[name]
+                 for name in ('OPTIONS', 'CONN_MAX_AGE')}
+        settings_dict['OPTIONS'] = {'init_command': "PRAGMA foreign_keys=1"}
+        settings_dict['CONN_MAX_AGE'] = 0
+        quiz_settings = dict(getattr(settings, 'QUIZ_SETTINGS', {}),
+                             LOCK_RETRIES=0)
+        connection.close()
+        try:
+            with override_settings(QUIZ_SETTINGS=quiz_settings):
+                return self.run_scratch(options)
+        finally:
+            connection.close()
+            settings_dict.update(saved)
+
+    def write_report(self, report):
+        self.stdout.write(
+            "%d requests in %.2fs: %.1f requests/s, %d sittings completed "
+            "(%.1f/s)" % (report['requests'], report['elapsed'],
+                          report['requests_per_second'], report['sittings'],
+                          report['sittings_per_second']))
+        self.stdout.write("%d errors, %d failed on a locked database, %d "
+                          "writes retried after a lock error"
+                          % (report['errors'], report['locked'],
+                             report['lock_retries']))
+
+        self.stdout.write("\n%-8s %8s %9s %9s %9s %9s %8s %8s" % (
+            "request", "count", "p50 ms", "p90 ms", "p99 ms", "max ms",
+            "queries", "max q"))
+        rows = sorted(report['kinds'].items()) + [('all', report)]
+        for kind, figures in rows:
+            self.stdout.write("%-8s %8d %9s %9s %9s %9s %8s %8s" % (
+                kind, figures['requests'],
+                number(figures['p50']), number(figures['p90']),
+                number(figures['p99']), number(figures['max']),
+                number(figures['queries_mean']),
+                number(figures['queries_max'])))
+
+
+def number(value):
+    if value is None:
+        return '-'
+    return '%.1f' % value
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.connection import ConnectionDoesNotExist
+
+from quiz.routers import replica_alias, snapshot_database
+
+
+class Command(BaseCommand):
+    help = ("Copies the main SQLite database to the read replica the "
+            "catalog is read from. Run it after changing the catalog, or "
+            "periodically.")
+
+    def handle(self, *args, **options):
+        replica = replica_alias()
+        if replica is None:
+            raise CommandError("No read replica is configured "
+                               "(QUIZ_SETTINGS['READ_REPLICA']).")
+        try:
+            target = connections[replica]
+        except ConnectionDoesNotExist:
+            raise CommandError("The read replica %r is not in DATABASES."
+                               % replica)
+
+        source = connections[DEFAULT_DB_ALIAS]
+        if source.vendor != 'sqlite' or target.vendor != 'sqlite':
+            raise CommandError("Snapshots can only be taken between SQLite "
+                               "databases.")
+
+        # Its connection would keep reading the file being replaced.
+        target.close()
+        snapshot_database(source, target.settings_dict['NAME'])
+        self.stdout.write("Copied %s to %s." % (source.settings_dict['NAME'],
+                                                target.settings_dict['NAME']))
@@ -0,0 +1,191 @@
+"""
+Request metrics, by URL name, in the Prometheus text format.
+
+RequestMetricsMiddleware times every request and counts its queries and
+the time spent in them. The figures are added up in process, under the
+name of the URL pattern the request resolved to, and served by
+MetricsView. Each worker process keeps its own figures.
+
+The queries are counted by a wrapper installed on every database
+connection as it is opened (the module is loaded by QuizConfig.ready()).
+It finds the request through a context variable, so that queries run by
+async views in another thread are counted too.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+# Upper bounds of the latency histogram, in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+UNRESOLVED = '<unresolved>'
+
+_request = ContextVar('quiz_request_metrics', default=None)
+
+
+class RequestTimer(object):
+    __slots__ = ('queries', 'query_duration')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_duration = 0.0
+
+
+class ViewMetrics(object):
+    __slots__ = ('requests', 'buckets', 'duration', 'queries',
+                 'query_duration')
+
+    def __init__(self):
+        self.requests = 0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.duration = 0.0
+        self.queries = 0
+        self.query_duration = 0.0
+
+    def copy(self):
+        copy = ViewMetrics()
+        for name in self.__slots__:
+            value = getattr(self, name)
+            setattr(copy, name, list(value) if name == 'buckets' else value)
+        return copy
+
+
+COUNTERS = (
+    ('quiz_http_requests_total', 'requests', "Requests, by URL name."),
+    ('quiz_db_queries_total', 'queries', "Database queries, by URL name."),
+    ('quiz_db_query_duration_seconds_total', 'query_duration',
+     "Time spent in database queries, by URL name."),
+)
+
+
+class Registry(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def observe(self, view, duration, queries, query_duration):
+        bucket = bisect_left(BUCKETS, duration)
+        with self._lock:
+            metrics = self._views.get(view)
+            if metrics is None:
+                metrics = self._views[view] = ViewMetrics()
+            metrics.requests += 1
+            metrics.buckets[bucket] += 1
+            metrics.duration += duration
+            metrics.queries += queries
+            metrics.query_duration += query_duration
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+    def render(self):
+        """
+        Returns the figures in the Prometheus text exposition format.
+        """
+        with self._lock:
+            views = [(view, self._views[view].copy())
+                     for view in sorted(self._views)]
+
+        lines = [
+            '# HELP quiz_http_request_duration_seconds Time taken to '
+            'answer requests, by URL name.',
+            '# TYPE quiz_http_request_duration_seconds histogram',
+        ]
+        for view, metrics in views:
+            label = 'view="%s"' % escape(view)
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), metrics.buckets):
+                cumulative += count
+                lines.append(
+                    'quiz_http_request_duration_seconds_bucket{%s,le="%s"} %d'
+                    % (label, bound, cumulative))
+            lines.append('quiz_http_request_duration_seconds_sum{%s} %r'
+                         % (label, metrics.duration))
+            lines.append('quiz_http_request_duration_seconds_count{%s} %d'
+                         % (label, metrics.requests))
+
+        for name, attribute, help_text in COUNTERS:
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s counter' % name)
+            lines.extend('%s{view="%s"} %r'
+                         % (name, escape(view), getattr(metrics, attribute))
+                         for view, metrics in views)
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')\
+                .replace('\n', '\\n')
+
+
+registry = Registry()
+
+
+def time_query(execute, sql, params, many, context):
+    timer = _request.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timer.queries += 1
+        timer.query_duration += time.perf_counter() - start
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    # connection_created is sent again when a connection is reopened.
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+class RequestMetricsMiddleware(object):
+    """
+    Records the duration and the queries of every request. Put it first
+    in MIDDLEWARE so that the other middleware is measured too.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        timer = RequestTimer()
+        token = _request.set(timer)
+        start = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            self.observe(request, timer, time.perf_counter() - start)
+            _request.reset(token)
+
+    async def __acall__(self, request):
+        timer = RequestTimer()
+        token = _request.set(timer)
+        start = time.perf_counter()
+        try:
+            return await self.get_response(request)
+        finally:
+            self.observe(request, timer, time.perf_counter() - start)
+            _request.reset(token)
+
+    def observe(self, request, timer, duration):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match is not None else UNRESOLVED
+        registry.observe(view, duration, timer.queries, timer.query_duration)
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0002_remove_sitting_question_order_alter_category_id_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Bumped whenever the quiz or its questions change.', verbose_name='Version'),
+        ),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:44
+
+import re
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+SCORE_TRIPLE = re.compile(r'([^,]+),(\d+),(\d+),')
+
+
+def copy_progress_scores(apps, schema_editor):
+    """
+    Moves the "category,score,possible," triples of Progress.score into
+    CategoryScore rows. Triples naming an unknown category are dropped.
+    """
+    Progress = apps.get_model('quiz', 'Progress')
+    Category = apps.get_model('quiz', 'Category')
+    CategoryScore = apps.get_model('quiz', 'CategoryScore')
+
+    category_ids = dict(Category.objects.values_list('category', 'id'))
+    scores = []
+
+    for user_id, score in Progress.objects.values_list('user_id', 'score')\
+                                          .iterator():
+        totals = {}
+        for name, points, possible in SCORE_TRIPLE.findall(score or ''):
+            category_id = category_ids.get(name)
+            if category_id is None:
+                continue
+            current = totals.setdefault(category_id, [0, 0])
+            current[0] += int(points)
+            current[1] += int(possible)
+
+        scores.extend(CategoryScore(user_id=user_id, category_id=category_id,
+                                    score=points, possible=possible)
+                      for category_id, (points, possible) in totals.items())
+
+    CategoryScore.objects.bulk_create(scores, batch_size=500)
+
+
+def copy_category_scores(apps, schema_editor):
+    Progress = apps.get_model('quiz', 'Progress')
+    CategoryScore = apps.get_model('quiz', 'CategoryScore')
+
+    scores = {}
+    for user_id, name, points, possible in CategoryScore.objects\
+            .values_list('user_id', 'category__category', 'score', 'possible')\
+            .iterator():
+        scores[user_id] = scores.get(user_id, '') + \
+            '%s,%d,%d,' % (name, points, possible)
+
+    for user_id, score in scores.items():
+        Progress.objects.update_or_create(user_id=user_id,
+                                          defaults={'score': score})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0003_quiz_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.PositiveIntegerField(default=0, verbose_name='Score')),
+                ('possible', models.PositiveIntegerField(default=0, verbose_name='Possible Score')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='quiz.category', verbose_name='Category')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Category Score',
+                'verbose_name_plural': 'Category Scores',
+                'constraints': [models.UniqueConstraint(fields=('user', 'category'), name='unique_user_category_score')],
+            },
+        ),
+        # Lets the column be re-added to existing rows when migrating back.
+        migrations.AlterField(
+            model_name='progress',
+            name='score',
+            field=models.TextField(blank=True, default='', max_length=1024, verbose_name='Score'),
+        ),
+        migrations.RunPython(copy_progress_scores, copy_category_scores),
+        migrations.RemoveField(
+            model_name='progress',
+            name='score',
+        ),
+    ]
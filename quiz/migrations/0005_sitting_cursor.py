@@ -0,0 +1,64 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:45
+
+import django.core.validators
+import json
+import re
+
+from django.db import migrations, models
+
+
+def restore_question_order(apps, schema_editor):
+    """
+    question_list used to lose its head on every answer. Rebuilds the full
+    order from the answered questions, in the order they were answered,
+    followed by the remaining ones, and points the cursor past the answers.
+    """
+    Sitting = apps.get_model('quiz', 'Sitting')
+
+    for sitting in Sitting.objects.only('question_list', 'user_answers')\
+                                  .iterator():
+        remaining = [n for n in sitting.question_list.split(',') if n]
+        try:
+            answered = list(json.loads(sitting.user_answers or '{}'))
+        except ValueError:
+            answered = []
+        answered = [n for n in answered if n not in remaining]
+
+        if not answered:
+            continue
+
+        Sitting.objects.filter(pk=sitting.pk).update(
+            question_list=','.join(answered + remaining) + ',',
+            cursor=len(answered))
+
+
+def drop_answered_questions(apps, schema_editor):
+    Sitting = apps.get_model('quiz', 'Sitting')
+
+    for sitting in Sitting.objects.only('question_list', 'cursor')\
+                                  .iterator():
+        question_ids = [n for n in sitting.question_list.split(',') if n]
+        remaining = question_ids[sitting.cursor:]
+        Sitting.objects.filter(pk=sitting.pk).update(
+            question_list=','.join(remaining) + ',' if remaining else '')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0004_categoryscore'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sitting',
+            name='cursor',
+            field=models.PositiveIntegerField(default=0, help_text='Position of the next question in the question list.', verbose_name='Cursor'),
+        ),
+        migrations.AlterField(
+            model_name='sitting',
+            name='question_list',
+            field=models.TextField(help_text='Order of the questions, written once when the sitting starts.', validators=[django.core.validators.RegexValidator(re.compile('^\\d+(?:,\\d+)*\\Z'), code='invalid', message='Enter only digits separated by commas.')], verbose_name='Question List'),
+        ),
+        migrations.RunPython(restore_question_order, drop_answered_questions),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:54
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+QUESTION_TYPES = [
+    ('multichoice', 'MCQuestion'),
+    ('true_false', 'TF_Question'),
+    ('essay', 'Essay_Question'),
+]
+
+
+def count_questions(apps, schema_editor):
+    Quiz = apps.get_model('quiz', 'Quiz')
+    Question = apps.get_model('quiz', 'Question')
+
+    counts = {}
+    for app_label, model_name in QUESTION_TYPES:
+        question_class = apps.get_model(app_label, model_name)
+        rows = question_class.objects.order_by().values('quiz_id')\
+                                     .annotate(count=Count('pk'))
+        for row in rows:
+            counts.setdefault(row['quiz_id'], {})[model_name] = row['count']
+
+    rows = Question.objects.order_by().values('quiz_id')\
+                           .annotate(count=Count('pk'))
+    for row in rows:
+        Quiz.objects.filter(pk=row['quiz_id']).update(
+            question_count=row['count'],
+            question_type_counts=counts.get(row['quiz_id'], {}))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0005_sitting_cursor'),
+        ('multichoice', '0002_alter_answer_id'),
+        ('true_false', '0002_alter_tf_question_options_alter_tf_question_correct'),
+        ('essay', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='question_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Question count'),
+        ),
+        migrations.AddField(
+            model_name='quiz',
+            name='question_type_counts',
+            field=models.JSONField(default=dict, editable=False, help_text='Number of questions of each type, by class name.', verbose_name='Question type counts'),
+        ),
+        migrations.RunPython(count_questions, migrations.RunPython.noop),
+    ]
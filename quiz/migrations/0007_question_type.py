@@ -0,0 +1,41 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:56
+
+from django.db import migrations, models
+
+
+QUESTION_TYPES = [
+    ('multichoice', 'MCQuestion'),
+    ('true_false', 'TF_Question'),
+    ('essay', 'Essay_Question'),
+]
+
+
+def set_question_types(apps, schema_editor):
+    Question = apps.get_model('quiz', 'Question')
+
+    for app_label, model_name in QUESTION_TYPES:
+        question_class = apps.get_model(app_label, model_name)
+        Question.objects.filter(pk__in=question_class.objects.values('pk'))\
+                        .update(question_type=question_class._meta.label_lower)
+
+    Question.objects.filter(question_type='')\
+                    .update(question_type='quiz.question')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0006_quiz_question_counts'),
+        ('multichoice', '0002_alter_answer_id'),
+        ('true_false', '0002_alter_tf_question_options_alter_tf_question_correct'),
+        ('essay', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='question_type',
+            field=models.CharField(blank=True, editable=False, help_text='Label of the model of the question, set on save.', max_length=100, verbose_name='Question type'),
+        ),
+        migrations.RunPython(set_question_types, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0007_question_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sitting',
+            name='seed',
+            field=models.PositiveIntegerField(blank=True, editable=False, help_text='Seed of the random question draw, if any.', null=True, verbose_name='Seed'),
+        ),
+    ]
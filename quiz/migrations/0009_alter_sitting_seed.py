@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0008_sitting_seed'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sitting',
+            name='seed',
+            field=models.PositiveIntegerField(blank=True, editable=False, help_text='Seed of the random question draw and answer order.', null=True, verbose_name='Seed'),
+        ),
+    ]
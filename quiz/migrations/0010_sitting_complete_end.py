@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0009_alter_sitting_seed'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sitting',
+            index=models.Index(condition=models.Q(('complete', True)), fields=['-end', '-id'], name='sitting_complete_end'),
+        ),
+    ]
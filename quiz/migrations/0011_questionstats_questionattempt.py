@@ -0,0 +1,39 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0010_sitting_complete_end'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionStats',
+            fields=[
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='quiz.question', verbose_name='Question')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Attempts')),
+                ('correct', models.PositiveIntegerField(default=0, verbose_name='Correct answers')),
+            ],
+            options={
+                'verbose_name': 'Question Statistics',
+                'verbose_name_plural': 'Question Statistics',
+            },
+        ),
+        migrations.CreateModel(
+            name='QuestionAttempt',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('correct', models.BooleanField(verbose_name='Correct')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='quiz.question', verbose_name='Question')),
+                ('sitting', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='quiz.sitting', verbose_name='Sitting')),
+            ],
+            options={
+                'verbose_name': 'Question Attempt',
+                'verbose_name_plural': 'Question Attempts',
+            },
+        ),
+    ]
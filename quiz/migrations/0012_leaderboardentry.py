@@ -0,0 +1,69 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def percent(score, question_list):
+    """
+    Same as Sitting.get_percent_correct.
+    """
+    total = len([n for n in question_list.split(',') if n])
+    if total < 1:
+        return 0
+    return max(0, min(100, int(round(score / total * 100))))
+
+
+def fill_leaderboard(apps, schema_editor):
+    """
+    Enters the best completed sitting of each user on each quiz.
+    """
+    Sitting = apps.get_model('quiz', 'Sitting')
+    LeaderboardEntry = apps.get_model('quiz', 'LeaderboardEntry')
+
+    sittings = Sitting.objects.filter(complete=True)\
+        .order_by('quiz_id', 'user_id', '-current_score', 'end')\
+        .values_list('quiz_id', 'user_id', 'current_score', 'question_list',
+                     'end')
+
+    entries = []
+    last = None
+    for quiz_id, user_id, score, question_list, end in sittings.iterator():
+        if (quiz_id, user_id) == last:
+            continue
+        last = (quiz_id, user_id)
+        entries.append(LeaderboardEntry(
+            quiz_id=quiz_id, user_id=user_id, score=score,
+            percent=percent(score, question_list), achieved=end))
+
+    LeaderboardEntry.objects.bulk_create(entries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0011_questionstats_questionattempt'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.IntegerField(verbose_name='Score')),
+                ('percent', models.PositiveSmallIntegerField(verbose_name='Percent')),
+                ('achieved', models.DateTimeField(null=True, verbose_name='Achieved')),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='quiz.quiz', verbose_name='Quiz')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Leaderboard Entry',
+                'verbose_name_plural': 'Leaderboard Entries',
+                'indexes': [models.Index(fields=['quiz', '-score', 'achieved'], name='leaderboard_rank')],
+                'constraints': [models.UniqueConstraint(fields=('quiz', 'user'), name='unique_quiz_user_leaderboard')],
+            },
+        ),
+        migrations.RunPython(fill_leaderboard, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0013_catalogversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, help_text='Last change, for the validators of the catalog pages.', verbose_name='Updated'),
+        ),
+        migrations.AddField(
+            model_name='quiz',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, help_text='Last change to what the quiz pages show, for their validators.', verbose_name='Updated'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 03:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0014_updated_stamps'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='figure_derivatives',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Resized copies of the figure, built on save.', verbose_name='Figure derivatives'),
+        ),
+    ]
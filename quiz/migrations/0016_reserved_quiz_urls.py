@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-18 03:27
+
+import quiz.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0015_figure_derivatives'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='quiz',
+            name='url',
+            field=models.SlugField(help_text='a user friendly url', max_length=60, validators=[quiz.models.validate_quiz_url], verbose_name='user friendly url'),
+        ),
+    ]
@@ -1,17 +1,43 @@
 import re
 import json
+import uuid
+from contextlib import contextmanager
 
+from asgiref.sync import sync_to_async
+from django.apps import apps
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError, ImproperlyConfigured
 from django.core.validators import MaxValueValidator, validate_comma_separated_integer_list
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, FilteredRelation, Q, \
+    aprefetch_related_objects, prefetch_related_objects
 from django.utils.html import strip_tags
 from django.utils.translation import gettext_lazy as _
 from django.utils.timezone import now
 # Supprimé: from django.utils.encoding import python_2_unicode_compatible (obsolète dans Django 4.0+)
 
-from model_utils.managers import InheritanceManager
+from model_utils.managers import InheritanceManager, InheritanceQuerySet
+
+from . import figures, sampling, snapshot
+from .locking import retry_on_lock
+
+
+def update_or_insert(queryset, defaults, **updates):
+    """
+    Applies updates to the rows of queryset or, if there are none, inserts
+    a row with the fields in defaults. The update runs first, so that the
+    usual case takes a single statement and never races.
+    """
+    if queryset.update(**updates):
+        return
+
+    try:
+        with transaction.atomic():
+            queryset.create(**defaults)
+    except IntegrityError:
+        # Created concurrently by another request.
+        queryset.update(**updates)
 
 
 class CategoryManager(models.Manager):
@@ -32,6 +58,11 @@ class Category(models.Model):
         max_length=250, blank=True,
         unique=True, null=True)
 
+    updated = models.DateTimeField(
+        auto_now=True, verbose_name=_("Updated"),
+        help_text=_("Last change, for the validators of the catalog "
+                    "pages."))
+
     objects = CategoryManager()
 
     class Meta:
@@ -74,6 +105,61 @@ class SubCategory(models.Model):
         return self.sub_category
 
 
+class QuizManager(models.Manager):
+
+    def bump_version(self, quiz_ids):
+        """
+        Invalidates the compiled snapshots of the given quizzes.
+        """
+        quiz_ids = [quiz_id for quiz_id in set(quiz_ids) if quiz_id]
+        if not quiz_ids:
+            return
+
+        self.filter(pk__in=quiz_ids).update(version=F('version') + 1)
+        snapshot.evict(quiz_ids)
+
+    def refresh_question_counts(self, quiz_ids):
+        """
+        Recomputes the stored question counts of the given quizzes, in
+        total and per question type.
+        """
+        quiz_ids = [quiz_id for quiz_id in set(quiz_ids) if quiz_id]
+        if not quiz_ids:
+            return
+
+        totals = dict.fromkeys(quiz_ids, 0)
+        type_counts = {quiz_id: {} for quiz_id in quiz_ids}
+
+        rows = Question.objects.filter(quiz_id__in=quiz_ids).order_by()\
+                               .values_list('quiz_id', 'question_type')\
+                               .annotate(count=Count('pk'))
+        for quiz_id, question_type, count in rows:
+            totals[quiz_id] += count
+            question_class = question_model(question_type)
+            if question_class is not Question:
+                type_counts[quiz_id][question_class.__name__] = count
+
+        for quiz_id in quiz_ids:
+            self.filter(pk=quiz_id).update(
+                question_count=totals[quiz_id],
+                question_type_counts=type_counts[quiz_id],
+                updated=now())
+
+        # The counts are shown in the quiz lists.
+        CatalogVersion.objects.bump()
+
+
+# First segments of the pages of quiz.urls matched before the quiz pages,
+# which would hide a quiz with the same url.
+RESERVED_URLS = ('category', 'progress', 'marking', 'metrics', 'figures')
+
+
+def validate_quiz_url(value):
+    if value.lower() in RESERVED_URLS:
+        raise ValidationError(
+            _("%(url)s is the url of another page."), params={'url': value})
+
+
 # Django 5.2.4 - plus besoin de @python_2_unicode_compatible
 class Quiz(models.Model):
 
@@ -88,7 +174,8 @@ class Quiz(models.Model):
     url = models.SlugField(
         max_length=60, blank=False,
         help_text=_("a user friendly url"),
-        verbose_name=_("user friendly url"))
+        verbose_name=_("user friendly url"),
+        validators=[validate_quiz_url])
 
     category = models.ForeignKey(
         Category, null=True, blank=True,
@@ -147,6 +234,27 @@ class Quiz(models.Model):
                     " taken by users who can edit"
                     " quizzes."))
 
+    version = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name=_("Version"),
+        help_text=_("Bumped whenever the quiz or its questions change."))
+
+    question_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name=_("Question count"))
+
+    question_type_counts = models.JSONField(
+        default=dict, editable=False,
+        verbose_name=_("Question type counts"),
+        help_text=_("Number of questions of each type, by class name."))
+
+    updated = models.DateTimeField(
+        auto_now=True, verbose_name=_("Updated"),
+        help_text=_("Last change to what the quiz pages show, for their "
+                    "validators."))
+
+    objects = QuizManager()
+
     def save(self, force_insert=False, force_update=False, *args, **kwargs):
         self.url = re.sub(r'\s+', '-', self.url).lower()
 
@@ -156,11 +264,25 @@ class Quiz(models.Model):
         if self.single_attempt is True:
             self.exam_paper = True
 
+        validate_quiz_url(self.url)
+
         if self.pass_mark > 100:
             raise ValidationError('%s is above 100' % self.pass_mark)
 
+        bump_version = not self._state.adding and not force_insert
+        if bump_version:
+            # Bumped in SQL so that a stale instance never lowers the stamp.
+            self.version = F('version') + 1
+            # The counts are kept by the question signals, not the form.
+            self.question_count = F('question_count')
+            self.question_type_counts = F('question_type_counts')
+
         super(Quiz, self).save(force_insert, force_update, *args, **kwargs)
 
+        if bump_version:
+            self.refresh_from_db(fields=['version', 'question_count',
+                                         'question_type_counts'])
+
     class Meta:
         verbose_name = _("Quiz")
         verbose_name_plural = _("Quizzes")
@@ -169,27 +291,90 @@ class Quiz(models.Model):
         return self.title
 
     def get_questions(self):
-        return self.question_set.all().select_subclasses()
+        return self.question_set.typed()
+
+    def get_snapshot(self):
+        """
+        Returns the cached snapshot of the questions for the current version.
+        """
+        return snapshot.get_snapshot(self)
+
+    def get_question(self, question_id):
+        """
+        Returns a question of the quiz as its subclass, from the snapshot
+        when possible, with its answers loaded either way.
+        """
+        question = self.get_snapshot().get_question(question_id)
+        if question is None:
+            question = Question.objects.get_typed(id=question_id)
+            Question.objects.prefetch_answers([question])
+        return question
+
+    async def aget_snapshot(self):
+        return await snapshot.aget_snapshot(self)
+
+    async def aget_question(self, question_id):
+        question = (await self.aget_snapshot()).get_question(question_id)
+        if question is None:
+            question = await Question.objects.aget_typed(id=question_id)
+            # The async views cannot load the answers lazily.
+            await Question.objects.aprefetch_answers([question])
+        return question
 
     @property
     def get_max_score(self):
-        return self.get_questions().count()
+        return self.question_count
 
-    def anon_score_id(self):
-        return str(self.id) + "_score"
 
-    def anon_q_list(self):
-        return str(self.id) + "_q_list"
+class CatalogVersionManager(models.Manager):
 
-    def anon_q_data(self):
-        return str(self.id) + "_data"
+    def current(self):
+        """
+        Returns the current stamp of the catalog, None until the first
+        change.
+        """
+        return self.filter(pk=1).values_list('stamp', flat=True).first()
+
+    async def acurrent(self):
+        return await self.filter(pk=1).values_list('stamp', flat=True)\
+                                      .afirst()
+
+    def bump(self):
+        """
+        Gives the catalog a new stamp, creating the row on the first
+        change.
+        """
+        stamp = uuid.uuid4()
+        update_or_insert(self.filter(pk=1), dict(pk=1, stamp=stamp),
+                         stamp=stamp)
+
+
+class CatalogVersion(models.Model):
+    """
+    Stamp of the whole catalog, in a single row, which the cached catalog
+    pages are keyed on. It changes whenever a quiz or a category is saved
+    or deleted, or the question counts of a quiz are refreshed.
+
+    The stamp is random rather than a counter, so that it never comes
+    back, e.g. after a transaction is rolled back or a backup restored.
+    """
+    stamp = models.UUIDField(default=uuid.uuid4, editable=False,
+                             verbose_name=_("Stamp"))
+
+    objects = CatalogVersionManager()
+
+    class Meta:
+        verbose_name = _("Catalog version")
+        verbose_name_plural = _("Catalog versions")
+
+    def __str__(self):
+        return str(self.stamp)
 
 
 class ProgressManager(models.Manager):
 
     def new_progress(self, user):
-        new_progress = self.create(user=user,
-                                   score="")
+        new_progress = self.create(user=user)
         new_progress.save()
         return new_progress
 
@@ -200,16 +385,10 @@ class Progress(models.Model):
     Progress is used to track an individual signed in users score on different
     quiz's and categories
 
-    Data stored in csv using the format:
-        category, score, possible, category, score, possible, ...
+    The scores themselves are kept per category in CategoryScore.
     """
     user = models.OneToOneField(User, verbose_name=_("User"), on_delete=models.CASCADE)
 
-    score = models.TextField(
-        verbose_name=_("Score"),
-        max_length=1024,
-        validators=[validate_comma_separated_integer_list])
-
     objects = ProgressManager()
 
     class Meta:
@@ -217,86 +396,123 @@ class Progress(models.Model):
         verbose_name_plural = _("User progress records")
 
     def __str__(self):
-        return f"{self.user.username} - {self.score}"
+        return self.user.username
 
     @property
     def list_all_cat_scores(self):
         """
-        Returns a list of score strings
+        Returns a dict of category name: [score, possible, percent]
+        for every category, in a single query.
         """
-        score_before = self.score
-        output = {}
+        return CategoryScore.objects.all_for_user(self.user_id)
 
-        for x in score_before.split(','):
-            try:
-                cat = Category.objects.get(category=x)
-                score = score_before.split(x)[1].split(',')[1]
-                output[cat] = score
+    def update_score(self, question, score_to_add=0, possible_to_add=0):
+        """
+        Updates the progress score
+        """
+        category_id = question.category_id
 
-            except Category.DoesNotExist:
-                pass
+        if not isinstance(score_to_add, int) or \
+           not isinstance(possible_to_add, int):
+            return _("error"), _("invalid score")
 
-        return output
+        if category_id is not None:
+            CategoryScore.objects.add_score(self.user_id, category_id,
+                                            abs(score_to_add),
+                                            abs(possible_to_add))
 
-    def update_score(self, question, score_to_add=0, possible_to_add=0):
+    def show_exams(self):
         """
-        Updates the progress score
+        Finds the previous quizzes marked as 'exam papers'.
+        Returns a queryset of complete quizzes.
         """
-        category_test = Category.objects.filter(category=question.category)\
-                                        .exists()
+        return Sitting.objects.filter(user=self.user, complete=True)\
+                              .select_related('quiz')
 
-        if category_test:
 
-            to_find = re.escape(str(question.category)) + r",(?P<score>\d+),(?P<possible>\d+),"
+class CategoryScoreManager(models.Manager):
 
-            match = re.search(to_find, self.score, re.IGNORECASE)
+    def add_score(self, user_id, category_id, score_to_add, possible_to_add):
+        """
+        Atomically adds to the counters of a user in a category, creating
+        the row on the first answer.
+        """
+        update_or_insert(
+            self.filter(user_id=user_id, category_id=category_id),
+            dict(user_id=user_id, category_id=category_id,
+                 score=score_to_add, possible=possible_to_add),
+            score=F('score') + score_to_add,
+            possible=F('possible') + possible_to_add)
+
+    def all_for_user(self, user_id):
+        """
+        Returns a dict of category name: [score, possible, percent] for
+        every category, including the ones the user has not answered yet.
+        """
+        categories = Category.objects.annotate(
+            user_score=FilteredRelation(
+                'categoryscore',
+                condition=Q(categoryscore__user_id=user_id)))\
+            .values_list('category', 'user_score__score',
+                         'user_score__possible')\
+            .order_by('category')
 
-            if match:
-                updated_score = int(match.group('score')) + abs(score_to_add)
-                updated_possible = int(match.group('possible')) + abs(possible_to_add)
+        output = {}
+        for category, score, possible in categories:
+            score, possible = score or 0, possible or 0
+            percent = int(round(score / possible * 100)) if possible else 0
+            output[category] = [score, possible, percent]
 
-                new_score = f",{updated_score},{updated_possible},"
+        return output
 
-                self.score = re.sub(to_find, new_score, self.score,
-                                    flags=re.IGNORECASE)
-            else:
-                self.score += f"{question.category},{score_to_add},{possible_to_add},"
 
-        self.save()
+class CategoryScore(models.Model):
+    """
+    Running score of a signed in user in one category.
+    """
+    user = models.ForeignKey(User, verbose_name=_("User"),
+                             on_delete=models.CASCADE)
 
-    def show_exams(self):
-        """
-        Finds the previous quizzes marked as 'exam papers'.
-        Returns a queryset of complete quizzes.
-        """
-        return Sitting.objects.filter(user=self.user, complete=True)
+    category = models.ForeignKey(Category, verbose_name=_("Category"),
+                                 on_delete=models.CASCADE)
 
+    score = models.PositiveIntegerField(default=0, verbose_name=_("Score"))
 
-class SittingManager(models.Manager):
+    possible = models.PositiveIntegerField(default=0,
+                                           verbose_name=_("Possible Score"))
+
+    objects = CategoryScoreManager()
+
+    class Meta:
+        verbose_name = _("Category Score")
+        verbose_name_plural = _("Category Scores")
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'category'],
+                                    name='unique_user_category_score'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} - {self.category}: {self.score}/{self.possible}"
 
-    def new_sitting(self, user, quiz):
-        if quiz.random_order is True:
-            question_set = quiz.question_set.all() \
-                .select_subclasses() \
-                .order_by('?')
-        else:
-            question_set = quiz.question_set.all() \
-                .select_subclasses()
 
-        question_set = [item.id for item in question_set]
+class SittingManager(models.Manager):
 
-        if quiz.max_questions and quiz.max_questions < len(question_set):
-            question_set = question_set[:quiz.max_questions]
+    def new_sitting(self, user, quiz):
+        seed = sampling.new_seed()
+        question_set = sampling.draw_for_quiz(quiz, seed)
 
         questions = ",".join(map(str, question_set)) + ","
 
-        new_sitting = self.create(user=user,
-                                  quiz=quiz,
-                                  question_list=questions,
-                                  incorrect_questions="",
-                                  current_score=0,
-                                  complete=False,
-                                  user_answers='{}')
+        # Only the insert is retried, and holds the write lock.
+        new_sitting = retry_on_lock(self.create,
+                                    user=user,
+                                    quiz=quiz,
+                                    question_list=questions,
+                                    seed=seed,
+                                    incorrect_questions="",
+                                    current_score=0,
+                                    complete=False,
+                                    user_answers='{}')
         return new_sitting
 
     def user_sitting(self, user, quiz):
@@ -310,6 +526,22 @@ class SittingManager(models.Manager):
             sitting = self.new_sitting(user, quiz)
         except Sitting.MultipleObjectsReturned:
             sitting = self.filter(user=user, quiz=quiz, complete=False)[0]
+        sitting.quiz = quiz
+        return sitting
+
+    async def auser_sitting(self, user, quiz):
+        if quiz.single_attempt is True and await self.filter(
+                user=user, quiz=quiz, complete=True).aexists():
+            return False
+
+        try:
+            sitting = await self.aget(user=user, quiz=quiz, complete=False)
+        except Sitting.DoesNotExist:
+            sitting = await sync_to_async(self.new_sitting)(user, quiz)
+        except Sitting.MultipleObjectsReturned:
+            sitting = await self.filter(user=user, quiz=quiz,
+                                        complete=False).afirst()
+        sitting.quiz = quiz
         return sitting
 
 
@@ -326,7 +558,18 @@ class Sitting(models.Model):
 
     question_list = models.TextField(
         verbose_name=_("Question List"),
-        validators=[validate_comma_separated_integer_list])
+        validators=[validate_comma_separated_integer_list],
+        help_text=_("Order of the questions, written once when the"
+                    " sitting starts."))
+
+    cursor = models.PositiveIntegerField(
+        default=0, verbose_name=_("Cursor"),
+        help_text=_("Position of the next question in the question list."))
+
+    seed = models.PositiveIntegerField(
+        null=True, blank=True, editable=False,
+        verbose_name=_("Seed"),
+        help_text=_("Seed of the random question draw and answer order."))
 
     incorrect_questions = models.TextField(
         verbose_name=_("Incorrect questions"),
@@ -347,43 +590,118 @@ class Sitting(models.Model):
 
     objects = SittingManager()
 
+    # Set of field names waiting to be written, while in unit_of_work().
+    _pending_fields = None
+
+    _question_ids_cache = None
+
     class Meta:
         permissions = (("view_sittings", "Can see completed exams."),)
+        indexes = [
+            # Pages of the marking list, most recent first.
+            models.Index(fields=['-end', '-id'],
+                         condition=Q(complete=True),
+                         name='sitting_complete_end'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.quiz.title}"
 
+    @contextmanager
+    def unit_of_work(self):
+        """
+        Collects the changes made by the scoring methods inside the block
+        and writes them with a single UPDATE when it exits. The block runs
+        in one transaction, so other writes made in it (e.g. Progress)
+        are committed together with the sitting.
+        """
+        if self._pending_fields is not None:
+            yield self
+            return
+
+        with transaction.atomic():
+            self._pending_fields = set()
+            try:
+                yield self
+                fields = self._pending_fields
+            finally:
+                self._pending_fields = None
+
+            # The sitting may have been deleted inside the block.
+            if fields and self.pk is not None:
+                self.save(update_fields=sorted(fields))
+
+    def _save_fields(self, *fields):
+        if self._pending_fields is not None:
+            self._pending_fields.update(fields)
+        else:
+            self.save(update_fields=fields)
+
     def get_first_question(self):
         """
         Returns the next question.
         If no question is found, returns False
         Does NOT remove the question from the front of the list.
         """
-        if not self.question_list:
+        question_id = self.next_question_id
+        if question_id is None:
             return False
 
-        first, _ = self.question_list.split(',', 1)
-        question_id = int(first)
-        return Question.objects.get_subclass(id=question_id)
+        return self.quiz.get_question(question_id)
+
+    @property
+    def next_question_id(self):
+        question_ids = self._question_ids()
+        if self.cursor >= len(question_ids):
+            return None
+        return question_ids[self.cursor]
 
     def remove_first_question(self):
-        if not self.question_list:
+        if self.cursor >= len(self._question_ids()):
             return
 
-        _, others = self.question_list.split(',', 1)
-        self.question_list = others
-        self.save()
+        self.cursor += 1
+        self._save_fields('cursor')
 
     def add_to_score(self, points):
         self.current_score += int(points)
-        self.save()
+        self._save_fields('current_score')
 
     @property
     def get_current_score(self):
         return self.current_score
 
     def _question_ids(self):
-        return [int(n) for n in self.question_list.split(',') if n]
+        """
+        Returns the question order of the sitting, parsed once per instance.
+        """
+        cached = self._question_ids_cache
+        if cached is None or cached[0] != self.question_list:
+            cached = (self.question_list,
+                      tuple(int(n) for n in self.question_list.split(',')
+                            if n))
+            self._question_ids_cache = cached
+        return cached[1]
+
+    def progress(self):
+        """
+        Returns the number of questions answered and the total number
+        of questions in the sitting.
+        """
+        return self.cursor, len(self._question_ids())
+
+    @property
+    def answer_seed(self):
+        """
+        Seed of the answer order. Sittings started before seeds were
+        stored fall back to their id.
+        """
+        return self.seed if self.seed is not None else self.pk
+
+    @property
+    def questions_remaining(self):
+        answered, total = self.progress()
+        return total - answered
 
     @property
     def get_percent_correct(self):
@@ -405,7 +723,8 @@ class Sitting(models.Model):
     def mark_quiz_complete(self):
         self.complete = True
         self.end = now()
-        self.save()
+        self._save_fields('complete', 'end')
+        LeaderboardEntry.objects.record(self)
 
     def add_incorrect_question(self, question):
         """
@@ -417,7 +736,7 @@ class Sitting(models.Model):
         self.incorrect_questions += str(question.id) + ","
         if self.complete:
             self.add_to_score(-1)
-        self.save()
+        self._save_fields('incorrect_questions')
 
     @property
     def get_incorrect_questions(self):
@@ -432,7 +751,7 @@ class Sitting(models.Model):
         current.remove(question.id)
         self.incorrect_questions = ','.join(map(str, current))
         self.add_to_score(1)
-        self.save()
+        self._save_fields('incorrect_questions')
 
     @property
     def check_if_passed(self):
@@ -449,19 +768,267 @@ class Sitting(models.Model):
         current = json.loads(self.user_answers)
         current[question.id] = guess
         self.user_answers = json.dumps(current)
-        self.save()
+        self._save_fields('user_answers')
 
     def get_questions(self, with_answers=False):
-        question_ids = self._question_ids()
-        questions = sorted(
-            self.quiz.question_set.filter(id__in=question_ids)
-                                  .select_subclasses(),
-            key=lambda q: question_ids.index(q.id))
+        questions = self.quiz.question_set.in_order(self._question_ids())
 
         if with_answers:
             user_answers = json.loads(self.user_answers)
             for question in questions:
-                question.user_answer = user_answers[question.id]
+                question.user_answer = user_answers.get(str(question.id))
+
+        return questions
+
+
+class LeaderboardManager(models.Manager):
+
+    def record(self, sitting):
+        """
+        Enters the score of a completed sitting, if it beats the best
+        score of its user on the quiz.
+        """
+        score = sitting.current_score
+        best = dict(score=score, percent=sitting.get_percent_correct,
+                    achieved=sitting.end)
+        # When the insert fails, the user already has an entry: it is
+        # either as good, or was created concurrently by another request.
+        update_or_insert(
+            self.filter(quiz_id=sitting.quiz_id, user_id=sitting.user_id,
+                        score__lt=score),
+            dict(quiz_id=sitting.quiz_id, user_id=sitting.user_id, **best),
+            **best)
+
+    def rebuild(self, quiz, user):
+        """
+        Recomputes the entry of a user from their completed sittings, e.g.
+        after a sitting has been marked. Only exam papers keep every
+        sitting, so this is exact for those.
+        """
+        sitting = Sitting.objects.filter(quiz=quiz, user=user, complete=True)\
+                                 .order_by('-current_score', 'end').first()
+        if sitting is None:
+            self.filter(quiz=quiz, user=user).delete()
+            return
+
+        self.update_or_create(
+            quiz=quiz, user=user,
+            defaults=dict(score=sitting.current_score,
+                          percent=sitting.get_percent_correct,
+                          achieved=sitting.end))
+
+    def top_queryset(self, quiz, limit):
+        return self.filter(quiz=quiz).select_related('user')\
+                   .order_by('-score', 'achieved', 'id')[:limit]
+
+    def top(self, quiz, limit):
+        """
+        Returns the best entries of a quiz, ranked.
+        """
+        return self._ranked(list(self.top_queryset(quiz, limit)))
+
+    async def atop(self, quiz, limit):
+        return self._ranked([entry async for entry
+                             in self.top_queryset(quiz, limit)])
+
+    @staticmethod
+    def _ranked(entries):
+        # Equal scores share a rank, as in rank_of().
+        for position, entry in enumerate(entries):
+            previous = entries[position - 1] if position else None
+            if previous is not None and previous.score == entry.score:
+                entry.rank = previous.rank
+            else:
+                entry.rank = position + 1
+        return entries
+
+    def _better(self, entry):
+        return self.filter(quiz_id=entry.quiz_id, score__gt=entry.score)
+
+    def user_entry(self, quiz, user):
+        """
+        Returns the entry of a user on a quiz with its rank, or None.
+        """
+        if not user.is_authenticated:
+            return None
+        entry = self.filter(quiz=quiz, user=user).first()
+        if entry is not None:
+            entry.rank = self._better(entry).count() + 1
+        return entry
+
+    async def auser_entry(self, quiz, user):
+        if not user.is_authenticated:
+            return None
+        entry = await self.filter(quiz=quiz, user=user).afirst()
+        if entry is not None:
+            entry.rank = await self._better(entry).acount() + 1
+        return entry
+
+
+class LeaderboardEntry(models.Model):
+    """
+    Best score of a signed in user on a quiz.
+
+    Entries are kept up to date as sittings are completed, so that the
+    top of a quiz and the rank of a user are read from the (quiz, score)
+    index instead of sorting the sittings.
+    """
+    quiz = models.ForeignKey(Quiz, verbose_name=_("Quiz"),
+                             on_delete=models.CASCADE)
+
+    user = models.ForeignKey(User, verbose_name=_("User"),
+                             on_delete=models.CASCADE)
+
+    score = models.IntegerField(verbose_name=_("Score"))
+
+    percent = models.PositiveSmallIntegerField(verbose_name=_("Percent"))
+
+    achieved = models.DateTimeField(null=True, verbose_name=_("Achieved"))
+
+    objects = LeaderboardManager()
+
+    class Meta:
+        verbose_name = _("Leaderboard Entry")
+        verbose_name_plural = _("Leaderboard Entries")
+        constraints = [
+            models.UniqueConstraint(fields=['quiz', 'user'],
+                                    name='unique_quiz_user_leaderboard'),
+        ]
+        indexes = [
+            models.Index(fields=['quiz', '-score', 'achieved'],
+                         name='leaderboard_rank'),
+        ]
+
+    def __str__(self):
+        return f"{self.quiz} - {self.user}: {self.score}"
+
+
+def question_model(question_type):
+    """
+    Returns the model class stored in Question.question_type.
+    """
+    if not question_type:
+        return Question
+    return apps.get_model(question_type)
+
+
+class QuestionQuerySet(InheritanceQuerySet):
+
+    def typed(self, *related_fields):
+        """
+        Returns the questions as instances of their own type, in the order
+        of this queryset.
+
+        Unlike select_subclasses(), which joins every question type table,
+        this reads the ids and types from the question table and then runs
+        one query per type present, joining only that type's table.
+        """
+        rows = list(self.values_list('pk', 'question_type'))
+        return self._load_typed(rows, [
+            question for queryset in self._typed_querysets(rows,
+                                                           related_fields)
+            for question in queryset])
+
+    async def atyped(self, *related_fields):
+        rows = [row async for row in self.values_list('pk', 'question_type')]
+        return self._load_typed(rows, [
+            question for queryset in self._typed_querysets(rows,
+                                                           related_fields)
+            async for question in queryset])
+
+    def get_typed(self, *args, **kwargs):
+        """
+        Like get(), but returns the question as an instance of its own
+        type. Replaces get_subclass().
+        """
+        pk, question_type = self.filter(*args, **kwargs)\
+                                .values_list('pk', 'question_type').get()
+        return question_model(question_type)._base_manager.get(pk=pk)
+
+    async def aget_typed(self, *args, **kwargs):
+        pk, question_type = await self.filter(*args, **kwargs)\
+                                      .values_list('pk', 'question_type')\
+                                      .aget()
+        return await question_model(question_type)._base_manager.aget(pk=pk)
+
+    @staticmethod
+    def _typed_querysets(rows, related_fields):
+        by_type = {}
+        for pk, question_type in rows:
+            by_type.setdefault(question_type, []).append(pk)
+
+        for question_type, pks in by_type.items():
+            queryset = question_model(question_type)._base_manager\
+                                                    .filter(pk__in=pks)
+            if related_fields:
+                queryset = queryset.select_related(*related_fields)
+            yield queryset
+
+    @staticmethod
+    def _load_typed(rows, questions):
+        by_pk = {question.pk: question for question in questions}
+        return [by_pk[pk] for pk, question_type in rows if pk in by_pk]
+
+
+class QuestionManager(InheritanceManager):
+    _queryset_class = QuestionQuerySet
+
+    def typed(self, *related_fields):
+        return self.get_queryset().typed(*related_fields)
+
+    async def atyped(self, *related_fields):
+        return await self.get_queryset().atyped(*related_fields)
+
+    def get_typed(self, *args, **kwargs):
+        return self.get_queryset().get_typed(*args, **kwargs)
+
+    async def aget_typed(self, *args, **kwargs):
+        return await self.get_queryset().aget_typed(*args, **kwargs)
+
+    def prefetch_answers(self, questions):
+        """
+        Loads the related objects each question type declares in
+        prefetch_lookups, with one query per type and lookup.
+        """
+        by_class = {}
+        for question in questions:
+            by_class.setdefault(question.__class__, []).append(question)
+
+        for question_class, instances in by_class.items():
+            if question_class.prefetch_lookups:
+                prefetch_related_objects(instances,
+                                         *question_class.prefetch_lookups)
+
+        return questions
+
+    def in_order(self, question_ids):
+        """
+        Returns the questions with the given ids as their subclasses, in
+        the order of question_ids, with their answers prefetched. Ids with
+        no matching question are skipped.
+
+        The number of queries does not depend on the number of questions.
+        """
+        position = {question_id: index
+                    for index, question_id in enumerate(question_ids)}
+        ordered = [None] * len(question_ids)
+
+        for question in self.filter(id__in=list(position))\
+                            .typed('category', 'sub_category'):
+            ordered[position[question.id]] = question
+
+        return self.prefetch_answers([question for question in ordered
+                                      if question is not None])
+
+    async def aprefetch_answers(self, questions):
+        by_class = {}
+        for question in questions:
+            by_class.setdefault(question.__class__, []).append(question)
+
+        for question_class, instances in by_class.items():
+            if question_class.prefetch_lookups:
+                await aprefetch_related_objects(
+                    instances, *question_class.prefetch_lookups)
 
         return questions
 
@@ -485,6 +1052,11 @@ class Question(models.Model):
                               null=True,
                               verbose_name=_("Figure"))
 
+    figure_derivatives = models.JSONField(
+        default=dict, blank=True, editable=False,
+        verbose_name=_("Figure derivatives"),
+        help_text=_("Resized copies of the figure, built on save."))
+
     content = models.TextField(max_length=1000,
                               blank=False,
                               help_text=_("Enter the question text that "
@@ -498,12 +1070,120 @@ class Question(models.Model):
                                               "been answered."),
                                   verbose_name=_('Explanation'))
 
-    objects = InheritanceManager()
+    question_type = models.CharField(
+        max_length=100, blank=True, editable=False,
+        verbose_name=_("Question type"),
+        help_text=_("Label of the model of the question, set on save."))
+
+    objects = QuestionManager()
+
+    # Related lookups loaded along with the question when a quiz snapshot
+    # is built, e.g. the answer options of a multiple choice question.
+    prefetch_lookups = ()
 
     class Meta:
         verbose_name = _("Question")
         verbose_name_plural = _("Questions")
         ordering = ['category']
 
+    def save(self, *args, **kwargs):
+        if not self.question_type:
+            self.question_type = self._meta.label_lower
+        previous_derivatives = self.figure_derivatives
+        figures.prepare(self)
+        super(Question, self).save(*args, **kwargs)
+        figures.discard(previous_derivatives, kept=self.figure_derivatives)
+
+    def add_attempt(self, guess, is_correct, sitting=None):
+        """
+        Adds a graded answer to the item statistics of the question.
+        Answers given in a sitting are also logged one by one, for the
+        discrimination of the question (see quiz.item_analysis).
+        """
+        QuestionStats.objects.add_attempt(self.pk, is_correct is True)
+        self.count_choice(guess)
+
+        if sitting is not None:
+            QuestionAttempt.objects.create(question_id=self.pk,
+                                           sitting_id=sitting.pk,
+                                           correct=is_correct is True)
+
+    def count_choice(self, guess):
+        """
+        Counts the option picked by the guess, for question types that
+        offer options.
+        """
+        pass
+
     def __str__(self):
-        return self.content
\ No newline at end of file
+        return self.content
+
+
+class QuestionStatsManager(models.Manager):
+
+    def add_attempt(self, question_id, is_correct):
+        """
+        Atomically adds an answer to the counters of a question, creating
+        the row on the first answer.
+        """
+        update_or_insert(
+            self.filter(question_id=question_id),
+            dict(question_id=question_id, attempts=1,
+                 correct=int(is_correct)),
+            attempts=F('attempts') + 1,
+            correct=F('correct') + int(is_correct))
+
+
+class QuestionStats(models.Model):
+    """
+    Running answer counters of a question, from signed in and anonymous
+    users alike.
+    """
+    question = models.OneToOneField(Question, primary_key=True,
+                                    related_name='stats',
+                                    verbose_name=_("Question"),
+                                    on_delete=models.CASCADE)
+
+    attempts = models.PositiveIntegerField(default=0,
+                                           verbose_name=_("Attempts"))
+
+    correct = models.PositiveIntegerField(default=0,
+                                          verbose_name=_("Correct answers"))
+
+    objects = QuestionStatsManager()
+
+    class Meta:
+        verbose_name = _("Question Statistics")
+        verbose_name_plural = _("Question Statistics")
+
+    def __str__(self):
+        return f"{self.question}: {self.correct}/{self.attempts}"
+
+    @property
+    def difficulty(self):
+        """
+        Share of correct answers, or None before the first answer.
+        """
+        if not self.attempts:
+            return None
+        return self.correct / self.attempts
+
+
+class QuestionAttempt(models.Model):
+    """
+    One graded answer of a signed in user.
+    """
+    question = models.ForeignKey(Question, verbose_name=_("Question"),
+                                 on_delete=models.CASCADE)
+
+    # Sittings of quizzes that are not exam papers are deleted once they
+    # are complete, but their answers still count.
+    sitting = models.ForeignKey(Sitting, verbose_name=_("Sitting"),
+                                related_name='+', db_constraint=False,
+                                on_delete=models.DO_NOTHING)
+
+    correct = models.BooleanField(verbose_name=_("Correct"))
+
+    class Meta:
+        verbose_name = _("Question Attempt")
+        verbose_name_plural = _("Question Attempts")
\ No newline at end of file
@@ -0,0 +1,160 @@
+"""
+Routing of catalog reads to a read replica.
+
+The catalog (categories, quizzes, questions and their answers) is read by
+nearly every request and written rarely, by staff. CatalogRouter sends
+those reads to the database named by QUIZ_SETTINGS['READ_REPLICA'], e.g.
+a SQLite file copied from the main one with the snapshot_replica command,
+so that they do not wait on the writes of the students' sittings. Every
+write, and every read of the other models (sittings, progress, scores,
+sessions...), goes to the main database.
+
+The replica may lag behind. Once a request has written anything, its
+later reads all go to the main database, so that it sees its own writes.
+Reads made in a transaction go there too, and so do the reads made
+outside a request (management commands, the shell): requests are scoped
+by ReadYourWritesMiddleware.
+"""
+import os
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+CATALOG_MODELS = frozenset(['quiz.category', 'quiz.subcategory', 'quiz.quiz',
+                            'quiz.question', 'multichoice.answer',
+                            'quiz.catalogversion'])
+
+_scope = ContextVar('quiz_replica_scope', default=None)
+
+
+def replica_alias():
+    quiz_settings = getattr(settings, 'QUIZ_SETTINGS', {})
+    return quiz_settings.get('READ_REPLICA')
+
+
+def is_catalog(model):
+    """
+    Tells whether model is part of the catalog, counting every subclass
+    of Question.
+    """
+    return model._meta.label_lower in CATALOG_MODELS or any(
+        parent._meta.label_lower in CATALOG_MODELS
+        for parent in model._meta.get_parent_list())
+
+
+class RequestScope(object):
+    """
+    Routing state of one request: pinned once the request has written.
+    """
+    __slots__ = ('pinned',)
+
+    def __init__(self):
+        self.pinned = False
+
+
+@contextmanager
+def request_scope():
+    """
+    Lets the reads made inside the block go to the replica, until the
+    first write.
+    """
+    token = _scope.set(RequestScope())
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+class CatalogRouter(object):
+
+    def db_for_read(self, model, **hints):
+        replica = replica_alias()
+        if replica is None:
+            return None
+        if is_catalog(model) and self.use_replica():
+            return replica
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        if replica_alias() is None:
+            return None
+        scope = _scope.get()
+        if scope is not None:
+            scope.pinned = True
+        # Not the database of the instance: it may come from the replica.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        replica = replica_alias()
+        if replica is None:
+            return None
+        databases = {DEFAULT_DB_ALIAS, replica}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica is a copy of the main database, migrations included.
+        if db == replica_alias():
+            return False
+        return None
+
+    def use_replica(self):
+        scope = _scope.get()
+        return scope is not None and not scope.pinned and \
+            not connections[DEFAULT_DB_ALIAS].in_atomic_block
+
+
+class ReadYourWritesMiddleware(object):
+    """
+    Opens the routing scope of each request. Without it, every read goes
+    to the main database.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        with request_scope():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with request_scope():
+            return await self.get_response(request)
+
+
+def snapshot_database(source, path):
+    """
+    Copies the SQLite database of the connection source to path, through
+    a temporary file so that readers of path never see a partial copy.
+    """
+    source.ensure_connection()
+    directory = os.path.dirname(os.path.abspath(path))
+    descriptor, temporary = tempfile.mkstemp(dir=directory,
+                                             suffix='.sqlite3')
+    os.close(descriptor)
+    try:
+        target = sqlite3.connect(temporary)
+        try:
+            source.connection.backup(target)
+            # A single file, readable without its -wal and -shm files.
+            target.execute('PRAGMA journal_mode=DELETE')
+        finally:
+            target.close()
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
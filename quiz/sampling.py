@@ -0,0 +1,62 @@
+"""
+Drawing the questions of a new sitting, and ordering answers.
+
+The draw works on the question ids of the quiz, taken from its snapshot
+when it is cached, so starting a sitting does not load the questions.
+Every sitting gets a seed, stored
+with it, from which the random question draw and the order of the answers
+of each question are derived. The same seed gives the same questions and
+answer orders, across reloads and for later review.
+"""
+import random
+
+from . import snapshot
+
+
+SEED_BITS = 31
+
+
+def new_seed():
+    return random.SystemRandom().getrandbits(SEED_BITS)
+
+
+def draw(question_ids, limit=None, seed=None):
+    """
+    Returns up to limit ids from question_ids. Without a seed the first
+    ones are kept in order, with a seed they are sampled at random.
+
+    The sample is taken from the ids sorted, so that a seed draws the same
+    questions whatever order the database returned them in (ties of the
+    category ordering are not stable across backends).
+    """
+    question_ids = list(question_ids)
+    if not limit or limit > len(question_ids):
+        limit = len(question_ids)
+
+    if seed is None:
+        return question_ids[:limit]
+
+    return random.Random(seed).sample(sorted(question_ids), limit)
+
+
+def draw_for_quiz(quiz, seed, question_ids=None):
+    """
+    Draws the questions of a new sitting of the quiz, following its
+    random_order and max_questions settings.
+    """
+    if question_ids is None:
+        question_ids = snapshot.question_ids(quiz)
+
+    if quiz.random_order is not True:
+        seed = None
+    return draw(question_ids, quiz.max_questions, seed)
+
+
+def shuffle(items, seed, question_id):
+    """
+    Returns the items in an order that only depends on the seed of the
+    sitting and on the question.
+    """
+    items = list(items)
+    random.Random('%s:%s' % (seed, question_id)).shuffle(items)
+    return items
@@ -0,0 +1,142 @@
+"""
+Keeps the quiz version stamps in step with the catalog.
+
+Any change to a quiz, one of its questions or one of their answers bumps
+the version of the affected quizzes, which invalidates their compiled
+snapshots (see quiz.snapshot). Adding, removing or moving a question also
+refreshes the question counts stored on its quizzes.
+
+Saving or deleting a quiz or a category also gives the catalog a new
+stamp, which the cached catalog pages are keyed on (see quiz.views).
+Deleting a question removes the copies of its figure (see quiz.figures).
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import figures, snapshot
+from .models import CatalogVersion, Category, Question, Quiz
+
+
+# Set within batched_question_changes().
+_batch = ContextVar('question_batch', default=None)
+
+
+@receiver(post_save, sender=Quiz)
+@receiver(post_delete, sender=Quiz)
+def quiz_changed(sender, instance, **kwargs):
+    snapshot.evict([instance.pk])
+
+
+@receiver(post_save, sender=Quiz)
+@receiver(post_delete, sender=Quiz)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def catalog_changed(sender, **kwargs):
+    CatalogVersion.objects.bump()
+
+
+def remember_question_quiz(sender, instance, raw=False, **kwargs):
+    """
+    Records the quiz a question belonged to before it is saved, so that
+    moving a question to another quiz invalidates both of them.
+    """
+    if raw or instance.pk is None:
+        return
+
+    instance._previous_quiz_id = Question.objects.filter(pk=instance.pk)\
+        .values_list('quiz_id', flat=True).first()
+
+
+def question_changed(sender, instance, created=True, **kwargs):
+    """
+    Deleted questions come without created, like new ones: both change
+    the counts of their quiz.
+    """
+    previous_quiz_id = getattr(instance, '_previous_quiz_id', None)
+    quiz_ids = [instance.quiz_id, previous_quiz_id]
+    batch = _batch.get()
+    if batch is not None:
+        batch['quiz_ids'].update(quiz_ids)
+        return
+
+    Quiz.objects.bump_version(quiz_ids)
+    # Edits leave the counts, and the catalog pages, as they were.
+    if created or previous_quiz_id != instance.quiz_id:
+        Quiz.objects.refresh_question_counts(quiz_ids)
+
+
+def question_deleted(sender, instance, **kwargs):
+    batch = _batch.get()
+    if batch is not None:
+        batch['figures'] |= figures.copy_names(instance.figure_derivatives)
+        return
+
+    figures.discard(instance.figure_derivatives)
+
+
+@contextmanager
+def batched_question_changes():
+    """
+    Runs the work of the question receivers once, at the end of the block,
+    for all the questions saved or deleted in it, rather than once per
+    question: e.g. for the bulk delete of a bank import.
+    """
+    batch = {'quiz_ids': set(), 'question_ids': set(), 'figures': set()}
+    token = _batch.set(batch)
+    try:
+        yield
+    finally:
+        _batch.reset(token)
+
+    if batch['question_ids']:
+        batch['quiz_ids'].update(
+            Question.objects.filter(pk__in=batch['question_ids'])
+                            .values_list('quiz_id', flat=True))
+    Quiz.objects.bump_version(batch['quiz_ids'])
+    Quiz.objects.refresh_question_counts(batch['quiz_ids'])
+    figures.remove_on_commit(batch['figures'])
+
+
+def connect_question_receivers():
+    """
+    Connects the question receivers to each concrete question model, once
+    they are all loaded. Receivers without a sender would be called for
+    every model, and would keep Django from deleting the rows of any model
+    in bulk.
+    """
+    for question_class in [Question] + Question.__subclasses__():
+        pre_save.connect(remember_question_quiz, sender=question_class)
+        post_save.connect(question_changed, sender=question_class)
+    # Deleting a question of any type also deletes its Question row.
+    post_delete.connect(question_changed, sender=Question)
+    post_delete.connect(question_deleted, sender=Question)
+
+
+@receiver(post_save, sender='multichoice.Answer')
+@receiver(post_delete, sender='multichoice.Answer')
+def answer_changed(sender, instance, **kwargs):
+    batch = _batch.get()
+    if batch is not None:
+        batch['question_ids'].add(instance.question_id)
+        return
+
+    Quiz.objects.bump_version(
+        Question.objects.filter(pk=instance.question_id)
+                        .values_list('quiz_id', flat=True))
+
+
+@receiver(post_save, sender=Category)
+def category_changed(sender, instance, created=False, **kwargs):
+    if created:
+        return
+
+    quiz_ids = set(Question.objects.filter(category=instance)
+                                   .order_by().values_list('quiz_id',
+                                                           flat=True))
+    # The quiz pages show the name of their category.
+    quiz_ids.update(Quiz.objects.filter(category=instance)
+                                .values_list('pk', flat=True))
+    Quiz.objects.bump_version(quiz_ids)
@@ -0,0 +1,155 @@
+"""
+In-process cache of compiled quiz snapshots.
+
+A snapshot holds every question of a quiz as its concrete subclass, with
+the category and the answer options already loaded, so that taking and
+grading a question does not need to query the catalog tables.
+
+Snapshots are keyed on the quiz ``version`` stamp, which is bumped whenever
+the quiz, one of its questions or one of their answers is saved or deleted
+(see quiz.signals). A stale entry is simply rebuilt on the next lookup.
+"""
+import threading
+from collections import OrderedDict
+from types import MappingProxyType
+
+from django.conf import settings
+
+
+DEFAULT_CACHE_SIZE = 64
+
+_lock = threading.Lock()
+_snapshots = OrderedDict()
+
+
+class QuizSnapshot(object):
+    """
+    Immutable collection of the questions of a quiz at a given version.
+
+    The question instances are shared between requests and threads and
+    must be treated as read-only.
+    """
+    __slots__ = ('quiz_id', 'version', 'questions', 'question_ids', '_by_id')
+
+    def __init__(self, quiz_id, version, questions):
+        questions = tuple(questions)
+        object.__setattr__(self, 'quiz_id', quiz_id)
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, 'questions', questions)
+        object.__setattr__(self, 'question_ids',
+                           tuple(question.id for question in questions))
+        object.__setattr__(self, '_by_id', MappingProxyType(
+            {question.id: question for question in questions}))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("QuizSnapshot is immutable")
+
+    def __len__(self):
+        return len(self.questions)
+
+    def __contains__(self, question_id):
+        return question_id in self._by_id
+
+    def get_question(self, question_id):
+        """
+        Returns the question with the given id, or None if it is not part
+        of the quiz.
+        """
+        return self._by_id.get(question_id)
+
+
+def _cache_size():
+    quiz_settings = getattr(settings, 'QUIZ_SETTINGS', {})
+    return quiz_settings.get('SNAPSHOT_CACHE_SIZE', DEFAULT_CACHE_SIZE)
+
+
+def build_snapshot(quiz):
+    """
+    Loads the questions of a quiz, with their answers, into a new snapshot.
+    """
+    from .models import Question
+
+    questions = _question_queryset(quiz).typed('category', 'sub_category')
+    Question.objects.prefetch_answers(questions)
+
+    return QuizSnapshot(quiz.pk, quiz.version, questions)
+
+
+async def abuild_snapshot(quiz):
+    from .models import Question
+
+    questions = await _question_queryset(quiz).atyped('category',
+                                                      'sub_category')
+    await Question.objects.aprefetch_answers(questions)
+
+    return QuizSnapshot(quiz.pk, quiz.version, questions)
+
+
+def _question_queryset(quiz):
+    from .models import Question
+
+    return Question.objects.filter(quiz_id=quiz.pk)
+
+
+def _cached(quiz):
+    with _lock:
+        snapshot = _snapshots.get(quiz.pk)
+        if snapshot is not None and snapshot.version == quiz.version:
+            _snapshots.move_to_end(quiz.pk)
+            return snapshot
+    return None
+
+
+def _store(snapshot):
+    with _lock:
+        current = _snapshots.get(snapshot.quiz_id)
+        if current is None or current.version <= snapshot.version:
+            _snapshots[snapshot.quiz_id] = snapshot
+            _snapshots.move_to_end(snapshot.quiz_id)
+        while len(_snapshots) > _cache_size():
+            _snapshots.popitem(last=False)
+    return snapshot
+
+
+def get_snapshot(quiz):
+    """
+    Returns the snapshot matching the current version of the quiz,
+    building it if it is not cached yet.
+    """
+    snapshot = _cached(quiz)
+    if snapshot is None:
+        snapshot = _store(build_snapshot(quiz))
+    return snapshot
+
+
+def question_ids(quiz):
+    """
+    Returns the question ids of the quiz, in the order of its snapshot:
+    from the snapshot when it is cached, otherwise from the question table
+    alone rather than by building the snapshot.
+    """
+    snapshot = _cached(quiz)
+    if snapshot is not None:
+        return snapshot.question_ids
+    return tuple(_question_queryset(quiz).values_list('pk', flat=True))
+
+
+async def aget_snapshot(quiz):
+    snapshot = _cached(quiz)
+    if snapshot is None:
+        snapshot = _store(await abuild_snapshot(quiz))
+    return snapshot
+
+
+def evict(quiz_ids):
+    """
+    Drops the cached snapshots of the given quizzes from this process.
+    """
+    with _lock:
+        for quiz_id in quiz_ids:
+            _snapshots.pop(quiz_id, None)
+
+
+def clear():
+    with _lock:
+        _snapshots.clear()
@@ -1,4 +1,7 @@
 from django import template
+from django.core.exceptions import ObjectDoesNotExist
+
+from quiz import figures
 
 register = template.Library()
 
@@ -8,8 +11,11 @@ def correct_answer_for_all(context, question):
     """
     processes the correct answer based on a given question object
     if the answer is incorrect, informs the user
+
+    The answers are read from the question, so the views prefetch them
+    for every question of the page (see QuestionManager.in_order).
     """
-    answers = question.get_answers()
+    answers = question.get_answers(context.get('answer_seed'))
     incorrect_list = context.get('incorrect_questions', [])
     if question.id in incorrect_list:
         user_was_incorrect = True
@@ -20,6 +26,29 @@ def correct_answer_for_all(context, question):
             'user_was_incorrect': user_was_incorrect}
 
 
+@register.inclusion_tag('figure.html')
+def question_figure(question, alt, sizes='100vw'):
+    """
+    Shows the figure of a question from its resized copies, in WebP for
+    the browsers that take it, loaded once it is about to be seen. sizes
+    is the width the figure takes on the page, for the browser to pick a
+    copy.
+    """
+    return {'figure': question.figure,
+            'sources': figures.sources(question),
+            'alt': alt,
+            'sizes': sizes}
+
+
 @register.filter
 def answer_choice_to_string(question, answer):
-    return question.answer_choice_to_string(answer)
+    """
+    Unanswered questions and answers that have since been deleted are
+    shown as blank rather than breaking the page.
+    """
+    if answer is None or answer == '':
+        return ''
+    try:
+        return question.answer_choice_to_string(answer)
+    except ObjectDoesNotExist:
+        return ''
@@ -1,28 +1,62 @@
 # -*- coding: iso-8859-15 -*-
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
 from importlib import import_module
+from io import BytesIO, StringIO
+from unittest import skipIf, skipUnless
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.contrib.auth.models import User, Permission
-from django.core.exceptions import ValidationError
+from django.contrib.auth.models import AnonymousUser, User, Permission
+from django.contrib.sessions.models import Session
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.core.cache import cache
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError, connection, connections, \
+    transaction
+from django.db.models import F, Value
+from django.db.models.deletion import Collector
 try:
     from django.core.urlresolvers import resolve
 except ImportError:
     from django.urls import resolve
-from django.http import HttpRequest
+from django.http import Http404, HttpRequest, QueryDict
 from django.template import Template, Context
-from django.test import TestCase
-from django.utils.six import StringIO
-from django.utils.translation import ugettext_lazy as _
-
-from .models import Category, Quiz, Progress, Sitting, SubCategory
+from django.test import AsyncRequestFactory, Client, RequestFactory, \
+    SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+from django.utils.translation import gettext_lazy as _
+from PIL import Image
+
+from . import figures, loadtest, locking, metrics, routers, sampling, \
+    snapshot
+from .anon import AnonSitting, max_questions
+from .bank import BankImporter
+from .async_views import AsyncQuizListView, AsyncQuizDetailView, \
+    AsyncQuizTake
+from .models import (CatalogVersion, Category, CategoryScore,
+                     LeaderboardEntry, Quiz,
+                     Progress, Question, QuestionAttempt, QuestionStats,
+                     Sitting, SubCategory, update_or_insert)
 from .views import (anon_session_score, QuizListView, CategoriesListView,
-                    QuizDetailView)
+                    QuizDetailView, QuizMarkingList, marking_cursor)
 
 from multichoice.models import MCQuestion, Answer
 from true_false.models import TF_Question
 from essay.models import Essay_Question
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class TestCategory(TestCase):
     def setUp(self):
@@ -94,12 +128,6 @@ class TestQuiz(TestCase):
     def test_get_questions(self):
         self.assertIn(self.question1, self.quiz1.get_questions())
 
-    def test_anon_score_id(self):
-        self.assertEqual(self.quiz1.anon_score_id(), '1_score')
-
-    def test_anon_q_list(self):
-        self.assertEqual(self.quiz1.anon_q_list(), '1_q_list')
-
     def test_pass_mark(self):
         self.assertEqual(self.quiz1.pass_mark, False)
         self.quiz1.pass_mark = 50
@@ -109,6 +137,1274 @@ class TestQuiz(TestCase):
             self.quiz1.save()
 
 
+class TestQuizSnapshot(TestCase):
+    def setUp(self):
+        self.c1 = Category.objects.new_category(category='elderberries')
+
+        self.quiz1 = Quiz.objects.create(id=1,
+                                         title='test quiz 1',
+                                         description='d1',
+                                         url='tq1')
+
+        self.question1 = MCQuestion.objects.create(id=1,
+                                                   content='squawk',
+                                                   category=self.c1,
+                                                   quiz=self.quiz1,
+                                                   answer_order='content')
+        self.answer1 = Answer.objects.create(id=123,
+                                             question=self.question1,
+                                             content='bing',
+                                             correct=False)
+        self.answer2 = Answer.objects.create(id=456,
+                                             question=self.question1,
+                                             content='bong',
+                                             correct=True)
+
+        self.question2 = TF_Question.objects.create(id=2,
+                                                    content='oink',
+                                                    quiz=self.quiz1,
+                                                    correct=True)
+        self.quiz1.refresh_from_db()
+
+    def test_warm_snapshot_needs_no_queries(self):
+        self.quiz1.get_snapshot()
+
+        with self.assertNumQueries(0):
+            question = self.quiz1.get_question(1)
+            self.assertIsInstance(question, MCQuestion)
+            self.assertEqual(question.category.category, 'elderberries')
+            self.assertEqual(question.get_answers_list(),
+                             [(123, 'bing'), (456, 'bong')])
+            self.assertIs(question.check_if_correct('456'), True)
+            self.assertIs(question.check_if_correct('123'), False)
+            self.assertEqual(question.answer_choice_to_string('123'), 'bing')
+            self.assertIn(self.answer2, question.get_answers())
+
+            tf_question = self.quiz1.get_question(2)
+            self.assertIsInstance(tf_question, TF_Question)
+            self.assertIs(tf_question.check_if_correct('True'), True)
+
+    def test_snapshot_is_immutable(self):
+        snapshot = self.quiz1.get_snapshot()
+
+        self.assertEqual(sorted(snapshot.question_ids), [1, 2])
+        with self.assertRaises(AttributeError):
+            snapshot.version = 10
+
+    def test_answer_change_bumps_version(self):
+        before = self.quiz1.get_snapshot()
+
+        self.answer1.correct = True
+        self.answer1.save()
+        self.quiz1.refresh_from_db()
+
+        self.assertGreater(self.quiz1.version, before.version)
+        self.assertIs(self.quiz1.get_question(1).check_if_correct(123), True)
+
+    def test_question_moved_bumps_both_quizzes(self):
+        quiz2 = Quiz.objects.create(id=2,
+                                    title='test quiz 2',
+                                    description='d2',
+                                    url='tq2')
+        self.quiz1.get_snapshot()
+        quiz2.get_snapshot()
+
+        self.question2.quiz = quiz2
+        self.question2.save()
+        self.quiz1.refresh_from_db()
+        quiz2.refresh_from_db()
+
+        self.assertEqual(self.quiz1.get_snapshot().question_ids, (1,))
+        self.assertEqual(quiz2.get_snapshot().question_ids, (2,))
+
+    def test_quiz_save_never_lowers_version(self):
+        stale = Quiz.objects.get(id=1)
+        Answer.objects.create(question=self.question1, content='bang')
+        fresh_version = Quiz.objects.get(id=1).version
+
+        stale.save()
+
+        self.assertGreater(stale.version, fresh_version)
+
+
+class TestQuestionCounts(TestCase):
+    def setUp(self):
+        self.quiz1 = Quiz.objects.create(id=1,
+                                         title='test quiz 1',
+                                         description='d1',
+                                         url='tq1')
+        self.quiz2 = Quiz.objects.create(id=2,
+                                         title='test quiz 2',
+                                         description='d2',
+                                         url='tq2')
+
+        self.question1 = MCQuestion.objects.create(id=1,
+                                                   content='squawk',
+                                                   quiz=self.quiz1)
+        self.question2 = TF_Question.objects.create(id=2,
+                                                    content='oink',
+                                                    quiz=self.quiz1,
+                                                    correct=True)
+
+    def counts(self, quiz):
+        quiz.refresh_from_db()
+        return quiz.question_count, quiz.question_type_counts
+
+    def test_counts_follow_questions(self):
+        self.assertEqual(self.counts(self.quiz1),
+                         (2, {'MCQuestion': 1, 'TF_Question': 1}))
+
+        self.question2.quiz = self.quiz2
+        self.question2.save()
+        self.assertEqual(self.counts(self.quiz1), (1, {'MCQuestion': 1}))
+        self.assertEqual(self.counts(self.quiz2), (1, {'TF_Question': 1}))
+
+        self.question1.delete()
+        self.assertEqual(self.counts(self.quiz1), (0, {}))
+
+    def test_edit_keeps_counts_and_catalog(self):
+        stamp = CatalogVersion.objects.current()
+        version = Quiz.objects.get(id=1).version
+
+        with CaptureQueriesContext(connection) as queries:
+            self.question2.content = 'oink oink'
+            self.question2.save()
+
+        self.assertEqual(CatalogVersion.objects.current(), stamp)
+        self.assertEqual(Quiz.objects.get(id=1).version, version + 1)
+        self.assertFalse([query for query in queries
+                          if 'COUNT(' in query['sql']])
+
+    def test_quiz_save_keeps_counts(self):
+        stale = Quiz.objects.get(id=2)
+        Essay_Question.objects.create(content='moo', quiz=self.quiz2)
+
+        stale.title = 'renamed'
+        stale.save()
+
+        self.assertEqual(stale.question_count, 1)
+        self.assertEqual(self.counts(self.quiz2),
+                         (1, {'Essay_Question': 1}))
+
+    def test_max_score(self):
+        quiz = Quiz.objects.get(id=1)
+        with self.assertNumQueries(0):
+            self.assertEqual(quiz.get_max_score, 2)
+
+    def test_admin_form_moves_questions(self):
+        from .admin import QuizAdminForm
+
+        form = QuizAdminForm(instance=self.quiz2, data={
+            'title': 'test quiz 2', 'description': 'd2', 'url': 'tq2',
+            'answers_at_end': False, 'pass_mark': 0,
+            'questions': [self.question1.id]})
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+
+        self.assertEqual(self.counts(self.quiz1), (1, {'TF_Question': 1}))
+        self.assertEqual(self.counts(self.quiz2), (1, {'MCQuestion': 1}))
+
+    def test_other_models_deleted_in_bulk(self):
+        collector = Collector(using='default')
+
+        self.assertTrue(collector.can_fast_delete(Session.objects.all()))
+        self.assertTrue(
+            collector.can_fast_delete(QuestionAttempt.objects.all()))
+
+
+class TestTypedQuestionLoading(TestCase):
+    def setUp(self):
+        self.quiz1 = Quiz.objects.create(id=1,
+                                         title='test quiz 1',
+                                         description='d1',
+                                         url='tq1')
+
+        self.question1 = MCQuestion.objects.create(id=1,
+                                                   content='squawk',
+                                                   quiz=self.quiz1)
+        self.question2 = TF_Question.objects.create(id=2,
+                                                    content='oink',
+                                                    quiz=self.quiz1,
+                                                    correct=True)
+        self.question3 = MCQuestion.objects.create(id=3,
+                                                   content='moo',
+                                                   quiz=self.quiz1)
+
+    def test_question_type_set_on_save(self):
+        self.assertEqual(Question.objects.get(id=1).question_type,
+                         'multichoice.mcquestion')
+        self.assertEqual(Question.objects.get(id=2).question_type,
+                         'true_false.tf_question')
+
+        # Saving through the base model keeps the stored type.
+        Question.objects.get(id=1).save()
+        self.assertEqual(Question.objects.get(id=1).question_type,
+                         'multichoice.mcquestion')
+
+    def test_typed(self):
+        with CaptureQueriesContext(connection) as queries:
+            questions = Question.objects.filter(quiz=self.quiz1)\
+                                        .order_by('-id').typed()
+
+        self.assertEqual([(q.id, q.__class__) for q in questions],
+                         [(3, MCQuestion), (2, TF_Question),
+                          (1, MCQuestion)])
+        # One query for the ids and types, then one per type, each joining
+        # only its own table.
+        self.assertEqual(len(queries), 3)
+        for query in queries[1:]:
+            self.assertFalse('multichoice' in query['sql'] and
+                             'true_false' in query['sql'])
+
+    def test_get_typed(self):
+        question = Question.objects.get_typed(id=2)
+        self.assertEqual(question.__class__, TF_Question)
+        self.assertTrue(question.correct)
+
+        with self.assertRaises(Question.DoesNotExist):
+            Question.objects.get_typed(id=4)
+
+    async def test_atyped(self):
+        questions = await Question.objects.filter(quiz=self.quiz1)\
+                                          .order_by('id').atyped()
+        self.assertEqual([q.__class__ for q in questions],
+                         [MCQuestion, TF_Question, MCQuestion])
+
+        question = await Question.objects.aget_typed(id=3)
+        self.assertEqual(question.content, 'moo')
+
+
+class TestQuizAdminQuestionPicker(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin',
+                                                   email='a@a.com',
+                                                   password='pw')
+        self.client.login(username='admin', password='pw')
+        self.c1 = Category.objects.new_category(category='elderberries')
+        self.quiz1 = Quiz.objects.create(id=1,
+                                         title='test quiz 1',
+                                         description='d1',
+                                         url='tq1')
+        self.quiz2 = Quiz.objects.create(id=2,
+                                         title='test quiz 2',
+                                         description='d2',
+                                         url='tq2')
+        for i in range(1, 26):
+            TF_Question.objects.create(id=i, content='question %d' % i,
+                                       quiz=self.quiz1, correct=True,
+                                       category=self.c1 if i > 20 else None)
+
+    def search(self, **params):
+        response = self.client.get('/admin/quiz/quiz/questions/search/',
+                                   params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_search_is_paged(self):
+        first = self.search()
+        second = self.search(page=2)
+
+        self.assertEqual(len(first['results']), 20)
+        self.assertTrue(first['pagination']['more'])
+        self.assertEqual(len(second['results']), 5)
+        self.assertFalse(second['pagination']['more'])
+        self.assertEqual(first['results'][0],
+                         {'id': '1', 'text': 'question 1'})
+
+    def test_search_by_content_and_category(self):
+        self.assertEqual([r['id'] for r in self.search(term='question 2')
+                          ['results']],
+                         ['2', '20', '21', '22', '23', '24', '25'])
+        self.assertEqual(len(self.search(term='elderb')['results']), 5)
+
+    def test_search_needs_quiz_permission(self):
+        User.objects.create_user(username='staff', password='pw',
+                                 is_staff=True)
+        self.client.login(username='staff', password='pw')
+        response = self.client.get('/admin/quiz/quiz/questions/search/')
+        self.assertEqual(response.status_code, 403)
+
+    def test_change_page_renders_only_selected_questions(self):
+        TF_Question.objects.create(id=99, content='elsewhere',
+                                   quiz=self.quiz2, correct=True)
+
+        response = self.client.get('/admin/quiz/quiz/2/change/')
+        self.assertContains(response, 'elsewhere')
+        self.assertNotContains(response, 'question 1<')
+        self.assertContains(response, 'data-ajax--url="/admin/quiz/quiz/'
+                                      'questions/search/"')
+
+    def test_save_moves_only_added_questions(self):
+        data = {'title': 'test quiz 2', 'description': 'd2', 'url': 'tq2',
+                'pass_mark': 0, 'questions': ['3', '4']}
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/admin/quiz/quiz/2/change/', data)
+        self.assertEqual(response.status_code, 302)
+
+        self.assertEqual(
+            sorted(Question.objects.filter(quiz=self.quiz2)
+                   .values_list('id', flat=True)), [3, 4])
+        updates = [q['sql'] for q in queries
+                   if q['sql'].startswith('UPDATE "quiz_question"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('IN (3, 4)', updates[0])
+
+        self.quiz1.refresh_from_db()
+        self.assertEqual(self.quiz1.question_count, 23)
+
+
+class TestBankCommands(TestCase):
+    def setUp(self):
+        self.c1 = Category.objects.new_category(category='elderberries')
+        self.sub1 = SubCategory.objects.new_subcategory(
+            subcategory='swallows', category=self.c1)
+        self.quiz1 = Quiz.objects.create(id=1,
+                                         title='test quiz 1',
+                                         description='d1',
+                                         url='tq1',
+                                         category=self.c1,
+                                         max_questions=5)
+        self.quiz2 = Quiz.objects.create(id=2,
+                                         title='test quiz 2',
+                                         description='d2',
+                                         url='tq2')
+
+        self.question1 = MCQuestion.objects.create(
+            content='squawk', quiz=self.quiz1, category=self.c1,
+            sub_category=self.sub1, answer_order='content')
+        Answer.objects.create(question=self.question1, content='bing',
+                              correct=True)
+        Answer.objects.create(question=self.question1, content='bong',
+                              correct=False)
+        TF_Question.objects.create(content='oink', quiz=self.quiz1,
+                                   correct=False, explanation='pigs')
+        Essay_Question.objects.create(content='moo', quiz=self.quiz1)
+        TF_Question.objects.create(content='elsewhere', quiz=self.quiz2,
+                                   correct=True)
+
+    def export(self, *urls):
+        output = StringIO()
+        call_command('export_quizzes', *urls, stdout=output)
+        return output.getvalue()
+
+    def import_bank(self, bank, *args):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl',
+                                         delete=False) as bank_file:
+            bank_file.write(bank)
+        self.addCleanup(os.remove, bank_file.name)
+        call_command('import_quizzes', bank_file.name, *args,
+                     stdout=StringIO())
+
+    def test_round_trip(self):
+        bank = self.export('tq1')
+        records = [json.loads(line) for line in bank.splitlines()]
+        self.assertEqual([r['type'] for r in records],
+                         ['category', 'sub_category', 'quiz',
+                          'question', 'question', 'question'])
+
+        Quiz.objects.all().delete()
+        Category.objects.all().delete()
+        self.import_bank(bank, '--batch-size', '2')
+
+        quiz = Quiz.objects.get(url='tq1')
+        self.assertEqual(quiz.category.category, 'elderberries')
+        self.assertEqual(quiz.max_questions, 5)
+        self.assertEqual(quiz.question_count, 3)
+        self.assertEqual(quiz.question_type_counts,
+                         {'MCQuestion': 1, 'TF_Question': 1,
+                          'Essay_Question': 1})
+
+        questions = {q.content: q for q in quiz.get_questions()}
+        self.assertEqual(questions['squawk'].sub_category.sub_category,
+                         'swallows')
+        self.assertEqual(questions['squawk'].answer_order, 'content')
+        self.assertEqual([(a.content, a.correct) for a
+                          in questions['squawk'].get_answers()],
+                         [('bing', True), ('bong', False)])
+        self.assertIs(questions['oink'].correct, False)
+        self.assertEqual(questions['oink'].explanation, 'pigs')
+        self.assertIsInstance(questions['moo'], Essay_Question)
+
+    def test_import_adds_or_replaces(self):
+        bank = self.export('tq1')
+        version = Quiz.objects.get(url='tq1').version
+
+        self.import_bank(bank)
+        quiz = Quiz.objects.get(url='tq1')
+        self.assertEqual(quiz.question_count, 6)
+        self.assertGreater(quiz.version, version)
+
+        self.import_bank(bank, '--replace')
+        self.assertEqual(Quiz.objects.get(url='tq1').question_count, 3)
+        self.assertEqual(Quiz.objects.count(), 2)
+        self.assertEqual(Category.objects.count(), 1)
+
+    def test_round_trip_keeps_question_order(self):
+        for number in range(4):
+            if number % 2:
+                TF_Question.objects.create(content='q%d' % number,
+                                           quiz=self.quiz2, correct=True)
+            else:
+                MCQuestion.objects.create(content='q%d' % number,
+                                          quiz=self.quiz2)
+        bank = self.export('tq2', '--chunk-size', '2')
+
+        Quiz.objects.all().delete()
+        self.import_bank(bank, '--batch-size', '2')
+
+        self.assertEqual(
+            list(Question.objects.filter(quiz__url='tq2').order_by('pk')
+                                 .values_list('content', flat=True)),
+            ['elsewhere', 'q0', 'q1', 'q2', 'q3'])
+
+    def test_replace_refreshes_quiz_once(self):
+        for number in range(5):
+            TF_Question.objects.create(content='q%d' % number,
+                                       quiz=self.quiz1, correct=True)
+        bank = self.export('tq1')
+
+        with CaptureQueriesContext(connection) as queries:
+            self.import_bank(bank, '--replace')
+
+        # Once for the deleted questions, once for the imported ones.
+        self.assertEqual(len([query for query in queries
+                              if query['sql'].startswith(
+                                  'UPDATE "quiz_quiz" SET "version"')]),
+                         2)
+        self.assertEqual(Quiz.objects.get(url='tq1').question_count, 8)
+
+    def test_sub_category_of_another_category(self):
+        c2 = Category.objects.new_category(category='coconuts')
+        sub2 = SubCategory.objects.new_subcategory(subcategory='swallows',
+                                                   category=c2)
+        MCQuestion.objects.filter(pk=self.question1.pk)\
+                          .update(sub_category=sub2)
+        bank = self.export('tq1')
+
+        Quiz.objects.all().delete()
+        self.import_bank(bank)
+
+        question = Question.objects.get(content='squawk')
+        self.assertEqual(question.category.category, 'elderberries')
+        self.assertEqual(question.sub_category.category.category, 'coconuts')
+        self.assertEqual(SubCategory.objects.count(), 2)
+
+    def test_type_rows_inserted_in_batches(self):
+        bank = '\n'.join(
+            json.dumps({'type': 'question', 'quiz': 'tq2',
+                        'question_type': 'true_false.tf_question',
+                        'content': 'q%d' % number, 'correct': True})
+            for number in range(5))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.import_bank(bank)
+
+        self.assertEqual(len([query for query in queries
+                              if 'INSERT INTO "true_false_tf_question"'
+                              in query['sql']]),
+                         1)
+        self.assertEqual(Quiz.objects.get(url='tq2').question_count, 6)
+
+    def test_invalid_quiz(self):
+        with self.assertRaisesMessage(CommandError, 'line 1: 101 is above'):
+            self.import_bank('{"type": "quiz", "url": "tq3", '
+                             '"title": "t", "pass_mark": 101}\n')
+
+    def test_bad_record(self):
+        with self.assertRaisesMessage(CommandError, 'line 2'):
+            self.import_bank('{"type": "category", "category": "x"}\n'
+                             '{"type": "question", "quiz": "nope", '
+                             '"question_type": "true_false.tf_question"}\n')
+
+
+class TestItemAnalysis(TestCase):
+    def setUp(self):
+        self.quiz1 = Quiz.objects.create(id=1,
+                                         title='test quiz 1',
+                                         description='d1',
+                                         url='tq1')
+        self.user = User.objects.create_user(username='jacob',
+                                             password='top_secret')
+
+        self.question1 = MCQuestion.objects.create(id=1,
+                                                   content='squawk',
+                                                   quiz=self.quiz1)
+        self.answer1 = Answer.objects.create(id=123,
+                                             question=self.question1,
+                                             content='bing',
+                                             correct=True)
+        self.answer2 = Answer.objects.create(id=456,
+                                             question=self.question1,
+                                             content='bong',
+                                             correct=False)
+        self.question2 = TF_Question.objects.create(id=2,
+                                                    content='oink',
+                                                    quiz=self.quiz1,
+                                                    correct=True)
+
+    def answer_quiz(self):
+        self.client.get('/tq1/take/')
+        self.client.post('/tq1/take/', {'answers': 456})
+        self.client.post('/tq1/take/', {'answers': 'True'})
+
+    def test_signed_in_answers(self):
+        self.client.login(username='jacob', password='top_secret')
+        self.client.get('/tq1/take/')
+        sitting_id = Sitting.objects.get().pk
+        self.answer_quiz()
+
+        # The sitting is deleted at the end, but the answers are kept.
+        self.assertFalse(Sitting.objects.exists())
+        self.assertEqual(
+            sorted(QuestionAttempt.objects.values_list(
+                'question_id', 'sitting_id', 'correct')),
+            [(1, sitting_id, False), (2, sitting_id, True)])
+
+        stats = QuestionStats.objects.get(question=self.question1)
+        self.assertEqual((stats.attempts, stats.correct), (1, 0))
+        self.assertEqual(stats.difficulty, 0)
+        self.assertEqual(QuestionStats.objects.get(question_id=2).difficulty,
+                         1)
+        self.assertEqual(
+            list(Answer.objects.order_by('id')
+                 .values_list('id', 'chosen')), [(123, 0), (456, 1)])
+
+    def test_anon_answers(self):
+        self.answer_quiz()
+        self.answer_quiz()
+
+        stats = QuestionStats.objects.get(question=self.question1)
+        self.assertEqual((stats.attempts, stats.correct), (2, 0))
+        self.assertEqual(Answer.objects.get(id=456).chosen, 2)
+        self.assertFalse(QuestionAttempt.objects.exists())
+
+    def test_essays_are_not_counted(self):
+        essay = Essay_Question.objects.create(content='moo',
+                                              quiz=self.quiz1)
+        essay.add_attempt('because', False)
+        self.assertFalse(QuestionStats.objects.filter(question=essay)
+                         .exists())
+
+    def add_sitting(self, *answers):
+        sitting = Sitting.objects.new_sitting(self.user, self.quiz1)
+        for question_id, correct in enumerate(answers, 1):
+            QuestionAttempt.objects.create(question_id=question_id,
+                                           sitting=sitting, correct=correct)
+
+    @skipUnless(numpy, "NumPy is not installed")
+    def test_item_statistics(self):
+        from .item_analysis import item_statistics, load_attempts
+
+        question3 = TF_Question.objects.create(id=3, content='oink oink',
+                                               quiz=self.quiz1)
+        question4 = TF_Question.objects.create(id=4, content='baa',
+                                               quiz=self.quiz1)
+        sittings = [(True, True, True, True), (True, False, True, False),
+                    (False, False, True, False), (True, True, True, False),
+                    (False, True, True, False)]
+        for answers in sittings:
+            self.add_sitting(*answers)
+
+        question_ids, count, difficulty, discrimination = \
+            item_statistics(load_attempts(Question.objects.all()))
+
+        self.assertEqual(question_ids.tolist(), [1, 2, 3, 4])
+        self.assertEqual(count.tolist(), [5, 5, 5, 5])
+        self.assertEqual(difficulty.tolist(), [0.6, 0.6, 1, 0.2])
+
+        # The point-biserial correlation is the Pearson correlation of the
+        # answers with the score on the other questions.
+        answers = numpy.array(sittings, dtype=float)
+        for i in (0, 1, 3):
+            rest = answers.sum(axis=1) - answers[:, i]
+            self.assertAlmostEqual(
+                discrimination[i], numpy.corrcoef(answers[:, i], rest)[0, 1])
+        # Every answer to question 3 was right.
+        self.assertTrue(numpy.isnan(discrimination[2]))
+
+    @skipUnless(numpy, "NumPy is not installed")
+    def test_report_command(self):
+        self.add_sitting(True, True)
+        self.add_sitting(False, False)
+        QuestionStats.objects.add_attempt(1, True)
+        QuestionStats.objects.add_attempt(1, False)
+
+        output = StringIO()
+        call_command('item_analysis', 'tq1', stdout=output)
+        lines = output.getvalue().splitlines()
+
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[1].split()[:5],
+                         ['1', 'tq1', '2', '0.50', '1.00'])
+
+    @skipIf(numpy, "NumPy is installed")
+    def test_report_command_without_numpy(self):
+        with self.assertRaisesMessage(CommandError, 'NumPy'):
+            call_command('item_analysis', stdout=StringIO())
+
+
+class TestLoadTest(TestCase):
+    def setUp(self):
+        self.quiz = loadtest.build_quiz(4)
+        self.user = User.objects.create_user(username='jacob',
+                                             password='top_secret')
+
+    def test_students_take_the_quiz(self):
+        student = loadtest.Student('loadtest', self.user, seed=1)
+        client = Client()
+        client.force_login(self.user)
+
+        self.assertTrue(student.take_quiz(client))
+        self.assertEqual([sample.kind for sample in student.samples],
+                         ['start'] + ['answer'] * 4)
+        self.assertTrue(all(sample.outcome == 'ok' and sample.queries
+                            for sample in student.samples))
+        self.assertEqual(QuestionStats.objects.filter(attempts=1).count(), 4)
+
+        anonymous = loadtest.Student('loadtest', seed=2)
+        self.assertTrue(anonymous.take_quiz(Client()))
+        self.assertEqual(QuestionStats.objects.filter(attempts=2).count(), 4)
+
+    def test_failed_request(self):
+        self.quiz.draft = True
+        self.quiz.save()
+        student = loadtest.Student('loadtest', seed=1)
+
+        self.assertFalse(student.take_quiz(Client()))
+        self.assertEqual(student.samples[0].outcome, 'error')
+
+    def test_command_needs_scratch(self):
+        with self.assertRaisesMessage(CommandError, '--scratch'):
+            call_command('loadtest', '--quiz', 'loadtest', stdout=StringIO())
+        self.assertFalse(User.objects.filter(
+            username__startswith='loadtest_').exists())
+
+    def test_summarize(self):
+        samples = [loadtest.Sample('answer', n / 1000.0, 3, 'ok')
+                   for n in range(1, 101)]
+        samples.append(loadtest.Sample('start', 0.5, 0, 'locked'))
+        report = loadtest.summarize(samples, 2.0)
+
+        self.assertEqual(report['requests'], 101)
+        self.assertEqual(report['locked'], 1)
+        self.assertEqual(report['requests_per_second'], 50.5)
+        self.assertEqual(report['kinds']['answer']['queries_mean'], 3)
+        self.assertAlmostEqual(report['kinds']['answer']['p50'], 50.5)
+        self.assertAlmostEqual(report['kinds']['answer']['p99'], 99.01)
+        self.assertEqual(report['kinds']['start']['p90'], 500)
+        self.assertIsNone(report['kinds']['start']['queries_mean'])
+
+
+class Flaky(object):
+    """
+    Fails with the given error on its first calls, then returns 'done'.
+    """
+
+    def __init__(self, failures, message='database is locked'):
+        self.failures = failures
+        self.message = message
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise OperationalError(self.message)
+        return 'done'
+
+
+class TestLockRetry(SimpleTestCase):
+    def setUp(self):
+        locking.counts.reset()
+
+    def test_retries_until_written(self):
+        write = Flaky(2)
+        retries = []
+        with self.settings(QUIZ_SETTINGS={'LOCK_RETRY_DELAY': 0}):
+            result = locking.retry_on_lock(
+                write, on_retry=lambda: retries.append(write.calls))
+
+        self.assertEqual(result, 'done')
+        self.assertEqual(write.calls, 3)
+        self.assertEqual(retries, [1, 2])
+        self.assertEqual((locking.counts.retried, locking.counts.failed),
+                         (2, 0))
+
+    def test_gives_up_after_the_retries(self):
+        write = Flaky(10)
+        with self.settings(QUIZ_SETTINGS={'LOCK_RETRIES': 3,
+                                          'LOCK_RETRY_DELAY': 0,
+                                          'SERIALIZE_WRITES': True}):
+            with self.assertRaisesMessage(OperationalError, 'locked'):
+                locking.retry_on_lock(write)
+
+        self.assertEqual(write.calls, 4)
+        self.assertEqual((locking.counts.retried, locking.counts.failed),
+                         (3, 1))
+
+    def test_other_errors_are_not_retried(self):
+        write = Flaky(1, 'no such table: quiz_quiz')
+        with self.assertRaises(OperationalError):
+            locking.retry_on_lock(write)
+
+        self.assertEqual(write.calls, 1)
+
+    def test_lock_error_in_the_cause(self):
+        try:
+            try:
+                raise OperationalError('database is locked')
+            except OperationalError:
+                raise ValueError('could not save the session')
+        except ValueError as error:
+            self.assertTrue(locking.is_lock_error(error))
+
+        self.assertFalse(locking.is_lock_error(ValueError('locked')))
+
+    def test_backoff_is_bounded(self):
+        delays = [locking.backoff(attempt, 0.1) for attempt in range(10)]
+
+        self.assertTrue(0.05 <= delays[0] <= 0.1)
+        self.assertTrue(all(delay <= locking.MAX_DELAY for delay in delays))
+        self.assertTrue(delays[-1] >= locking.MAX_DELAY / 2)
+
+
+class TestLockRetryInTransaction(TestCase):
+    def test_not_retried_inside_a_transaction(self):
+        write = Flaky(1)
+        with transaction.atomic():
+            with self.assertRaises(OperationalError):
+                locking.retry_on_lock(write)
+
+        self.assertEqual(write.calls, 1)
+
+
+class TestCatalogRouter(TransactionTestCase):
+    """
+    The replica is a snapshot of the test database in a SQLite file,
+    taken before the quiz is renamed on the main database.
+    """
+
+    def setUp(self):
+        self.quiz = Quiz.objects.create(id=1, title='test quiz 1',
+                                        description='d1', url='tq1',
+                                        exam_paper=True)
+        self.question = TF_Question.objects.create(
+            quiz=self.quiz, content='Is it?', correct=True)
+        Quiz.objects.refresh_question_counts([self.quiz.pk])
+        self.user = User.objects.create_user(username='jacob',
+                                             password='top_secret')
+
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'replica.sqlite3')
+        routers.snapshot_database(connection, path)
+        # Set for this thread only, as a connection of the test itself.
+        main = connections['default']
+        connections['replica'] = type(main)(dict(
+            main.settings_dict, NAME=path, CONN_MAX_AGE=0,
+            OPTIONS={'init_command': "PRAGMA query_only=1"}), 'replica')
+        self.addCleanup(self.remove_replica, directory)
+
+        override = self.settings(QUIZ_SETTINGS={'READ_REPLICA': 'replica'})
+        override.enable()
+        self.addCleanup(override.disable)
+
+        Quiz.objects.filter(pk=1).update(title='renamed quiz')
+
+    def remove_replica(self, directory):
+        connections['replica'].close()
+        del connections['replica']
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+    def test_catalog_models(self):
+        for model in (Quiz, Category, SubCategory, Question, MCQuestion,
+                      Answer, TF_Question, Essay_Question):
+            self.assertTrue(routers.is_catalog(model), model)
+        for model in (Sitting, Progress, CategoryScore, QuestionStats,
+                      LeaderboardEntry, User):
+            self.assertFalse(routers.is_catalog(model), model)
+
+    def test_catalog_read_from_replica_in_request(self):
+        with routers.request_scope():
+            self.assertEqual(Quiz.objects.get(pk=1).title, 'test quiz 1')
+            self.assertEqual(Question.objects.get_subclass(
+                pk=self.question.pk).quiz.title, 'test quiz 1')
+            self.assertEqual(Sitting.objects.all().db, 'default')
+            self.assertEqual(Progress.objects.all().db, 'default')
+
+        self.assertEqual(Quiz.objects.get(pk=1).title, 'renamed quiz')
+
+    def test_reads_after_a_write_go_to_main(self):
+        with routers.request_scope():
+            self.assertEqual(Quiz.objects.get(pk=1).title, 'test quiz 1')
+            Progress.objects.create(user=self.user)
+            self.assertEqual(Quiz.objects.get(pk=1).title, 'renamed quiz')
+
+        with routers.request_scope():
+            self.assertEqual(Quiz.objects.all().db, 'replica')
+
+    def test_reads_in_transaction_go_to_main(self):
+        with routers.request_scope(), transaction.atomic():
+            self.assertEqual(Quiz.objects.get(pk=1).title, 'renamed quiz')
+
+    def test_writes_of_replica_objects_go_to_main(self):
+        with routers.request_scope():
+            quiz = Quiz.objects.get(pk=1)
+            quiz.description = 'd2'
+            quiz.save()
+
+        self.assertEqual(Quiz.objects.get(pk=1).description, 'd2')
+        self.assertEqual(Quiz.objects.using('replica').get(pk=1).description,
+                         'd1')
+
+    def test_quiz_taken_with_catalog_from_replica(self):
+        response = self.client.get('/')
+        self.assertContains(response, 'test quiz 1')
+
+        self.client.login(username='jacob', password='top_secret')
+        self.client.get('/tq1/take/')
+        response = self.client.post('/tq1/take/',
+                                    {'answers': 'True',
+                                     'question_id': self.question.pk})
+
+        self.assertContains(response, 'test quiz 1')
+        sitting = Sitting.objects.get(user=self.user, complete=True)
+        self.assertEqual(sitting.get_current_score, 1)
+        self.assertEqual(sitting.quiz.title, 'renamed quiz')
+        self.assertFalse(Sitting.objects.using('replica').exists())
+
+    def test_leaderboard_validated_on_main(self):
+        first = self.client.get('/tq1/')
+        LeaderboardEntry.objects.create(quiz=self.quiz, user=self.user,
+                                        score=1, percent=100)
+
+        second = self.client.get('/tq1/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        self.assertContains(second, 'jacob')
+
+    def test_replica_is_not_migrated(self):
+        router = routers.CatalogRouter()
+
+        self.assertIs(router.allow_migrate('replica', 'quiz'), False)
+        self.assertIsNone(router.allow_migrate('default', 'quiz'))
+
+    def test_snapshot_command(self):
+        Quiz.objects.filter(pk=1).update(title='new title')
+        call_command('snapshot_replica', stdout=StringIO())
+
+        self.assertEqual(Quiz.objects.using('replica').get(pk=1).title,
+                         'new title')
+
+        with self.settings(QUIZ_SETTINGS={}):
+            with self.assertRaisesMessage(CommandError, 'No read replica'):
+                call_command('snapshot_replica')
+
+
+class TestCatalogCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.new_category(category='elderberries')
+        self.quiz = Quiz.objects.create(id=1, title='test quiz 1',
+                                        description='d1', url='tq1',
+                                        category=self.category)
+        self.student = User.objects.create_user(username='jacob',
+                                                password='top_secret')
+
+    def test_list_pages_cached(self):
+        # The validators of the page, then its cache key.
+        for path in ('/', '/category/', '/category/elderberries/'):
+            first = self.client.get(path)
+            with self.assertNumQueries(2 if path != '/category/elderberries/'
+                                       else 3):
+                second = self.client.get(path)
+            self.assertEqual(first.status_code, 200)
+            self.assertEqual(second.content, first.content)
+
+    def test_cached_pages_keep_their_headers(self):
+        view = QuizListView.as_view(content_type='application/xhtml+xml; '
+                                                 'charset=utf-8')
+        requests = [RequestFactory().get('/') for _ in range(2)]
+        for request in requests:
+            request.user = AnonymousUser()
+
+        first = view(requests[0])
+        first.render()
+        second = view(requests[1])
+
+        self.assertEqual(second['Content-Type'],
+                         'application/xhtml+xml; charset=utf-8')
+        self.assertEqual(dict(second.items()), dict(first.items()))
+        self.assertEqual(second.content, first.content)
+
+    def test_quiz_change_refreshes_lists(self):
+        self.client.get('/')
+        self.client.get('/category/elderberries/')
+        self.quiz.title = 'renamed quiz'
+        self.quiz.save()
+
+        self.assertContains(self.client.get('/'), 'renamed quiz')
+        self.assertContains(self.client.get('/category/elderberries/'),
+                            'renamed quiz')
+
+        self.quiz.draft = True
+        self.quiz.save()
+
+        self.assertNotContains(self.client.get('/'), 'renamed quiz')
+
+    def test_question_refreshes_counts(self):
+        self.client.get('/')
+        TF_Question.objects.create(quiz=self.quiz, content='Is it?',
+                                   correct=True)
+
+        self.assertContains(self.client.get('/'), '<td>1</td>')
+
+    def test_category_change_refreshes_pages(self):
+        self.client.get('/category/')
+        self.client.get('/tq1/')
+        self.category.category = 'figs'
+        self.category.save()
+
+        self.assertContains(self.client.get('/category/'), 'figs')
+        self.assertContains(self.client.get('/tq1/'), 'figs')
+
+    def test_languages_kept_apart(self):
+        self.client.get('/', HTTP_ACCEPT_LANGUAGE='en')
+
+        with self.assertNumQueries(2):
+            self.client.get('/', HTTP_ACCEPT_LANGUAGE='en')
+        with self.assertNumQueries(3):
+            self.client.get('/', HTTP_ACCEPT_LANGUAGE='ar')
+
+    def test_quiz_detail_fragment(self):
+        self.client.get('/tq1/')
+        self.quiz.description = 'd2'
+        self.quiz.save()
+
+        self.assertContains(self.client.get('/tq1/'), 'd2')
+
+    def test_cached_draft_not_shown_without_permission(self):
+        self.quiz.draft = True
+        self.quiz.save()
+        editor = User.objects.create_user(username='editor',
+                                          password='top_secret')
+        editor.user_permissions.add(
+            Permission.objects.get(codename='change_quiz'))
+
+        self.client.login(username='editor', password='top_secret')
+        self.assertContains(self.client.get('/tq1/'), 'd1')
+        self.assertNotContains(self.client.get('/'), 'test quiz 1')
+
+        self.client.login(username='jacob', password='top_secret')
+        self.assertEqual(self.client.get('/tq1/').status_code, 403)
+
+
+class TestConditionalGet(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.new_category(category='elderberries')
+        self.quiz = Quiz.objects.create(id=1, title='test quiz 1',
+                                        description='d1', url='tq1',
+                                        category=self.category)
+        self.student = User.objects.create_user(username='jacob',
+                                                password='top_secret')
+
+    def revalidate(self, path, response, **headers):
+        return self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag'],
+                               **headers)
+
+    def test_not_modified(self):
+        for path in ('/', '/category/', '/category/elderberries/', '/tq1/',
+                     '/tq1/leaderboard/'):
+            first = self.client.get(path)
+            self.assertEqual(first.status_code, 200)
+            self.assertTrue(first.has_header('Last-Modified'))
+
+            # Only the stamps are read, and nothing is rendered. The
+            # category page loads its category, the quiz pages read the
+            # stamps of their leaderboard apart.
+            with self.assertNumQueries(1 if path in ('/', '/category/')
+                                       else 2):
+                second = self.revalidate(path, first)
+            self.assertEqual(second.status_code, 304)
+            self.assertEqual(second['ETag'], first['ETag'])
+            self.assertEqual(second.content, b'')
+
+    def test_if_modified_since(self):
+        first = self.client.get('/')
+        second = self.client.get(
+            '/', HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(second.status_code, 304)
+
+    def test_changes_modify(self):
+        pages = {path: self.client.get(path)
+                 for path in ('/', '/category/elderberries/', '/tq1/')}
+        self.quiz.title = 'renamed quiz'
+        self.quiz.save()
+
+        for path, first in pages.items():
+            self.assertContains(self.revalidate(path, first), 'renamed quiz')
+
+        first = self.client.get('/')
+        TF_Question.objects.create(quiz=self.quiz, content='Is it?',
+                                   correct=True)
+        self.assertEqual(self.revalidate('/', first).status_code, 200)
+
+        first = self.client.get('/category/')
+        self.category.category = 'figs'
+        self.category.save()
+        self.assertContains(self.revalidate('/category/', first), 'figs')
+
+    def test_leaderboard_modifies(self):
+        first = self.client.get('/tq1/')
+        LeaderboardEntry.objects.create(quiz=self.quiz, user=self.student,
+                                        score=1, percent=100)
+        self.assertContains(self.revalidate('/tq1/', first), 'jacob')
+
+    def test_kept_apart(self):
+        first = self.client.get('/tq1/')
+
+        second = self.revalidate('/tq1/', first, HTTP_ACCEPT_LANGUAGE='ar')
+        self.assertEqual(second.status_code, 200)
+
+        self.client.login(username='jacob', password='top_secret')
+        self.assertEqual(self.revalidate('/tq1/', first).status_code, 200)
+
+        first = self.client.get('/tq1/leaderboard/')
+        second = self.revalidate('/tq1/leaderboard/?top=20', first)
+        self.assertEqual(second.status_code, 200)
+
+    def test_drafts_not_validated(self):
+        self.quiz.draft = True
+        self.quiz.save()
+
+        response = self.client.get('/tq1/')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(response.has_header('ETag'))
+
+
+def image_file(size, mode='RGB', image_format='JPEG'):
+    output = BytesIO()
+    Image.new(mode, size, 'red').save(output, image_format)
+    return ContentFile(output.getvalue(), name='photo.%s' % image_format)
+
+
+class TestFigures(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        override = self.settings(MEDIA_ROOT=directory)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.quiz = Quiz.objects.create(id=1, title='test quiz 1',
+                                        description='d1', url='tq1')
+        self.question = MCQuestion.objects.create(
+            quiz=self.quiz, content='squawk',
+            figure=image_file((1500, 1000)))
+        Answer.objects.create(question=self.question, content='bing',
+                              correct=True)
+
+    def test_derivatives_built_on_save(self):
+        derivatives = self.question.figure_derivatives
+
+        self.assertEqual(derivatives['source'], self.question.figure.name)
+        self.assertEqual((derivatives['width'], derivatives['height']),
+                         (1024, 683))
+        for key, image_format in (('webp', 'WEBP'), ('jpeg', 'JPEG')):
+            self.assertEqual([width for width, name in derivatives[key]],
+                             [320, 640, 1024])
+            width, name = derivatives[key][0]
+            with Image.open(os.path.join(settings.MEDIA_ROOT, name)) as image:
+                self.assertEqual(image.format, image_format)
+                self.assertEqual(image.size, (320, 213))
+
+        self.assertEqual(Question.objects.get(pk=self.question.pk)
+                                 .figure_derivatives, derivatives)
+
+    def test_small_and_transparent_figure(self):
+        question = TF_Question.objects.create(
+            quiz=self.quiz, content='Is it?', correct=True,
+            figure=image_file((100, 50), 'RGBA', 'PNG'))
+
+        self.assertEqual(question.figure_derivatives['webp'][0][0], 100)
+        self.assertEqual(len(question.figure_derivatives['jpeg']), 1)
+
+    def test_names_follow_content(self):
+        question = TF_Question.objects.create(
+            quiz=self.quiz, content='Is it?', correct=True,
+            figure=image_file((1500, 1000)))
+
+        self.assertNotEqual(question.figure.name, self.question.figure.name)
+        self.assertEqual(question.figure_derivatives['webp'],
+                         self.question.figure_derivatives['webp'])
+
+    def test_only_rebuilt_when_figure_changes(self):
+        self.question.figure_derivatives['marker'] = True
+        self.question.content = 'squawk squawk'
+        self.question.save()
+        self.assertTrue(self.question.figure_derivatives['marker'])
+
+        self.question.figure = image_file((800, 600))
+        self.question.save()
+        self.assertNotIn('marker', self.question.figure_derivatives)
+        self.assertEqual(self.question.figure_derivatives['width'], 800)
+
+        self.question.figure = None
+        self.question.save()
+        self.assertEqual(self.question.figure_derivatives, {})
+
+    def test_unreadable_figure(self):
+        question = TF_Question.objects.create(
+            quiz=self.quiz, content='Is it?', correct=True,
+            figure=ContentFile(b'not an image', name='photo.jpg'))
+
+        self.assertEqual(question.figure_derivatives,
+                         {'source': question.figure.name})
+
+    def test_question_page(self):
+        response = self.client.get('/tq1/take/')
+
+        self.assertContains(response, '<source type="image/webp" '
+                                      'srcset="/figures/')
+        self.assertContains(response, 'loading="lazy"')
+        self.assertContains(response, 'width="1024" height="683"')
+        self.assertContains(response, 'alt="squawk"')
+        self.assertNotContains(response, self.question.figure.url)
+
+    def test_figure_view(self):
+        width, name = self.question.figure_derivatives['webp'][-1]
+        response = self.client.get('/' + name)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+        response.close()
+
+        self.assertEqual(self.client.get(
+            '/figures/0123456789abcdef0123-320w.jpg').status_code, 404)
+
+    def test_build_figures_command(self):
+        Question.objects.update(figure_derivatives={})
+        version = Quiz.objects.get(pk=1).version
+
+        output = StringIO()
+        call_command('build_figures', stdout=output)
+
+        self.assertIn('figures of 1 questions, 0 failed', output.getvalue())
+        self.assertEqual(
+            Question.objects.get(pk=self.question.pk).figure_derivatives,
+            self.question.figure_derivatives)
+        self.assertEqual(Quiz.objects.get(pk=1).version, version + 1)
+
+        call_command('build_figures', stdout=output)
+        self.assertIn('figures of 0 questions', output.getvalue())
+
+    def copies_exist(self, derivatives):
+        return [default_storage.exists(name)
+                for name in sorted(figures.copy_names(derivatives))]
+
+    def test_replaced_copies_deleted(self):
+        shared = TF_Question.objects.create(
+            quiz=self.quiz, content='Is it?', correct=True,
+            figure=image_file((1500, 1000)))
+        derivatives = self.question.figure_derivatives
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question.figure = image_file((800, 600))
+            self.question.save()
+        # Still recorded by the other question.
+        self.assertEqual(self.copies_exist(derivatives), [True] * 6)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            shared.figure = None
+            shared.save()
+        self.assertEqual(self.copies_exist(derivatives), [False] * 6)
+
+        derivatives = self.question.figure_derivatives
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question.delete()
+        self.assertEqual(self.copies_exist(derivatives), [False] * 6)
+
+    def test_build_figures_prune(self):
+        derivatives = self.question.figure_derivatives
+        unused = default_storage.save('figures/0123456789abcdef0123-320w.jpg',
+                                      ContentFile(b'left over'))
+
+        output = StringIO()
+        call_command('build_figures', '--force', '--prune', stdout=output)
+
+        self.assertIn('Deleted 1 unused copies', output.getvalue())
+        self.assertFalse(default_storage.exists(unused))
+        self.assertEqual(self.copies_exist(derivatives), [True] * 6)
+
+    def test_route_urls_reserved(self):
+        for url in ('figures', 'metrics', 'Category'):
+            quiz = Quiz(title='test quiz', url=url)
+            with self.assertRaises(ValidationError):
+                quiz.full_clean()
+            with self.assertRaises(ValidationError):
+                quiz.save()
+
+
+class TestRequestMetrics(TestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        self.quiz1 = Quiz.objects.create(id=1,
+                                         title='test quiz 1',
+                                         description='d1',
+                                         url='tq1')
+        self.staff = User.objects.create_user(username='staff',
+                                              password='top_secret',
+                                              is_staff=True)
+        User.objects.create_user(username='jacob', password='top_secret')
+
+    def test_requests_are_recorded_by_url_name(self):
+        self.client.get('/')
+        self.client.get('/')
+        self.client.get('/tq1/')
+        self.client.get('/no/such/page/')
+
+        self.client.login(username='staff', password='top_secret')
+        response = self.client.get('/metrics/')
+        self.assertEqual(response['Content-Type'],
+                         'text/plain; version=0.0.4; charset=utf-8')
+        lines = response.content.decode().splitlines()
+
+        self.assertIn('quiz_http_requests_total{view="quiz_index"} 2', lines)
+        self.assertIn('quiz_http_requests_total{view="quiz_start_page"} 1',
+                      lines)
+        self.assertIn('quiz_http_requests_total{view="<unresolved>"} 1',
+                      lines)
+        self.assertIn('quiz_http_request_duration_seconds_count'
+                      '{view="quiz_index"} 2', lines)
+        self.assertIn('quiz_http_request_duration_seconds_bucket'
+                      '{view="quiz_index",le="+Inf"} 2', lines)
+        self.assertIn('# TYPE quiz_db_queries_total counter', lines)
+
+        index = metrics.registry._views['quiz_index']
+        self.assertGreater(index.queries, 0)
+        self.assertGreater(index.query_duration, 0)
+        self.assertEqual(sum(index.buckets), 2)
+
+    def test_staff_only(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        self.client.login(username='jacob', password='top_secret')
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+
+    async def test_queries_of_async_requests(self):
+        await self.async_client.get('/tq1/')
+        self.assertGreater(metrics.registry._views['quiz_start_page']
+                           .queries, 0)
+
+    def test_escape(self):
+        metrics.registry.observe('a"b', 0.02, 1, 0.001)
+        self.assertIn('quiz_db_queries_total{view="a\\"b"} 1',
+                      metrics.registry.render().splitlines())
+
+
 class TestProgress(TestCase):
     def setUp(self):
         self.c1 = Category.objects.new_category(category='elderberries')
@@ -119,7 +1415,8 @@ class TestProgress(TestCase):
                                          url='tq1')
 
         self.question1 = MCQuestion.objects.create(content='squawk',
-                                                   category=self.c1)
+                                                   category=self.c1,
+                                                   quiz=self.quiz1)
 
         self.user = User.objects.create_user(username='jacob',
                                              email='jacob@jacob.com',
@@ -128,19 +1425,17 @@ class TestProgress(TestCase):
         self.p1 = Progress.objects.new_progress(self.user)
 
     def test_list_all_empty(self):
-        self.assertEqual(self.p1.score, '')
+        self.assertFalse(CategoryScore.objects.filter(user=self.user)
+                                              .exists())
 
-        category_dict = self.p1.list_all_cat_scores
-
-        self.assertIn(str(list(category_dict.keys())[0]), self.p1.score)
-
-        self.assertIn(self.c1.category, self.p1.score)
+        self.assertEqual(self.p1.list_all_cat_scores,
+                         {self.c1.category: [0, 0, 0]})
 
         Category.objects.new_category(category='cheese')
 
-        self.p1.list_all_cat_scores
-
-        self.assertIn('cheese', self.p1.score)
+        self.assertEqual(self.p1.list_all_cat_scores['cheese'], [0, 0, 0])
+        self.assertFalse(CategoryScore.objects.filter(user=self.user)
+                                              .exists())
 
     def test_subcategory_all_empty(self):
         SubCategory.objects.create(sub_category='pickles',
@@ -156,7 +1451,8 @@ class TestProgress(TestCase):
 
         cheese = Category.objects.new_category(category='cheese')
         question2 = MCQuestion.objects.create(content='squeek',
-                                              category=cheese)
+                                              category=cheese,
+                                              quiz=self.quiz1)
         self.p1.update_score(question2, 3, 4)
 
         self.assertIn('cheese', self.p1.list_all_cat_scores)
@@ -178,6 +1474,79 @@ class TestProgress(TestCase):
         self.assertEqual([4, 6, 67], self.p1.list_all_cat_scores['cheese'])
 
 
+class TestCategoryScore(TestCase):
+    def setUp(self):
+        self.c1 = Category.objects.new_category(category='elderberries')
+        self.c2 = Category.objects.new_category(category='cheese')
+
+        self.quiz1 = Quiz.objects.create(id=1,
+                                         title='test quiz 1',
+                                         description='d1',
+                                         url='tq1')
+
+        self.question1 = MCQuestion.objects.create(content='squawk',
+                                                   category=self.c1,
+                                                   quiz=self.quiz1)
+
+        self.user = User.objects.create_user(username='jacob',
+                                             email='jacob@jacob.com',
+                                             password='top_secret')
+
+        self.p1 = Progress.objects.new_progress(self.user)
+
+    def test_update_score_increments_counters(self):
+        self.p1.update_score(self.question1, 1, 2)
+        self.p1.update_score(self.question1, 3, 4)
+
+        score = CategoryScore.objects.get(user=self.user, category=self.c1)
+        self.assertEqual((score.score, score.possible), (4, 6))
+        self.assertEqual(CategoryScore.objects.count(), 1)
+
+    def test_update_score_uses_single_update(self):
+        self.p1.update_score(self.question1, 1, 1)
+
+        with self.assertNumQueries(1):
+            self.p1.update_score(self.question1, 1, 1)
+
+    def test_update_or_insert_after_concurrent_insert(self):
+        self.p1.update_score(self.question1, 1, 2)
+        # Misses the row the insert then collides with, as when another
+        # request inserts it in between.
+        missed = CategoryScore.objects.filter(user=self.user,
+                                              category=self.c1, score__lt=0)
+
+        update_or_insert(missed, dict(user=self.user, category=self.c1,
+                                      score=5, possible=5),
+                         score=F('score') + 5)
+
+        score = CategoryScore.objects.get(user=self.user, category=self.c1)
+        self.assertEqual((score.score, score.possible), (1, 2))
+
+    def test_list_all_cat_scores_in_one_query(self):
+        self.p1.update_score(self.question1, 1, 2)
+
+        with self.assertNumQueries(1):
+            scores = self.p1.list_all_cat_scores
+
+        self.assertEqual(scores, {'cheese': [0, 0, 0],
+                                  'elderberries': [1, 2, 50]})
+
+    def test_scores_are_per_user(self):
+        other = User.objects.create_user(username='other',
+                                         password='top_secret')
+        CategoryScore.objects.add_score(other.pk, self.c1.pk, 5, 5)
+
+        self.assertEqual(self.p1.list_all_cat_scores['elderberries'],
+                         [0, 0, 0])
+
+    def test_question_without_category(self):
+        question = TF_Question.objects.create(content='oink',
+                                              quiz=self.quiz1)
+        self.p1.update_score(question, 1, 1)
+
+        self.assertEqual(CategoryScore.objects.count(), 0)
+
+
 class TestSitting(TestCase):
     def setUp(self):
         self.quiz1 = Quiz.objects.create(id=1,
@@ -311,6 +1680,368 @@ class TestSitting(TestCase):
         self.assertEqual(self.sitting.progress(), (1, 2))
 
 
+class TestSittingUnitOfWork(TestCase):
+    def setUp(self):
+        self.quiz1 = Quiz.objects.create(id=1,
+                                         title='test quiz 1',
+                                         description='d1',
+                                         url='tq1')
+
+        self.question1 = MCQuestion.objects.create(id=1,
+                                                   content='squawk',
+                                                   quiz=self.quiz1)
+        self.question2 = MCQuestion.objects.create(id=2,
+                                                   content='squeek',
+                                                   quiz=self.quiz1)
+
+        self.user = User.objects.create_user(username='jacob',
+                                             email='jacob@jacob.com',
+                                             password='top_secret')
+
+        self.sitting = Sitting.objects.new_sitting(self.user, self.quiz1)
+
+    def sitting_updates(self, queries):
+        return [query['sql'] for query in queries
+                if query['sql'].startswith('UPDATE "quiz_sitting"')]
+
+    def test_changes_flushed_in_one_update(self):
+        with CaptureQueriesContext(connection) as queries:
+            with self.sitting.unit_of_work():
+                self.sitting.add_to_score(1)
+                self.sitting.add_incorrect_question(self.question2)
+                self.sitting.add_user_answer(self.question1, '123')
+                self.sitting.remove_first_question()
+                self.assertEqual(self.sitting_updates(queries), [])
+
+        updates = self.sitting_updates(queries)
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn('"quiz_id"', updates[0])
+
+        sitting = Sitting.objects.get(pk=self.sitting.pk)
+        self.assertEqual(sitting.current_score, 1)
+        self.assertEqual(sitting.get_incorrect_questions, [2])
+        self.assertIn('123', sitting.user_answers)
+
+    def test_changes_saved_immediately_outside_unit_of_work(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.sitting.add_to_score(1)
+            self.sitting.add_user_answer(self.question1, '123')
+
+        self.assertEqual(len(self.sitting_updates(queries)), 2)
+
+    def test_failed_unit_of_work_writes_nothing(self):
+        with self.assertRaises(ValueError):
+            with self.sitting.unit_of_work():
+                self.sitting.add_to_score(1)
+                raise ValueError
+
+        self.assertEqual(Sitting.objects.get(pk=self.sitting.pk)
+                                        .current_score, 0)
+
+    def test_deleted_sitting_is_not_flushed(self):
+        with self.sitting.unit_of_work():
+            self.sitting.mark_quiz_complete()
+            self.sitting.delete()
+
+        self.assertEqual(Sitting.objects.count(), 0)
+
+
+class TestSittingCursor(TestCase):
+    def setUp(self):
+        self.quiz1 = Quiz.objects.create(id=1,
+                                         title='test quiz 1',
+                                         description='d1',
+                                         url='tq1')
+
+        self.question1 = MCQuestion.objects.create(id=1,
+                                                   content='squawk',
+                                                   quiz=self.quiz1)
+        self.question2 = MCQuestion.objects.create(id=2,
+                                                   content='squeek',
+                                                   quiz=self.quiz1)
+
+        self.user = User.objects.create_user(username='jacob',
+                                             email='jacob@jacob.com',
+                                             password='top_secret')
+
+        self.sitting = Sitting.objects.new_sitting(self.user, self.quiz1)
+
+    def test_question_list_written_once(self):
+        question_list = self.sitting.question_list
+
+        self.assertEqual(self.sitting.get_first_question(), self.question1)
+        self.sitting.remove_first_question()
+        self.assertEqual(self.sitting.get_first_question(), self.question2)
+        self.sitting.remove_first_question()
+        self.assertIs(self.sitting.get_first_question(), False)
+        self.sitting.remove_first_question()
+
+        sitting = Sitting.objects.get(pk=self.sitting.pk)
+        self.assertEqual(sitting.question_list, question_list)
+        self.assertEqual(sitting.cursor, 2)
+
+    def test_advancing_only_writes_cursor(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.sitting.remove_first_question()
+
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"cursor" = 1', queries[0]['sql'])
+        self.assertNotIn('question_list', queries[0]['sql'])
+
+    def test_progress_and_percent_use_whole_sitting(self):
+        self.assertEqual(self.sitting.progress(), (0, 2))
+
+        self.sitting.add_to_score(1)
+        self.sitting.remove_first_question()
+
+        self.assertEqual(self.sitting.progress(), (1, 2))
+        self.assertEqual(self.sitting.questions_remaining, 1)
+        self.assertEqual(self.sitting.get_percent_correct, 50)
+
+        self.sitting.remove_first_question()
+        self.assertEqual(self.sitting.get_percent_correct, 50)
+
+
+class TestLeaderboard(TestCase):
+    def setUp(self):
+        self.quiz1 = Quiz.objects.create(id=1,
+                                         title='test quiz 1',
+                                         description='d1',
+                                         url='tq1',
+                                         exam_paper=True)
+        self.question1 = TF_Question.objects.create(id=1, content='oink',
+                                                    quiz=self.quiz1,
+                                                    correct=True)
+        self.question2 = TF_Question.objects.create(id=2, content='moo',
+                                                    quiz=self.quiz1,
+                                                    correct=False)
+        self.users = [User.objects.create_user(username=name,
+                                               password='top_secret')
+                      for name in ('jacob', 'luke', 'leia', 'han')]
+
+    def sit(self, user, score):
+        sitting = Sitting.objects.new_sitting(user, self.quiz1)
+        sitting.add_to_score(score)
+        sitting.remove_first_question()
+        sitting.remove_first_question()
+        sitting.mark_quiz_complete()
+        return sitting
+
+    def test_best_score_is_kept(self):
+        self.client.login(username='jacob', password='top_secret')
+        self.client.get('/tq1/take/')
+        self.client.post('/tq1/take/', {'answers': 'True'})
+        self.client.post('/tq1/take/', {'answers': 'True'})
+
+        entry = LeaderboardEntry.objects.get()
+        self.assertEqual((entry.user, entry.score, entry.percent),
+                         (self.users[0], 1, 50))
+
+        self.sit(self.users[0], 0)
+        self.assertEqual(LeaderboardEntry.objects.get().score, 1)
+        self.sit(self.users[0], 2)
+        self.assertEqual(LeaderboardEntry.objects.get().score, 2)
+
+    def test_ranks(self):
+        for user, score in zip(self.users, (1, 2, 1, 0)):
+            self.sit(user, score)
+
+        top = LeaderboardEntry.objects.top(self.quiz1, 3)
+        self.assertEqual([(entry.rank, entry.user.username)
+                          for entry in top],
+                         [(1, 'luke'), (2, 'jacob'), (2, 'leia')])
+
+        with self.assertNumQueries(2):
+            entry = LeaderboardEntry.objects.user_entry(self.quiz1,
+                                                        self.users[3])
+        self.assertEqual(entry.rank, 4)
+        self.assertIsNone(LeaderboardEntry.objects.user_entry(
+            self.quiz1, AnonymousUser()))
+
+    def test_marking_rebuilds_the_entry(self):
+        sitting = self.sit(self.users[0], 2)
+        marker = User.objects.create_user(username='marker',
+                                          password='top_secret')
+        marker.user_permissions.add(
+            Permission.objects.get(codename='view_sittings'))
+        self.client.login(username='marker', password='top_secret')
+
+        self.client.post('/marking/%d/' % sitting.id, {'qid': 1})
+        self.assertEqual(LeaderboardEntry.objects.get().score, 1)
+
+    def test_detail_and_leaderboard_views(self):
+        for user, score in zip(self.users, (1, 2, 1, 0)):
+            self.sit(user, score)
+        self.client.login(username='han', password='top_secret')
+
+        response = self.client.get('/tq1/')
+        self.assertEqual(len(response.context['leaderboard']), 4)
+        self.assertEqual(response.context['leaderboard_entry'].rank, 4)
+        self.assertContains(response, 'Your best score is 0, ranked 4.')
+
+        response = self.client.get('/tq1/leaderboard/', {'top': 2})
+        self.assertEqual([entry.user.username for entry
+                          in response.context['leaderboard']],
+                         ['luke', 'jacob'])
+        self.assertTemplateUsed(response, 'quiz/leaderboard.html')
+
+    async def test_async_detail_view(self):
+        await sync_to_async(self.sit)(self.users[1], 2)
+
+        request = AsyncRequestFactory().get('/tq1/')
+
+        async def auser():
+            return self.users[1]
+        request.auser = auser
+        response = await AsyncQuizDetailView.as_view()(request, slug='tq1')
+
+        self.assertEqual(response.context_data['leaderboard_entry'].rank, 1)
+        self.assertEqual([entry.user_id for entry
+                          in response.context_data['leaderboard']],
+                         [self.users[1].id])
+
+
+class TestSampling(TestCase):
+    def setUp(self):
+        self.quiz1 = Quiz.objects.create(id=1,
+                                         title='test quiz 1',
+                                         description='d1',
+                                         url='tq1',
+                                         random_order=True,
+                                         max_questions=3)
+        for i in range(1, 11):
+            TF_Question.objects.create(id=i, content='q%d' % i,
+                                       quiz=self.quiz1, correct=True)
+
+        self.user = User.objects.create_user(username='jacob',
+                                             password='top_secret')
+
+    def test_draw(self):
+        ids = list(range(1, 11))
+
+        self.assertEqual(sampling.draw(ids, 3), [1, 2, 3])
+        self.assertEqual(sampling.draw(ids), ids)
+        self.assertEqual(sampling.draw(ids, 20), ids)
+
+        drawn = sampling.draw(ids, 3, seed=42)
+        self.assertEqual(len(set(drawn)), 3)
+        self.assertTrue(set(drawn) <= set(ids))
+        self.assertEqual(sampling.draw(ids, 3, seed=42), drawn)
+        self.assertEqual(sorted(sampling.draw(ids, seed=42)), ids)
+        self.assertEqual(sampling.draw(reversed(ids), 3, seed=42), drawn)
+
+    def test_new_sitting_is_reproducible(self):
+        sitting = Sitting.objects.new_sitting(self.user, self.quiz1)
+
+        self.assertIsNotNone(sitting.seed)
+        drawn = sampling.draw(self.quiz1.get_snapshot().question_ids, 3,
+                              sitting.seed)
+        self.assertEqual(list(sitting._question_ids()), drawn)
+
+    def test_new_sitting_skips_question_rows(self):
+        self.quiz1.get_snapshot()
+
+        with CaptureQueriesContext(connection) as queries:
+            Sitting.objects.new_sitting(self.user, self.quiz1)
+
+        self.assertEqual(len(queries), 1)
+        self.assertIn('INSERT', queries[0]['sql'])
+
+    def test_new_sitting_reads_only_ids_when_not_cached(self):
+        snapshot.clear()
+
+        with CaptureQueriesContext(connection) as queries:
+            Sitting.objects.new_sitting(self.user, self.quiz1)
+
+        self.assertEqual(len(queries), 2)
+        self.assertTrue(queries[0]['sql'].startswith(
+            'SELECT "quiz_question"."id" AS "pk" FROM'))
+        self.assertIsNone(snapshot._cached(self.quiz1))
+
+    def test_answer_order_is_stable(self):
+        question = MCQuestion.objects.create(content='squawk',
+                                             quiz=self.quiz1,
+                                             answer_order='random')
+        for i in range(8):
+            Answer.objects.create(question=question, content='a%d' % i,
+                                  correct=i == 0)
+        sitting = Sitting.objects.new_sitting(self.user, self.quiz1)
+        question = self.quiz1.get_question(question.id)
+
+        with self.assertNumQueries(0):
+            first = question.get_answers_list(sitting.answer_seed)
+            second = question.get_answers_list(sitting.answer_seed)
+        self.assertEqual(first, second)
+
+        orders = {tuple(question.get_answers_list(seed))
+                  for seed in range(10)}
+        self.assertGreater(len(orders), 1)
+
+    def test_ordered_quiz_keeps_question_order(self):
+        self.quiz1.random_order = False
+        self.quiz1.save()
+
+        sitting = Sitting.objects.new_sitting(self.user, self.quiz1)
+        self.assertIsNotNone(sitting.seed)
+        self.assertEqual(sitting.question_list, '1,2,3,')
+
+
+class TestOrderedQuestionFetch(TestCase):
+    def setUp(self):
+        self.quiz1 = Quiz.objects.create(id=1,
+                                         title='test quiz 1',
+                                         description='d1',
+                                         url='tq1')
+
+        self.user = User.objects.create_user(username='jacob',
+                                             email='jacob@jacob.com',
+                                             password='top_secret')
+
+    def add_questions(self, count):
+        for n in range(count):
+            question = MCQuestion.objects.create(content='mc %d' % n,
+                                                 quiz=self.quiz1)
+            Answer.objects.create(question=question, content='a',
+                                  correct=True)
+            Answer.objects.create(question=question, content='b')
+            TF_Question.objects.create(content='tf %d' % n, quiz=self.quiz1)
+            Essay_Question.objects.create(content='essay %d' % n,
+                                          quiz=self.quiz1)
+
+    def test_keeps_requested_order(self):
+        self.add_questions(2)
+        ids = list(Question.objects.order_by('-id')
+                                   .values_list('id', flat=True))
+        ids.append(999)
+
+        questions = Question.objects.in_order(ids)
+
+        self.assertEqual([question.id for question in questions], ids[:-1])
+        self.assertIsInstance(questions[0], Essay_Question)
+        self.assertIsInstance(questions[1], TF_Question)
+        self.assertIsInstance(questions[2], MCQuestion)
+
+    def test_query_count_independent_of_size(self):
+        for count in (2, 20):
+            Question.objects.all().delete()
+            self.add_questions(count)
+            sitting = Sitting.objects.new_sitting(self.user, self.quiz1)
+            for question in sitting.get_questions():
+                sitting.add_user_answer(question, '1')
+
+            sitting = Sitting.objects.select_related('quiz')\
+                                     .get(pk=sitting.pk)
+            # The ids and types, one query per question type and one for
+            # the multiple choice answers.
+            with self.assertNumQueries(5):
+                questions = sitting.get_questions(with_answers=True)
+                for question in questions:
+                    question.get_answers()
+                    self.assertEqual(question.user_answer, '1')
+
+            self.assertEqual(len(questions), count * 3)
+
+
 class TestNonQuestionViews(TestCase):
     '''
     Starting on views not directly involved with questions.
@@ -432,6 +2163,103 @@ class TestNonQuestionViews(TestCase):
         self.assertEqual((score, possible), (0.5, 2))
 
 
+class TestMarkingListPagination(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='yoda',
+                                                password='use_d@_force')
+        self.teacher.user_permissions.add(
+            Permission.objects.get(codename='view_sittings'))
+        self.quiz1 = Quiz.objects.create(id=1,
+                                         title='test quiz 1',
+                                         description='d1',
+                                         url='tq1')
+        self.quiz2 = Quiz.objects.create(id=2,
+                                         title='other quiz',
+                                         description='d2',
+                                         url='tq2')
+
+        end = now()
+        self.sittings = []
+        for i, username in enumerate(['luke', 'leia', 'lando', 'han',
+                                      'chewy', 'luke2', 'r2']):
+            user = User.objects.create_user(username=username)
+            sitting = Sitting.objects.new_sitting(
+                user, self.quiz1 if i % 2 else self.quiz2)
+            sitting.complete = True
+            # Two sittings share an end time, and one has none.
+            if i < 6:
+                sitting.end = end - timedelta(minutes=min(i, 4))
+            sitting.save()
+            self.sittings.append(sitting)
+
+        self.client.login(username='yoda', password='use_d@_force')
+
+    def walk(self, **params):
+        seen = []
+        query = params
+        while True:
+            response = self.client.get('/marking/', query)
+            seen.extend(sitting.id for sitting
+                        in response.context['sitting_list'])
+            next_page = response.context.get('next_page_query')
+            if not next_page:
+                return seen
+            query = QueryDict(next_page)
+
+    def test_pages_cover_every_sitting_once(self):
+        expected = [s.id for s in sorted(
+            self.sittings,
+            key=lambda s: (s.end is not None, s.end or now(), s.id),
+            reverse=True)]
+
+        # The sitting without an end alone on its page, or after others.
+        for page_size in (3, 4):
+            with self.settings(QUIZ_SETTINGS={'MARKING_PAGE_SIZE':
+                                              page_size}):
+                self.assertEqual(self.walk(), expected)
+
+    def test_filters(self):
+        with self.settings(QUIZ_SETTINGS={'MARKING_PAGE_SIZE': 2}):
+            users = self.walk(user_filter='lu')
+            quizzes = self.walk(quiz_filter='other', user_filter='l')
+
+        self.assertEqual(sorted(users),
+                         [self.sittings[0].id, self.sittings[5].id])
+        self.assertEqual(sorted(quizzes),
+                         [self.sittings[0].id, self.sittings[2].id])
+
+    def test_query_count_does_not_grow_with_page(self):
+        with self.settings(QUIZ_SETTINGS={'MARKING_PAGE_SIZE': 2}):
+            with CaptureQueriesContext(connection) as small:
+                self.client.get('/marking/')
+        with self.settings(QUIZ_SETTINGS={'MARKING_PAGE_SIZE': 6}):
+            with CaptureQueriesContext(connection) as large:
+                self.client.get('/marking/')
+
+        self.assertEqual(len(small), len(large))
+
+    def test_filters_are_case_sensitive_prefixes(self):
+        self.assertEqual(self.walk(user_filter='Lu'), [])
+        self.assertEqual(len(self.walk(user_filter='lu')), 2)
+
+    @skipUnless(connection.vendor == 'sqlite', "Reads the SQLite plans.")
+    def test_pages_seek_the_indexes(self):
+        def plan(**params):
+            view = QuizMarkingList()
+            view.request = RequestFactory().get('/marking/', params)
+            return view.get_queryset()[:10].explain()
+
+        after = marking_cursor(self.sittings[2])
+        self.assertIn('SEARCH quiz_sitting USING INDEX sitting_complete_end '
+                      '(end<?)', plan(after=after))
+        self.assertIn('USING COVERING INDEX sqlite_autoindex_auth_user_1 '
+                      '(username>? AND username<?)', plan(user_filter='lu'))
+
+    def test_bad_cursor_shows_first_page(self):
+        response = self.client.get('/marking/', {'after': 'yesterday_x'})
+        self.assertEqual(len(response.context['sitting_list']), 7)
+
+
 class TestQuestionMarking(TestCase):
     urls = 'quiz.urls'
 
@@ -571,12 +2399,12 @@ class TestQuestionViewsAnon(TestCase):
                                          category=self.c1)
 
         self.question1 = MCQuestion.objects.create(id=1,
-                                                   content='squawk')
-        self.question1.quiz.add(self.quiz1)
+                                                   content='squawk',
+                                                   quiz=self.quiz1)
 
         self.question2 = MCQuestion.objects.create(id=2,
-                                                   content='squeek')
-        self.question2.quiz.add(self.quiz1)
+                                                   content='squeek',
+                                                   quiz=self.quiz1)
 
         self.answer1 = Answer.objects.create(id=123,
                                              question=self.question1,
@@ -588,6 +2416,12 @@ class TestQuestionViewsAnon(TestCase):
                                              content='bong',
                                              correct=True)
 
+    def sitting(self):
+        return self.client.session['quiz_1']
+
+    def next_question_id(self):
+        return self.sitting()['o'][self.sitting()['c']]
+
     def test_quiz_take_anon_view_only(self):
         found = resolve('/tq1/take/')
 
@@ -598,8 +2432,9 @@ class TestQuestionViewsAnon(TestCase):
 
         self.assertContains(response, 'squawk', status_code=200)
         self.assertEqual(self.client.session.get_expiry_age(), 259200)
-        self.assertEqual(self.client.session['1_q_list'], [1, 2])
-        self.assertEqual(self.client.session['1_score'], 0)
+        self.assertEqual(self.sitting()['o'], [1, 2])
+        self.assertEqual(self.sitting()['c'], 0)
+        self.assertEqual(self.sitting()['s'], 0)
         self.assertEqual(response.context['quiz'].id, self.quiz1.id)
         self.assertEqual(response.context['question'].content,
                          self.question1.content)
@@ -612,14 +2447,20 @@ class TestQuestionViewsAnon(TestCase):
 
         self.client.get('/tq1/take/')
         self.assertEqual(self.client.session.get_expiry_age(), 1)
-        self.assertEqual(self.client.session['1_q_list'], [1, 2])
-        self.assertEqual(self.client.session['1_score'], 0)
+        self.assertEqual(self.sitting()['o'], [1, 2])
+        self.assertEqual(self.sitting()['c'], 0)
+        self.assertEqual(self.sitting()['s'], 0)
 
     def test_image_in_question(self):
         imgfile = StringIO(
             'GIF87a\x01\x00\x01\x00\x80\x01\x00\x00\x00\x00ccc,'
             '\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;')
         imgfile.name = 'test_img_file.gif'
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        override = self.settings(MEDIA_ROOT=directory)
+        override.enable()
+        self.addCleanup(override.disable)
 
         self.question1.figure.save('image', ContentFile(imgfile.read()))
         response = self.client.get('/tq1/take/')
@@ -636,15 +2477,14 @@ class TestQuestionViewsAnon(TestCase):
         response = self.client.post('/tq1/take/',
                                     {'answers': '123',
                                      'question_id':
-                                     self.client.session['1_q_list'][0]})
+                                     self.next_question_id()})
 
         self.assertContains(response, 'previous', status_code=200)
         self.assertContains(response, 'incorrect')
         self.assertContains(response, 'Explanation:')
         self.assertContains(response, 'squeek')
-        self.assertEqual(self.client.session['1_q_list'], [2])
-        self.assertEqual(self.client.session['session_score'], 0)
-        self.assertEqual(self.client.session['session_score_possible'], 1)
+        self.assertEqual(self.sitting()['c'], 1)
+        self.assertEqual(self.client.session['quiz_session_score'], [0, 1])
         self.assertEqual(response.context['previous']['question_type'],
                          {self.question1.__class__.__name__: True})
         self.assertIn(self.answer1, response.context['previous']['answers'])
@@ -655,13 +2495,13 @@ class TestQuestionViewsAnon(TestCase):
         response = self.client.post('/tq1/take/',
                                     {'answers': '456',
                                      'question_id':
-                                     self.client.session['1_q_list'][0]})
+                                     self.next_question_id()})
 
         self.assertContains(response, 'previous question', status_code=200)
         self.assertNotContains(response, 'incorrect')
         self.assertContains(response, 'Explanation:')
         self.assertContains(response, 'results')
-        self.assertNotIn('1_q_list', self.client.session)
+        self.assertNotIn('quiz_1', self.client.session)
         self.assertEqual(response.context['score'], 1)
         self.assertEqual(response.context['max_score'], 2)
         self.assertEqual(response.context['percent'], 50)
@@ -683,9 +2523,8 @@ class TestQuestionViewsAnon(TestCase):
         response = self.client.post('/tq1/take/',
                                     {'answers': '123',
                                      'question_id':
-                                     self.client.session['1_q_list'][0]})
-        self.assertEqual(self.client.session['session_score'], 1)
-        self.assertEqual(self.client.session['session_score_possible'], 3)
+                                     self.next_question_id()})
+        self.assertEqual(self.client.session['quiz_session_score'], [1, 3])
 
     def test_anon_cannot_sit_single_attempt(self):
         self.quiz1.single_attempt = True
@@ -701,10 +2540,298 @@ class TestQuestionViewsAnon(TestCase):
         response = self.client.post('/tq1/take/',
                                     {'answers': '123',
                                      'question_id':
-                                     self.client.session['1_q_list'][0]})
+                                     self.next_question_id()})
         self.assertEqual(response.context['progress'], (1, 2))
 
 
+class TestAnonSitting(TestCase):
+    def setUp(self):
+        self.quiz1 = Quiz.objects.create(id=1,
+                                         title='test quiz 1',
+                                         description='d1',
+                                         url='tq1')
+
+        self.question1 = MCQuestion.objects.create(id=1,
+                                                   content='squawk',
+                                                   quiz=self.quiz1)
+        self.answer1 = Answer.objects.create(id=123,
+                                             question=self.question1,
+                                             content='bing',
+                                             correct=False)
+
+        self.question2 = TF_Question.objects.create(id=2,
+                                                    content='oink',
+                                                    quiz=self.quiz1,
+                                                    correct=True)
+
+    def test_session_key(self):
+        self.assertEqual(AnonSitting.session_key(self.quiz1.id), 'quiz_1')
+
+    def test_record_answers(self):
+        sitting = AnonSitting(1, [5, 6, 7])
+
+        sitting.record_answer(False)
+        sitting.record_answer(True)
+        sitting.record_answer(False)
+
+        self.assertEqual(sitting.score, 1)
+        self.assertEqual(sitting.incorrect_questions, [5, 7])
+        self.assertEqual(sitting.progress(), (3, 3))
+        self.assertTrue(sitting.is_complete)
+
+    def test_session_round_trip(self):
+        engine = import_module(settings.SESSION_ENGINE)
+        session = engine.SessionStore(None)
+
+        sitting = AnonSitting(1, [5, 6, 7])
+        sitting.record_answer(False)
+        sitting.save(session)
+
+        self.assertEqual(list(session.keys()), ['quiz_1'])
+        self.assertEqual(session['quiz_1'],
+                         {'o': [5, 6, 7], 'c': 1, 's': 0, 'x': 1,
+                          'r': None})
+
+        loaded = AnonSitting.load(session, 1)
+        self.assertEqual(loaded.next_question_id, 6)
+
+        session.modified = False
+        loaded.save(session)
+        self.assertFalse(session.modified)
+
+        loaded.finish()
+        loaded.save(session)
+        self.assertNotIn('quiz_1', session)
+
+    def test_size_limit(self):
+        with self.settings(QUIZ_SETTINGS={'ANON_MAX_QUESTIONS': 2}), \
+                self.assertLogs('quiz.anon', 'WARNING') as logs:
+            sitting = AnonSitting.start(1, [5, 6, 7])
+
+        self.assertEqual(sitting.order, [5, 6])
+        self.assertIn('Quiz 1 draws 3 questions', logs.output[0])
+
+    def test_quiz_over_size_limit(self):
+        with self.settings(QUIZ_SETTINGS={'ANON_MAX_QUESTIONS': 1}), \
+                self.assertLogs('quiz.anon', 'WARNING'):
+            response = self.client.get('/tq1/take/')
+
+        self.assertEqual(response.context['progress'], (0, 1))
+
+    def test_quiz_take_keeps_one_key_per_quiz(self):
+        response = self.client.get('/tq1/take/')
+        self.assertEqual(response.context['progress'], (0, 2))
+        self.assertEqual(self.client.session['quiz_1']['c'], 0)
+
+        first = response.context['question']
+        answer = '123' if first.id == 1 else 'False'
+        response = self.client.post('/tq1/take/', {'answers': answer})
+        self.assertEqual(response.context['progress'], (1, 2))
+
+        record = self.client.session['quiz_1']
+        self.assertEqual((record['c'], record['s'], record['x']), (1, 0, 1))
+        self.assertEqual(self.client.session['quiz_session_score'], [0, 1])
+
+        second = response.context['question']
+        answer = '123' if second.id == 1 else 'True'
+        response = self.client.post('/tq1/take/', {'answers': answer})
+
+        self.assertNotIn('quiz_1', self.client.session)
+        self.assertEqual(response.context['max_score'], 2)
+        self.assertEqual(response.context['possible'], 2)
+
+
+class TestAsyncViews(TestCase):
+    def setUp(self):
+        self.factory = AsyncRequestFactory()
+        self.session = import_module(settings.SESSION_ENGINE).SessionStore()
+        self.user = User.objects.create_user(username='jacob',
+                                             password='top_secret')
+
+        self.quiz1 = Quiz.objects.create(id=1,
+                                         title='test quiz 1',
+                                         description='d1',
+                                         url='tq1',
+                                         exam_paper=True)
+        self.quiz2 = Quiz.objects.create(id=2,
+                                         title='test quiz 2',
+                                         description='d2',
+                                         url='tq2',
+                                         draft=True)
+
+        self.question1 = MCQuestion.objects.create(id=1,
+                                                   content='squawk',
+                                                   quiz=self.quiz1)
+        self.answer1 = Answer.objects.create(id=123,
+                                             question=self.question1,
+                                             content='bing',
+                                             correct=True)
+        self.answer2 = Answer.objects.create(id=456,
+                                             question=self.question1,
+                                             content='bong',
+                                             correct=False)
+
+    def request(self, method, path, user=None, data=None):
+        user = user or AnonymousUser()
+        request = getattr(self.factory, method)(path, data or {})
+        request.session = self.session
+
+        async def auser():
+            return user
+        request.auser = auser
+        request.user = user
+        return request
+
+    async def test_list_view(self):
+        request = self.request('get', '/')
+        response = await AsyncQuizListView.as_view()(request)
+
+        self.assertEqual([quiz.url for quiz
+                          in response.context_data['quiz_list']], ['tq1'])
+
+    async def test_conditional_get(self):
+        for view, path, kwargs in ((AsyncQuizListView, '/', {}),
+                                   (AsyncQuizDetailView, '/tq1/',
+                                    {'slug': 'tq1'})):
+            first = await view.as_view()(self.request('get', path), **kwargs)
+            request = self.request('get', path)
+            request.META['HTTP_IF_NONE_MATCH'] = first['ETag']
+            second = await view.as_view()(request, **kwargs)
+            self.assertEqual(second.status_code, 304)
+
+    async def test_detail_view(self):
+        request = self.request('get', '/tq1/')
+        response = await AsyncQuizDetailView.as_view()(request, slug='tq1')
+        self.assertEqual(response.context_data['quiz'], self.quiz1)
+
+        request = self.request('get', '/tq2/')
+        with self.assertRaises(PermissionDenied):
+            await AsyncQuizDetailView.as_view()(request, slug='tq2')
+
+        request = self.request('get', '/tq3/')
+        with self.assertRaises(Http404):
+            await AsyncQuizDetailView.as_view()(request, slug='tq3')
+
+    async def test_take_anon(self):
+        view = AsyncQuizTake.as_view()
+
+        response = await view(self.request('get', '/tq1/take/'),
+                              quiz_name='tq1')
+        self.assertEqual(response.context_data['question'], self.question1)
+        self.assertEqual(response.context_data['progress'], (0, 1))
+        self.assertEqual(self.session['quiz_1']['c'], 0)
+
+        response = await view(self.request('post', '/tq1/take/',
+                                           data={'answers': '123'}),
+                              quiz_name='tq1')
+        self.assertContains(response, 'session score is 1 out of a possible 1')
+        self.assertNotIn('quiz_1', self.session)
+        self.assertEqual(self.session['quiz_session_score'], [1, 1])
+
+    async def test_take_user(self):
+        view = AsyncQuizTake.as_view()
+
+        response = await view(self.request('get', '/tq1/take/', self.user),
+                              quiz_name='tq1')
+        self.assertEqual(response.context_data['question'], self.question1)
+
+        response = await view(self.request('post', '/tq1/take/', self.user,
+                                           data={'answers': '456'}),
+                              quiz_name='tq1')
+        self.assertEqual(response.status_code, 200)
+
+        sitting = await Sitting.objects.aget(user=self.user)
+        self.assertTrue(sitting.complete)
+        self.assertEqual(sitting.get_incorrect_questions, [1])
+        self.assertEqual(sitting.user_answers, '{"1": "456"}')
+
+    async def test_question_not_in_snapshot(self):
+        # E.g. moved to another quiz during the sitting.
+        question = await MCQuestion.objects.acreate(id=5, content='moved',
+                                                    quiz=self.quiz2)
+        await Answer.objects.acreate(id=789, question=question,
+                                     content='bang', correct=True)
+
+        question = await self.quiz1.aget_question(5)
+        self.assertEqual([answer.content for answer in question.get_answers()],
+                         ['bang'])
+
+    async def test_take_single_attempt(self):
+        self.quiz1.single_attempt = True
+        await self.quiz1.asave()
+
+        response = await AsyncQuizTake.as_view()(
+            self.request('get', '/tq1/take/'), quiz_name='tq1')
+        self.assertEqual(response.template_name, 'single_complete.html')
+
+
+class TestResultPageQueries(TestCase):
+    """
+    The result and marking pages load the answers of all their questions
+    up front, so their query count does not grow with the quiz.
+    """
+    def setUp(self):
+        self.student = User.objects.create_user(username='luke',
+                                                password='top_secret')
+        self.teacher = User.objects.create_user(username='yoda',
+                                                password='use_d@_force')
+        self.teacher.user_permissions.add(
+            Permission.objects.get(codename='view_sittings'))
+        self.category = Category.objects.new_category(category='elderberries')
+
+    def make_sitting(self, url, size):
+        quiz = Quiz.objects.create(title=url, url=url, exam_paper=True,
+                                   answers_at_end=True,
+                                   category=self.category)
+        for i in range(size):
+            question = MCQuestion.objects.create(content='q%d' % i,
+                                                 quiz=quiz)
+            Answer.objects.create(question=question, content='right',
+                                  correct=True)
+            Answer.objects.create(question=question, content='wrong',
+                                  correct=False)
+
+        sitting = Sitting.objects.new_sitting(self.student, quiz)
+        for question in sitting.get_questions()[:-1]:
+            sitting.add_user_answer(question, question.answer_set.first().id)
+            sitting.remove_first_question()
+        return sitting
+
+    def answer_last_question(self, sitting):
+        answer = sitting.get_first_question().answer_set.first()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/%s/take/' % sitting.quiz.url,
+                                        {'answers': answer.id})
+        self.assertEqual(len(response.context['questions']),
+                         sitting.quiz.question_set.count())
+        return len(queries)
+
+    def view_marking(self, sitting):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/marking/%d/' % sitting.id)
+        self.assertContains(response, 'q1')
+        return len(queries)
+
+    def test_result_page(self):
+        small = self.make_sitting('small', 2)
+        large = self.make_sitting('large', 12)
+        self.client.login(username='luke', password='top_secret')
+
+        self.assertEqual(self.answer_last_question(small),
+                         self.answer_last_question(large))
+
+    def test_marking_page(self):
+        small = self.make_sitting('small', 2)
+        large = self.make_sitting('large', 12)
+        Sitting.objects.filter(user=self.student).update(complete=True)
+        # A question the student never reached is shown without an answer.
+        large.user_answers = '{}'
+        large.save()
+        self.client.login(username='yoda', password='use_d@_force')
+
+        self.assertEqual(self.view_marking(small), self.view_marking(large))
+
+
 class TestQuestionViewsUser(TestCase):
     urls = 'quiz.urls'
 
@@ -817,7 +2944,8 @@ class TestQuestionViewsUser(TestCase):
         self.assertEqual(sitting.complete, False)
         self.assertEqual(progress_count, 1)
         self.assertIn(self.c1.category, progress)
-        self.assertEqual(sitting.question_list, '2,')
+        self.assertEqual(sitting.question_list, '1,2,')
+        self.assertEqual(sitting.cursor, 1)
         self.assertIn('123', response.context['previous']['previous_answer'])
         self.assertEqual(response.context['question'].content,
                          self.question2.content)
@@ -923,7 +3051,7 @@ class TestQuestionViewsUser(TestCase):
         response = self.client.post('/tq1/take/',
                                     {'answers': '123',
                                      'question_id':
-                                     self.client.session['1_q_list'][0]})
+                                     self.client.session['quiz_1']['o'][0]})
         self.assertEqual(response.context['progress'], (1, 2))
 
 
@@ -991,3 +3119,261 @@ class TestTemplateTags(TestCase):
                            'incorrect_questions': [1]})
 
         self.assertIn('bing', template.render(context))
+
+
+class TestQueryBudgets(TestCase):
+    """
+    Number of queries of each view against small and large fixtures. The
+    budgets are upper bounds that must hold whatever the size: a view
+    whose queries grow with the number of questions or sittings fails,
+    with a table of the counts.
+    """
+    QUESTION_SIZES = (10, 100, 500)
+    SITTING_SIZES = (1, 1000)
+
+    BUDGETS = {
+        # The draw reads the question ids, then the first question page
+        # builds the snapshot.
+        'take_start_user': 11,
+        'take_answer_user': 14,
+        # Starting the sitting no longer builds the snapshot: the result
+        # page does.
+        'take_result_user': 28,
+        'take_start_anon': 11,
+        # The answer statistics are written in a transaction of their own.
+        'take_answer_anon': 12,
+        'take_result_anon': 22,
+        'marking_detail': 11,
+        'marking_list': 5,
+        'progress': 8,
+        # One more for the catalog stamp, one less once the quiz is cached,
+        # and two for the validators (quiz and leaderboard).
+        'quiz_detail': 10,
+        # Two for the validators (quiz and leaderboard).
+        'leaderboard': 8,
+        # The validators and the catalog stamp, then the list since the
+        # page is not cached.
+        'quiz_list': 3,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        records = [{'type': 'category', 'category': 'budget'}]
+        for size in cls.QUESTION_SIZES:
+            url = 'budget-%d' % size
+            records.append({'type': 'quiz', 'url': url, 'title': url,
+                            'description': url, 'category': 'budget',
+                            'exam_paper': True, 'answers_at_end': True,
+                            'pass_mark': 50})
+            for number in range(size):
+                record = {'type': 'question', 'quiz': url,
+                          'category': 'budget',
+                          'content': 'question %d' % number,
+                          'explanation': 'because'}
+                # The last question is multiple choice at every size, so
+                # that the result pages grade the same type.
+                kind = (size - 1 - number) % 3
+                if kind == 0:
+                    record.update(question_type='multichoice.mcquestion',
+                                  answer_order='random',
+                                  answers=[{'content': 'right',
+                                            'correct': True},
+                                           {'content': 'wrong',
+                                            'correct': False}])
+                elif kind == 1:
+                    record.update(question_type='true_false.tf_question',
+                                  correct=True)
+                else:
+                    record.update(question_type='essay.essay_question')
+                records.append(record)
+        BankImporter().load(json.dumps(record) for record in records)
+
+        cls.quizzes = {quiz.question_count: quiz for quiz
+                       in Quiz.objects.filter(url__startswith='budget')}
+
+        # A valid answer to every question.
+        cls.answers = dict(
+            Question.objects.filter(question_type='true_false.tf_question')
+                            .values_list('id', Value('True')))
+        cls.answers.update(
+            Question.objects.filter(question_type='essay.essay_question')
+                            .values_list('id', Value('essay')))
+        cls.answers.update(Answer.objects.filter(correct=True)
+                           .values_list('question_id', 'id'))
+
+        cls.student = User.objects.create_user(username='student',
+                                               password='top_secret')
+        cls.marker = User.objects.create_user(username='marker',
+                                              password='top_secret')
+        cls.marker.user_permissions.add(
+            Permission.objects.get(codename='view_sittings'))
+        # Counters that the first answer of a user would create.
+        CategoryScore.objects.create(user=cls.student,
+                                     category=cls.quizzes[10].category)
+
+        # Completed sittings: one for "once", a thousand for "marathon".
+        small = cls.quizzes[10]
+        question_list = ','.join(map(str, small.question_set.order_by('id')
+                                     .values_list('id', flat=True))) + ','
+        for username, count in zip(('once', 'marathon'), cls.SITTING_SIZES):
+            user = User.objects.create_user(username=username,
+                                            password='top_secret')
+            Sitting.objects.bulk_create(
+                Sitting(user=user, quiz=small, question_list=question_list,
+                        cursor=10, current_score=5, complete=True,
+                        end=now(), user_answers='{}')
+                for _ in range(count))
+
+        # Leaderboards: "once" alone on the small quiz, with a thousand
+        # others on the next one.
+        once = User.objects.get(username='once')
+        others = User.objects.bulk_create(
+            User(username='other%d' % number, password='!')
+            for number in range(cls.SITTING_SIZES[1] - 1))
+        LeaderboardEntry.objects.bulk_create(
+            LeaderboardEntry(quiz=quiz, user=user, score=number % 10,
+                             percent=number % 100, achieved=now())
+            for quiz, users in ((small, [once]),
+                                (cls.quizzes[100], [once] + others))
+            for number, user in enumerate(users))
+
+    def setUp(self):
+        snapshot.clear()
+
+    def count_queries(self, method, path, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(path, data or {})
+        self.assertLess(response.status_code, 400)
+        return len(queries)
+
+    def assertBudget(self, name, counts):
+        """
+        Fails when a count is over the budget of the view, or when the
+        counts differ between fixture sizes.
+        """
+        budget = self.BUDGETS[name]
+        if all(count <= budget for count in counts.values()) and \
+           len(set(counts.values())) == 1:
+            return
+
+        lines = ['Query budget of %s exceeded or not constant:' % name,
+                 '%10s %8s %8s %6s' % ('fixture', 'budget', 'queries',
+                                       'diff')]
+        for size, count in counts.items():
+            lines.append('%10s %8d %8d %+6d%s' % (
+                size, budget, count, count - budget,
+                '  <--' if count > budget else ''))
+        self.fail('\n'.join(lines))
+
+    def user_sitting(self, quiz, cursor):
+        Sitting.objects.filter(user=self.student, complete=False).delete()
+        sitting = Sitting.objects.new_sitting(self.student, quiz)
+        Sitting.objects.filter(pk=sitting.pk).update(cursor=cursor)
+        sitting.cursor = cursor
+        return sitting
+
+    def anon_sitting(self, quiz, cursor):
+        # Cut to the limit, as AnonSitting.start() does.
+        order = list(quiz.question_set.order_by('id')
+                     .values_list('id', flat=True))[:max_questions()]
+        sitting = AnonSitting(quiz.id, order, cursor=cursor, seed=1)
+        session = self.client.session
+        sitting.save(session)
+        session.save()
+        return sitting
+
+    def take(self, name, login, prepare):
+        if login:
+            self.client.login(username='student', password='top_secret')
+        counts = {}
+        for size, quiz in sorted(self.quizzes.items()):
+            sitting = prepare(quiz)
+            if sitting is None:
+                counts[size] = self.count_queries(
+                    'get', '/%s/take/' % quiz.url)
+            else:
+                counts[size] = self.count_queries(
+                    'post', '/%s/take/' % quiz.url,
+                    {'answers': self.answers[sitting.next_question_id]})
+        self.assertBudget(name, counts)
+
+    def test_take_user(self):
+        self.take('take_start_user', True, lambda quiz: None)
+        self.take('take_answer_user', True,
+                  lambda quiz: self.user_sitting(quiz, first_mc(quiz)))
+
+    def test_take_result_user(self):
+        self.take('take_result_user', True,
+                  lambda quiz: self.user_sitting(
+                      quiz, quiz.question_count - 1))
+
+    def test_take_anon(self):
+        self.take('take_start_anon', False, lambda quiz: None)
+        self.take('take_answer_anon', False,
+                  lambda quiz: self.anon_sitting(quiz, first_mc(quiz)))
+
+    def test_take_result_anon(self):
+        self.take('take_result_anon', False,
+                  lambda quiz: self.anon_sitting(
+                      quiz, min(quiz.question_count, max_questions()) - 1))
+
+    def test_marking_detail(self):
+        self.client.login(username='marker', password='top_secret')
+        counts = {}
+        for size, quiz in sorted(self.quizzes.items()):
+            sitting = self.user_sitting(quiz, size)
+            sitting.user_answers = json.dumps(
+                {str(question_id): self.answers[question_id]
+                 for question_id in sitting._question_ids()})
+            sitting.incorrect_questions = '%d,' % sitting._question_ids()[0]
+            sitting.complete = True
+            sitting.save()
+            counts[size] = self.count_queries('get',
+                                              '/marking/%d/' % sitting.pk)
+        self.assertBudget('marking_detail', counts)
+
+    def test_marking_list(self):
+        self.client.login(username='marker', password='top_secret')
+        counts = {size: self.count_queries('get', '/marking/',
+                                           {'user_filter': username})
+                  for size, username in zip(self.SITTING_SIZES,
+                                            ('once', 'marathon'))}
+        self.assertBudget('marking_list', counts)
+
+    def test_progress(self):
+        counts = {}
+        for size, username in zip(self.SITTING_SIZES, ('once', 'marathon')):
+            self.client.login(username=username, password='top_secret')
+            counts[size] = self.count_queries('get', '/progress/')
+        self.assertBudget('progress', counts)
+
+    def test_quiz_detail_and_leaderboard(self):
+        self.client.login(username='once', password='top_secret')
+        quizzes = zip(self.SITTING_SIZES,
+                      (self.quizzes[10], self.quizzes[100]))
+        detail, leaderboard = {}, {}
+        for size, quiz in quizzes:
+            detail[size] = self.count_queries('get', '/%s/' % quiz.url)
+            leaderboard[size] = self.count_queries(
+                'get', '/%s/leaderboard/' % quiz.url, {'top': 100})
+        self.assertBudget('quiz_detail', detail)
+        self.assertBudget('leaderboard', leaderboard)
+
+    def test_quiz_list(self):
+        counts = {}
+        for size in self.QUESTION_SIZES:
+            Quiz.objects.bulk_create(
+                Quiz(title='extra', url='extra-%d-%d' % (size, number),
+                     description='extra', category=self.quizzes[10].category)
+                for number in range(size - Quiz.objects.count()))
+            # bulk_create() sends no signals.
+            CatalogVersion.objects.bump()
+            counts[size] = self.count_queries('get', '/')
+        self.assertBudget('quiz_list', counts)
+
+
+def first_mc(quiz):
+    """
+    Position of the first multiple choice question of a budget quiz.
+    """
+    return (quiz.question_count - 1) % 3
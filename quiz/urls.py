@@ -1,11 +1,22 @@
+from django.conf import settings
+
 try:
     from django.conf.urls import url
 except ImportError:
     from django.urls import re_path as url
 
+from . import figures
 from .views import QuizListView, CategoriesListView, \
     ViewQuizListByCategory, QuizUserProgressView, QuizMarkingList, \
-    QuizMarkingDetail, QuizDetailView, QuizTake
+    QuizMarkingDetail, QuizDetailView, QuizLeaderboardView, QuizTake, \
+    MetricsView, FigureView
+from .async_views import AsyncQuizListView, AsyncQuizDetailView, \
+    AsyncQuizTake
+
+if getattr(settings, 'QUIZ_SETTINGS', {}).get('ASYNC_VIEWS', False):
+    QuizListView = AsyncQuizListView
+    QuizDetailView = AsyncQuizDetailView
+    QuizTake = AsyncQuizTake
 
 urlpatterns = [
 
@@ -33,11 +44,23 @@ urlpatterns = [
         view=QuizMarkingDetail.as_view(),
         name='quiz_marking_detail'),
 
+    url(r'^metrics/$',
+        view=MetricsView.as_view(),
+        name='quiz_metrics'),
+
+    url(r'^figures/(?P<name>%s)$' % figures.NAME_PATTERN,
+        view=FigureView.as_view(),
+        name='quiz_figure'),
+
     #  passes variable 'quiz_name' to quiz_take view
     url(r'^(?P<slug>[\w-]+)/$',
         view=QuizDetailView.as_view(),
         name='quiz_start_page'),
 
+    url(r'^(?P<slug>[\w-]+)/leaderboard/$',
+        view=QuizLeaderboardView.as_view(),
+        name='quiz_leaderboard'),
+
     url(r'^(?P<quiz_name>[\w-]+)/take/$',
         view=QuizTake.as_view(),
         name='quiz_question'),
@@ -1,13 +1,30 @@
-import random
+import hashlib
 
+from django.conf import settings
 from django.contrib.auth.decorators import login_required, permission_required
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, Sum
+from django.http import FileResponse, Http404, HttpResponse
 from django.shortcuts import get_object_or_404, render
+from django.utils.cache import get_conditional_response, \
+    patch_cache_control
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
 from django.utils.decorators import method_decorator
-from django.views.generic import DetailView, ListView, TemplateView, FormView
+from django.utils.translation import get_language
+from django.views.generic import DetailView, ListView, TemplateView, FormView, \
+    View
 
+from . import figures, metrics, sampling
+from .anon import AnonSitting
 from .forms import QuestionForm, EssayForm
-from .models import Quiz, Category, Progress, Sitting, Question
+from .locking import retry_on_lock
+from .models import Quiz, Category, CategoryScore, CatalogVersion, \
+    LeaderboardEntry, Progress, Sitting, Question
 from essay.models import Essay_Question
 
 
@@ -23,38 +40,257 @@ class SittingFilterTitleMixin(object):
         queryset = super(SittingFilterTitleMixin, self).get_queryset()
         quiz_filter = self.request.GET.get('quiz_filter')
         if quiz_filter:
-            queryset = queryset.filter(quiz__title__icontains=quiz_filter)
+            # The quiz table is small: the matching ids are looked up there
+            # and the sittings are then found through their quiz index.
+            queryset = queryset.filter(quiz__in=Quiz.objects.filter(
+                title__icontains=quiz_filter).values('pk'))
 
         return queryset
 
 
-class QuizListView(ListView):
+def catalog_cache_timeout():
+    return getattr(settings, 'QUIZ_SETTINGS', {})\
+        .get('CATALOG_CACHE_TIMEOUT', 3600)
+
+
+class CatalogPageCacheMixin(object):
+    """
+    Caches the whole page under the stamp of the catalog, the language
+    and the path, for catalog pages that look the same to every user
+    (drafts are listed to nobody). Any change to the catalog moves the
+    pages to new keys, and the old entries expire. The status and headers
+    of the page are cached with it.
+    """
+
+    def get(self, request, *args, **kwargs):
+        key = self.get_page_cache_key(CatalogVersion.objects.current())
+        page = cache.get(key)
+        if page is not None:
+            return cached_page_response(page)
+
+        response = super(CatalogPageCacheMixin, self)\
+            .get(request, *args, **kwargs)
+        self.store_page(key, response)
+        return response
+
+    def get_page_cache_key(self, stamp):
+        path = hashlib.md5(self.request.path.encode()).hexdigest()
+        return 'quiz.catalog_page.%s.%s.%s' % (stamp, get_language(), path)
+
+    def store_page(self, key, response):
+        def store(response):
+            if response.status_code == 200:
+                cache.set(key, (response.status_code, dict(response.items()),
+                                response.content),
+                          catalog_cache_timeout())
+
+        response.add_post_render_callback(store)
+
+
+def cached_page_response(page):
+    status, headers, content = page
+    return HttpResponse(content, status=status, headers=headers)
+
+
+class ConditionalGetMixin(object):
+    """
+    Answers 304 Not Modified when the page has not changed since the
+    client got it. The validators are worked out from the modification
+    stamps of the quizzes and categories shown, aggregated in one query
+    (two for a quiz page, with its leaderboard), before anything else is
+    loaded or rendered.
+
+    get_stamp_queryset() and get_stamp_aggregates() give that query. The
+    ETag is a digest of its result, the language and get_etag_parts();
+    Last-Modified is the latest of the dates in it.
+    """
+
+    def get(self, request, *args, **kwargs):
+        validators = self.get_validators(self.get_stamps(), request.user)
+        response = self.not_modified(validators)
+        if response is None:
+            response = self.get_page(request, *args, **kwargs)
+        return self.add_validators(response, validators)
+
+    def get_page(self, request, *args, **kwargs):
+        """
+        Returns the page itself, when it has to be sent.
+        """
+        return super(ConditionalGetMixin, self).get(request, *args, **kwargs)
+
+    def get_stamp_queryset(self):
+        raise NotImplementedError
+
+    def get_stamp_aggregates(self):
+        return {'updated': Max('updated'), 'count': Count('pk')}
+
+    def get_stamps(self):
+        return self.get_stamp_queryset()\
+            .aggregate(**self.get_stamp_aggregates())
+
+    async def aget_stamps(self):
+        return await self.get_stamp_queryset()\
+            .aaggregate(**self.get_stamp_aggregates())
+
+    def get_etag_parts(self, user):
+        """
+        Returns what else the page depends on, besides the stamps.
+        """
+        return ()
+
+    def get_validators(self, stamps, user):
+        """
+        Returns the ETag and the Last-Modified timestamp, or None when
+        there is nothing to validate (e.g. the page is a 404).
+        """
+        if stamps.get('updated') is None:
+            return None
+
+        parts = (sorted(stamps.items()), get_language(),
+                 self.get_etag_parts(user))
+        etag = '"%s"' % hashlib.sha1(repr(parts).encode()).hexdigest()
+        last_modified = max(value for value in stamps.values()
+                            if hasattr(value, 'timestamp'))
+        return etag, int(last_modified.timestamp())
+
+    def not_modified(self, validators):
+        if validators is None:
+            return None
+        etag, last_modified = validators
+        return get_conditional_response(self.request, etag=etag,
+                                        last_modified=last_modified)
+
+    def add_validators(self, response, validators):
+        if validators is not None and response.status_code in (200, 304):
+            etag, last_modified = validators
+            # Over those of a cached page, which may be older.
+            response.headers['ETag'] = etag
+            response.headers['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class QuizListView(ConditionalGetMixin, CatalogPageCacheMixin, ListView):
     model = Quiz
 
     def get_queryset(self):
         queryset = super(QuizListView, self).get_queryset()
-        return queryset.filter(draft=False)
+        return queryset.filter(draft=False).select_related('category')
+
+    def get_stamp_queryset(self):
+        return Quiz.objects.filter(draft=False)
 
+    def get_stamp_aggregates(self):
+        # The list shows the name of the category of each quiz.
+        return dict(super(QuizListView, self).get_stamp_aggregates(),
+                    category=Max('category__updated'))
 
-class QuizDetailView(DetailView):
+
+def leaderboard_size():
+    return getattr(settings, 'QUIZ_SETTINGS', {}).get('LEADERBOARD_SIZE', 10)
+
+
+class QuizDetailView(ConditionalGetMixin, DetailView):
+    """
+    The start page of a quiz. Drafts get no validators, so that every
+    request for one goes through the permission check.
+    """
     model = Quiz
     slug_field = 'url'
 
-    def get(self, request, *args, **kwargs):
+    def get_page(self, request, *args, **kwargs):
         self.object = self.get_object()
 
         if self.object.draft and not request.user.has_perm('quiz.change_quiz'):
             raise PermissionDenied
 
-        context = self.get_context_data(object=self.object)
+        # Called by the template, only if it has a cached fragment.
+        context = self.get_context_data(
+            object=self.object,
+            catalog_stamp=CatalogVersion.objects.current,
+            **self.get_leaderboard(request.user))
         return self.render_to_response(context)
 
+    def get_context_data(self, **kwargs):
+        context = super(QuizDetailView, self).get_context_data(**kwargs)
+        # For the cached fragment of the quiz, keyed on catalog_stamp.
+        context['catalog_cache_timeout'] = catalog_cache_timeout()
+        return context
+
+    def get_stamp_queryset(self):
+        return Quiz.objects.filter(url=self.kwargs[self.slug_url_kwarg],
+                                   draft=False)
+
+    def get_stamp_aggregates(self):
+        return {'updated': Max('updated'),
+                'category': Max('category__updated')}
+
+    def get_leaderboard_stamp_queryset(self):
+        # Not joined to the quiz: the leaderboard is read from the main
+        # database, the quiz may be read from the replica.
+        return LeaderboardEntry.objects.filter(
+            quiz__url=self.kwargs[self.slug_url_kwarg])
+
+    def get_leaderboard_stamp_aggregates(self):
+        return {'entries': Count('pk'), 'achieved': Max('achieved'),
+                'scores': Sum('score')}
+
+    def get_stamps(self):
+        stamps = super(QuizDetailView, self).get_stamps()
+        if stamps['updated'] is not None:
+            stamps.update(self.get_leaderboard_stamp_queryset().aggregate(
+                **self.get_leaderboard_stamp_aggregates()))
+        return stamps
+
+    async def aget_stamps(self):
+        stamps = await super(QuizDetailView, self).aget_stamps()
+        if stamps['updated'] is not None:
+            stamps.update(
+                await self.get_leaderboard_stamp_queryset().aaggregate(
+                    **self.get_leaderboard_stamp_aggregates()))
+        return stamps
+
+    def get_etag_parts(self, user):
+        # The page shows the user's own leaderboard entry.
+        return (user.pk, self.get_leaderboard_size())
+
+    def get_leaderboard_size(self):
+        return leaderboard_size()
+
+    def get_leaderboard(self, user):
+        return {
+            'leaderboard': LeaderboardEntry.objects.top(
+                self.object, self.get_leaderboard_size()),
+            'leaderboard_entry': LeaderboardEntry.objects.user_entry(
+                self.object, user),
+        }
+
+
+class QuizLeaderboardView(QuizDetailView):
+    """
+    The best scores of a quiz. ?top=N shows more of them, up to
+    max_size.
+    """
+    template_name = 'quiz/leaderboard.html'
+    max_size = 100
+
+    def get_leaderboard_size(self):
+        try:
+            size = int(self.request.GET.get('top', ''))
+        except ValueError:
+            return leaderboard_size()
+        return min(max(size, 1), self.max_size)
+
 
-class CategoriesListView(ListView):
+class CategoriesListView(ConditionalGetMixin, CatalogPageCacheMixin,
+                         ListView):
     model = Category
 
+    def get_stamp_queryset(self):
+        return Category.objects.all()
+
 
-class ViewQuizListByCategory(ListView):
+class ViewQuizListByCategory(ConditionalGetMixin, CatalogPageCacheMixin,
+                             ListView):
     model = Quiz
     template_name = 'view_quiz_category.html'
 
@@ -78,6 +314,17 @@ class ViewQuizListByCategory(ListView):
         queryset = super(ViewQuizListByCategory, self).get_queryset()
         return queryset.filter(category=self.category, draft=False)
 
+    def get_stamp_queryset(self):
+        return Quiz.objects.filter(category=self.category, draft=False)
+
+    def get_validators(self, stamps, user):
+        # A category without quizzes still has its own stamp.
+        stamps['category'] = self.category.updated
+        stamps['updated'] = max(filter(None, [stamps['updated'],
+                                              self.category.updated]))
+        return super(ViewQuizListByCategory, self)\
+            .get_validators(stamps, user)
+
 
 class QuizUserProgressView(TemplateView):
     template_name = 'progress.html'
@@ -89,39 +336,157 @@ class QuizUserProgressView(TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super(QuizUserProgressView, self).get_context_data(**kwargs)
-        progress, c = Progress.objects.get_or_create(user=self.request.user)
+        progress, c = retry_on_lock(Progress.objects.get_or_create,
+                                    user=self.request.user)
         context['cat_scores'] = progress.list_all_cat_scores
         context['exams'] = progress.show_exams()
         return context
 
 
+class MetricsView(View):
+    """
+    The request metrics of this process, for Prometheus. Staff only.
+    """
+
+    def get(self, request, *args, **kwargs):
+        if not request.user.is_staff:
+            raise PermissionDenied
+        return HttpResponse(metrics.registry.render(),
+                            content_type='text/plain; version=0.0.4; '
+                                         'charset=utf-8')
+
+
+class FigureView(View):
+    """
+    Serves the resized copies of the question figures. Their names change
+    with their content, so browsers and proxies may keep them for good.
+    """
+    max_age = 365 * 24 * 3600
+
+    def get(self, request, *args, **kwargs):
+        name = '%s/%s' % (figures.DIRECTORY, kwargs['name'])
+        try:
+            content = default_storage.open(name)
+        except FileNotFoundError:
+            raise Http404
+        response = FileResponse(content, content_type=figures.CONTENT_TYPES[
+            name.rsplit('.', 1)[1]])
+        patch_cache_control(response, public=True, max_age=self.max_age,
+                            immutable=True)
+        return response
+
+
 class QuizMarkingList(QuizMarkerMixin, SittingFilterTitleMixin, ListView):
+    """
+    Completed sittings, most recent first, a page at a time.
+
+    Pages are addressed by the (end, id) of the last sitting of the
+    previous page rather than by an offset, so every page is read
+    straight from the sitting_complete_end index. The sittings without an
+    end come last; the page on which they start is completed with a
+    second query for them.
+
+    A user filter looks the users up by a range on the username index
+    (so the prefix is case-sensitive), then their sittings by user.
+    """
     model = Sitting
+    context_object_name = 'sitting_list'
+    # The sittings without an end that follow object_list, if any.
+    no_end_queryset = None
 
     def get_queryset(self):
         queryset = super(QuizMarkingList, self).get_queryset()\
-                                               .filter(complete=True)
+                                               .filter(complete=True)\
+                                               .select_related('user', 'quiz')\
+                                               .order_by(F('end').desc(
+                                                   nulls_last=True), '-id')
 
         user_filter = self.request.GET.get('user_filter')
         if user_filter:
-            queryset = queryset.filter(user__username__icontains=user_filter)
+            # Unlike LIKE, a range can be read from the index.
+            queryset = queryset.filter(user__in=User.objects.filter(
+                username__gte=user_filter,
+                username__lt=user_filter + '\U0010ffff').values('pk'))
+
+        after = parse_marking_cursor(self.request.GET.get('after'))
+        if after is not None:
+            end, pk = after
+            if end is None:
+                queryset = queryset.filter(end__isnull=True, id__lt=pk)
+            else:
+                # Bounded on end so that the page starts with a seek in
+                # the index rather than a scan of the earlier pages.
+                self.no_end_queryset = queryset.filter(end__isnull=True)
+                queryset = queryset.filter(Q(end__lt=end) |
+                                           Q(end=end, id__lt=pk),
+                                           end__lte=end)
 
         return queryset
 
+    def get_context_data(self, **kwargs):
+        page_size = marking_page_size()
+        sittings = list(self.object_list[:page_size + 1])
+        if len(sittings) <= page_size and self.no_end_queryset is not None:
+            sittings.extend(
+                self.no_end_queryset[:page_size + 1 - len(sittings)])
+
+        context = super(QuizMarkingList, self).get_context_data(
+            object_list=sittings[:page_size], **kwargs)
+
+        if len(sittings) > page_size:
+            query = self.request.GET.copy()
+            query['after'] = marking_cursor(sittings[page_size - 1])
+            context['next_page_query'] = query.urlencode()
+        return context
+
+
+def marking_page_size():
+    quiz_settings = getattr(settings, 'QUIZ_SETTINGS', {})
+    return quiz_settings.get('MARKING_PAGE_SIZE', 50)
+
+
+def marking_cursor(sitting):
+    end = sitting.end.isoformat() if sitting.end is not None else ''
+    return '%s_%d' % (end, sitting.id)
+
+
+def parse_marking_cursor(cursor):
+    """
+    Returns the (end, id) encoded by marking_cursor(), or None if the
+    cursor is missing or malformed.
+    """
+    if not cursor:
+        return None
+
+    end, separator, pk = cursor.rpartition('_')
+    try:
+        pk = int(pk)
+        parsed_end = parse_datetime(end) if end else None
+    except ValueError:
+        return None
+    if not separator or (end and parsed_end is None):
+        return None
+    return parsed_end, pk
+
 
 class QuizMarkingDetail(QuizMarkerMixin, DetailView):
     model = Sitting
 
+    def get_queryset(self):
+        return super(QuizMarkingDetail, self).get_queryset()\
+                                             .select_related('quiz', 'user')
+
     def post(self, request, *args, **kwargs):
         sitting = self.get_object()
 
         q_to_toggle = request.POST.get('qid', None)
         if q_to_toggle:
-            q = Question.objects.get_subclass(id=int(q_to_toggle))
+            q = Question.objects.get_typed(id=int(q_to_toggle))
             if int(q_to_toggle) in sitting.get_incorrect_questions:
                 sitting.remove_incorrect_question(q)
             else:
                 sitting.add_incorrect_question(q)
+            LeaderboardEntry.objects.rebuild(sitting.quiz, sitting.user)
 
         return self.get(request)
 
@@ -129,6 +494,7 @@ class QuizMarkingDetail(QuizMarkerMixin, DetailView):
         context = super(QuizMarkingDetail, self).get_context_data(**kwargs)
         context['questions'] =\
             context['sitting'].get_questions(with_answers=True)
+        context['answer_seed'] = context['sitting'].answer_seed
         return context
 
 
@@ -157,16 +523,24 @@ class QuizTake(FormView):
         if self.sitting is False:
             return render(request, self.single_complete_template_name)
 
-        return super(QuizTake, self).dispatch(request, *args, **kwargs)
+        response = super(QuizTake, self).dispatch(request, *args, **kwargs)
+
+        if not self.logged_in_user:
+            self.sitting.save(request.session)
+
+        return response
 
     def get_form(self, *args, **kwargs):
         if self.logged_in_user:
             self.question = self.sitting.get_first_question()
-            self.progress = self.sitting.get_percent_correct
+            self.progress = self.sitting.progress()
         else:
             self.question = self.anon_next_question()
             self.progress = self.anon_sitting_progress()
 
+        return self.get_question_form()
+
+    def get_question_form(self):
         if self.question.__class__ is Essay_Question:
             form_class = EssayForm
         else:
@@ -177,22 +551,73 @@ class QuizTake(FormView):
     def get_form_kwargs(self):
         kwargs = super(QuizTake, self).get_form_kwargs()
 
-        return dict(kwargs, question=self.question)
+        return dict(kwargs, question=self.question,
+                    seed=self.sitting.answer_seed)
 
     def form_valid(self, form):
         if self.logged_in_user:
-            self.form_valid_user(form)
-            if self.sitting.get_first_question() is False:
-                return self.final_result_user()
+            response = self.record_user_answer(form)
         else:
-            self.form_valid_anon(form)
-            if not self.request.session[self.quiz.anon_q_list()]:
-                return self.final_result_anon()
+            response = self.record_anon_answer(form)
+
+        if response is not None:
+            return response
 
         self.request.POST = {}
 
         return super(QuizTake, self).get(self, self.request)
 
+    def record_user_answer(self, form):
+        """
+        Grades the answer of a signed in user. Returns the result page
+        once the last question has been answered, otherwise None.
+        """
+        sitting_id = self.sitting.pk
+
+        def reload_sitting():
+            # The sitting may have been deleted by the failed attempt.
+            self.sitting.pk = sitting_id
+            self.sitting.refresh_from_db()
+            self.sitting.quiz = self.quiz
+
+        results = retry_on_lock(self.save_user_answer, form,
+                                on_retry=reload_sitting)
+        if results is None:
+            return None
+
+        # Read once the transaction, and the write lock, are released.
+        if self.quiz.answers_at_end:
+            results['questions'] =\
+                self.sitting.get_questions(with_answers=True)
+            results['incorrect_questions'] =\
+                self.sitting.get_incorrect_questions
+        return render(self.request, self.result_template_name, results)
+
+    def save_user_answer(self, form):
+        """
+        Writes the answer of a signed in user. Returns the context of the
+        result page once the last question has been answered, but for the
+        questions it lists.
+        """
+        # All the sitting changes of this answer go out in one UPDATE, in
+        # a transaction that only writes.
+        with self.sitting.unit_of_work():
+            self.form_valid_user(form)
+            if self.sitting.next_question_id is None:
+                return self.final_result_user()
+
+    def record_anon_answer(self, form):
+        is_correct = self.form_valid_anon(form)
+        retry_on_lock(self.save_anon_attempt, form.cleaned_data['answers'],
+                      is_correct)
+        if self.sitting.is_complete:
+            return self.final_result_anon()
+
+    def save_anon_attempt(self, guess, is_correct):
+        # In one transaction, so that a locked write can be retried.
+        with transaction.atomic():
+            self.question.add_attempt(guess, is_correct)
+
     def get_context_data(self, **kwargs):
         context = super(QuizTake, self).get_context_data(**kwargs)
         context['question'] = self.question
@@ -204,22 +629,27 @@ class QuizTake(FormView):
         return context
 
     def form_valid_user(self, form):
-        progress, c = Progress.objects.get_or_create(user=self.request.user)
         guess = form.cleaned_data['answers']
         is_correct = self.question.check_if_correct(guess)
 
         if is_correct is True:
             self.sitting.add_to_score(1)
-            progress.update_score(self.question, 1, 1)
         else:
             self.sitting.add_incorrect_question(self.question)
-            progress.update_score(self.question, 0, 1)
+
+        if self.question.category_id is not None:
+            CategoryScore.objects.add_score(self.request.user.pk,
+                                            self.question.category_id,
+                                            1 if is_correct is True else 0, 1)
+
+        self.question.add_attempt(guess, is_correct, self.sitting)
 
         if self.quiz.answers_at_end is not True:
             self.previous = {'previous_answer': guess,
                              'previous_outcome': is_correct,
                              'previous_question': self.question,
-                             'answers': self.question.get_answers(),
+                             'answers': self.question.get_answers(
+                                 self.sitting.answer_seed),
                              'question_type': {self.question
                                                .__class__.__name__: True}}
         else:
@@ -236,101 +666,71 @@ class QuizTake(FormView):
             'percent': self.sitting.get_percent_correct,
             'sitting': self.sitting,
             'previous': self.previous,
+            'answer_seed': self.sitting.answer_seed,
         }
 
         self.sitting.mark_quiz_complete()
 
-        if self.quiz.answers_at_end:
-            results['questions'] =\
-                self.sitting.get_questions(with_answers=True)
-            results['incorrect_questions'] =\
-                self.sitting.get_incorrect_questions
-
         if self.quiz.exam_paper is False:
             self.sitting.delete()
 
-        return render(self.request, self.result_template_name, results)
+        return results
 
     def anon_load_sitting(self):
         if self.quiz.single_attempt is True:
             return False
 
-        if self.quiz.anon_q_list() in self.request.session:
-            return self.request.session[self.quiz.anon_q_list()]
-        else:
-            return self.new_anon_quiz_session()
+        sitting = AnonSitting.load(self.request.session, self.quiz.id)
+        if sitting is None:
+            sitting = self.new_anon_quiz_session()
+        return sitting
 
-    def new_anon_quiz_session(self):
+    def new_anon_quiz_session(self, question_ids=None):
         """
-        Sets the session variables when starting a quiz for the first time
-        as a non signed-in user
+        Starts a quiz for the first time as a non signed-in user. The
+        sitting is written to the session at the end of the request.
         """
         self.request.session.set_expiry(259200)  # expires after 3 days
-        questions = self.quiz.get_questions()
-        question_list = [question.id for question in questions]
+        seed = sampling.new_seed()
+        question_list = sampling.draw_for_quiz(self.quiz, seed, question_ids)
 
-        if self.quiz.random_order is True:
-            random.shuffle(question_list)
-
-        if self.quiz.max_questions and (self.quiz.max_questions
-                                        < len(question_list)):
-            question_list = question_list[:self.quiz.max_questions]
-
-        # session score for anon users
-        self.request.session[self.quiz.anon_score_id()] = 0
-
-        # session list of questions
-        self.request.session[self.quiz.anon_q_list()] = question_list
-
-        # session list of question order and incorrect questions
-        self.request.session[self.quiz.anon_q_data()] = dict(
-            incorrect_questions=[],
-            order=question_list,
-        )
-
-        return self.request.session[self.quiz.anon_q_list()]
+        return AnonSitting.start(self.quiz.id, question_list, seed=seed)
 
     def anon_next_question(self):
-        next_question_id = self.request.session[self.quiz.anon_q_list()][0]
-        return Question.objects.get_subclass(id=next_question_id)
+        return self.quiz.get_question(self.sitting.next_question_id)
 
     def anon_sitting_progress(self):
-        total = len(self.request.session[self.quiz.anon_q_data()]['order'])
-        answered = total - len(self.request.session[self.quiz.anon_q_list()])
-        return (answered, total)
+        return self.sitting.progress()
 
     def form_valid_anon(self, form):
         guess = form.cleaned_data['answers']
         is_correct = self.question.check_if_correct(guess)
 
         if is_correct:
-            self.request.session[self.quiz.anon_score_id()] += 1
             anon_session_score(self.request.session, 1, 1)
         else:
             anon_session_score(self.request.session, 0, 1)
-            self.request\
-                .session[self.quiz.anon_q_data()]['incorrect_questions']\
-                .append(self.question.id)
 
         self.previous = {}
         if self.quiz.answers_at_end is not True:
             self.previous = {'previous_answer': guess,
                              'previous_outcome': is_correct,
                              'previous_question': self.question,
-                             'answers': self.question.get_answers(),
+                             'answers': self.question.get_answers(
+                                 self.sitting.answer_seed),
                              'question_type': {self.question
                                                .__class__.__name__: True}}
 
-        self.request.session[self.quiz.anon_q_list()] =\
-            self.request.session[self.quiz.anon_q_list()][1:]
+        self.sitting.record_answer(is_correct)
+        return is_correct
 
     def final_result_anon(self):
-        score = self.request.session[self.quiz.anon_score_id()]
-        q_order = self.request.session[self.quiz.anon_q_data()]['order']
+        score = self.sitting.score
+        q_order = self.sitting.order
         max_score = len(q_order)
         percent = int(round((float(score) / max_score) * 100))
         session, session_possible = anon_session_score(self.request.session)
-        if score is 0:
+        if score == 0:
             score = "0"
 
         results = {
@@ -338,25 +738,21 @@ class QuizTake(FormView):
             'max_score': max_score,
             'percent': percent,
             'session': session,
-            'possible': session_possible
+            'possible': session_possible,
+            'answer_seed': self.sitting.answer_seed,
         }
 
-        del self.request.session[self.quiz.anon_q_list()]
-
         if self.quiz.answers_at_end:
-            results['questions'] = sorted(
-                self.quiz.question_set.filter(id__in=q_order)
-                                      .select_subclasses(),
-                key=lambda q: q_order.index(q.id))
+            results['questions'] = \
+                self.quiz.question_set.in_order(q_order)
 
-            results['incorrect_questions'] = (
-                self.request
-                    .session[self.quiz.anon_q_data()]['incorrect_questions'])
+            results['incorrect_questions'] = \
+                self.sitting.incorrect_questions
 
         else:
             results['previous'] = self.previous
 
-        del self.request.session[self.quiz.anon_q_data()]
+        self.sitting.finish()
 
         return render(self.request, 'result.html', results)
 
@@ -375,11 +771,11 @@ def anon_session_score(session, to_add=0, possible=0):
 
     Left this as an individual function for unit testing
     """
-    if "session_score" not in session:
-        session["session_score"], session["session_score_possible"] = 0, 0
+    score, score_possible = session.get("quiz_session_score", (0, 0))
 
     if possible > 0:
-        session["session_score"] += to_add
-        session["session_score_possible"] += possible
+        score += to_add
+        score_possible += possible
+        session["quiz_session_score"] = [score, score_possible]
 
-    return session["session_score"], session["session_score_possible"]
+    return score, score_possible